@@ -0,0 +1,424 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import random
+import re
+import socket
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from time import monotonic
+from time import sleep
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+
+class FaultProfile(object):
+    """Latency (seconds), failure rate (HTTP 500) and throttling rate (HTTP 429 with Retry-After) of a fake server."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+
+    def draw(self):
+        with self.__lock:
+            value = self.__random.random()
+        if value < self.throttle_rate:
+            return 429
+        if value < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+
+class _FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, faults=None):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.faults = faults if faults is not None else FaultProfile()
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    def count(self, method):
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def get_requests(self) -> dict:
+        with self.lock:
+            return dict(self.requests)
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+
+    def get_url(self):
+        return "http://127.0.0.1:{0}".format(self.server_address[1])
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name=self.__class__.__name__, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately - with Nagle, every response would wait for the delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, body, content_type="application/json", headers=()):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _handle(self, method):
+        self.server.count(method)
+        body = self._read_body()
+        faults = self.server.faults
+        if faults.latency:
+            sleep(faults.latency)
+        fault = faults.draw()
+        if fault == 429:
+            return self._send(429, {"success": False, "errors": [{"code": 10000, "message": "Rate limited"}]},
+                              headers=[("Retry-After", str(faults.retry_after))])
+        if fault == 500:
+            return self._send(500, {"success": False, "errors": [{"code": 10001, "message": "Internal error"}]})
+        return self.handle_request(method, body)
+
+    def handle_request(self, method, body):
+        raise NotImplementedError
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class _CloudFlareHandler(_FakeHandler):
+    RECORD_URL = re.compile(r"^zones/([^/]+)/dns_records/([^/]+)$")
+    RECORDS_URL = re.compile(r"^zones/([^/]+)/dns_records$")
+    BATCH_URL = re.compile(r"^zones/([^/]+)/dns_records/batch$")
+
+    def _page(self, items, query):
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", ["20"])[0])
+        total_pages = max(1, -(-len(items) // per_page))
+        return {"success": True,
+                "errors": [],
+                "result": items[(page - 1) * per_page:page * per_page],
+                "result_info": {"page": page, "per_page": per_page, "total_pages": total_pages,
+                                "count": len(items[(page - 1) * per_page:page * per_page]), "total_count": len(items)}}
+
+    def _not_found(self, code=7003, message="Could not route to the requested path"):
+        return self._send(404, {"success": False, "errors": [{"code": code, "message": message}]})
+
+    def handle_request(self, method, body):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        path = url.path[len(self.server.prefix):].strip("/")
+        api = self.server.api
+        if self.headers.get("X-Auth-Key"):
+            # the global API key reaches every zone
+            api.add_credential(path, "X-Auth-Key " + self.headers["X-Auth-Key"])
+            allowed = None
+        else:
+            api.add_credential(path, self.headers.get("Authorization", ""))
+            allowed = api.get_token_zones(self.headers.get("Authorization", "")[len("Bearer "):])
+        if path == "zones" and method == "GET":
+            zones = [zone for zone in api.get_zones() if ("name" not in query or zone["name"] == query["name"][0]) and
+                     (allowed is None or zone["id"] in allowed)]
+            return self._send(200, self._page(zones, query))
+        if allowed is not None and path.split("/")[1:2] and path.split("/")[1] not in allowed:
+            return self._send(403, {"success": False,
+                                    "errors": [{"code": 9109, "message": "Unauthorized to access requested resource"}]})
+        match = self.RECORDS_URL.match(path)
+        if match and method == "GET":
+            records = api.get_records(match.group(1))
+            if records is None:
+                return self._not_found()
+            records = [record for record in records
+                       if all(record.get(key) == query[key][0] for key in ("type", "name") if key in query)]
+            return self._send(200, self._page(records, query))
+        match = self.BATCH_URL.match(path)
+        if match and method == "POST":
+            patches = (body or {}).get("patches") or []
+            if api.get_records(match.group(1)) is None:
+                return self._not_found()
+            if any(api.get_record(match.group(1), patch.get("id")) is None for patch in patches):
+                return self._not_found(81044, "Record does not exist.")
+            result = api.update_records(match.group(1), patches)
+            return self._send(200, {"success": True, "errors": [], "result": {"patches": result}})
+        match = self.RECORD_URL.match(path)
+        if match:
+            record = api.get_record(match.group(1), match.group(2))
+            if record is None:
+                return self._not_found(81044, "Record does not exist.")
+            if method in ("PUT", "PATCH"):
+                record = api.update_record(match.group(1), match.group(2), body)
+            return self._send(200, {"success": True, "errors": [], "result": record})
+        return self._not_found()
+
+
+class FakeCloudFlare(object):
+    """
+    In-memory stand-in for the CloudFlare v4 API: zones, paginated DNS records listings, single record reads and
+    updates and batched patches. Point the updater at it with the "CLOUDFLARE_API_URL" environment variable. Once an
+    API token is added, every request needs a token (or the global API key) and only reaches the zones of its token.
+    """
+
+    def __init__(self, faults=None):
+        self.__lock = threading.Lock()
+        self.__zones = {}
+        self.__records = {}
+        self.__tokens = {}
+        self.__credentials = []
+        self.__server = _FakeServer(_CloudFlareHandler, faults)
+        self.__server.api = self
+        self.__server.prefix = "/client/v4"
+
+    def add_zone(self, domain):
+        with self.__lock:
+            zone = "zone{0:05d}".format(len(self.__zones))
+            self.__zones[zone] = {"id": zone, "name": domain, "status": "active"}
+            self.__records[zone] = {}
+            return zone
+
+    def add_record(self, zone, name, content, record_type="A", ttl=1, proxied=False):
+        with self.__lock:
+            identifier = "{0}-{1:06d}".format(zone, len(self.__records[zone]))
+            self.__records[zone][identifier] = {"id": identifier, "zone_id": zone, "name": name, "type": record_type,
+                                                "content": content, "ttl": ttl, "proxied": proxied}
+            return identifier
+
+    def add_token(self, token, zones):
+        with self.__lock:
+            self.__tokens[token] = set(zones)
+
+    def add_credential(self, path, credential):
+        with self.__lock:
+            self.__credentials.append((path, credential))
+
+    def get_credentials(self) -> list:
+        """The (path, "Authorization" header or global API key) of every request."""
+        with self.__lock:
+            return list(self.__credentials)
+
+    def get_token_zones(self, token):
+        with self.__lock:
+            if not self.__tokens:
+                return None
+            return self.__tokens.get(token, set())
+
+    def populate(self, records, content, records_per_zone=100):
+        names = []
+        zone = domain = None
+        for index in range(records):
+            if index % records_per_zone == 0:
+                domain = "zone{0}.example".format(index // records_per_zone)
+                zone = self.add_zone(domain)
+            name = "host{0}.{1}".format(index, domain)
+            self.add_record(zone, name, content)
+            names.append((domain, name))
+        return names
+
+    def reset(self):
+        with self.__lock:
+            self.__zones = {}
+            self.__records = {}
+            self.__tokens = {}
+            self.__credentials = []
+        self.__server.reset()
+
+    def get_zones(self) -> list:
+        with self.__lock:
+            return list(self.__zones.values())
+
+    def get_records(self, zone):
+        with self.__lock:
+            records = self.__records.get(zone)
+            return list(records.values()) if records is not None else None
+
+    def get_record(self, zone, identifier):
+        with self.__lock:
+            return self.__records.get(zone, {}).get(identifier)
+
+    def update_record(self, zone, identifier, data):
+        with self.__lock:
+            record = self.__records[zone][identifier]
+            record.update({key: value for key, value in (data or {}).items() if key != "id"})
+            return dict(record)
+
+    def update_records(self, zone, patches):
+        with self.__lock:
+            result = []
+            for patch in patches:
+                record = self.__records[zone][patch["id"]]
+                record.update({key: value for key, value in patch.items() if key != "id"})
+                result.append(dict(record))
+            return result
+
+    def set_faults(self, faults):
+        self.__server.faults = faults if faults is not None else FaultProfile()
+
+    def get_requests(self) -> dict:
+        return self.__server.get_requests()
+
+    def get_url(self):
+        return self.__server.get_url() + self.__server.prefix
+
+    def start(self):
+        self.__server.start()
+        return self
+
+    def stop(self):
+        self.__server.stop()
+
+
+class _IPEchoHandler(_FakeHandler):
+    def handle_request(self, method, body):
+        return self._send(200, self.server.address.encode("ascii"), content_type="text/plain")
+
+
+class FakeIPEcho(object):
+    """Public IP echo service (like ipify or ident.me) that answers with a configurable address."""
+
+    def __init__(self, address, faults=None):
+        self.__server = _FakeServer(_IPEchoHandler, faults)
+        self.__server.address = address
+
+    def set_address(self, address):
+        self.__server.address = address
+
+    def get_requests(self) -> dict:
+        return self.__server.get_requests()
+
+    def get_url(self):
+        return self.__server.get_url()
+
+    def start(self):
+        self.__server.start()
+        return self
+
+    def stop(self):
+        self.__server.stop()
+
+
+class FakeDNS(object):
+    """
+    Name server answering A and AAAA queries over UDP with the records of a FakeCloudFlare. A changed record is
+    answered with its previous content until "delay" seconds after the change is first seen, like a slow propagation.
+    Point the updater at it with "--dns_server 127.0.0.1:<port>".
+    """
+
+    def __init__(self, api, delay=0.0):
+        self.__api = api
+        self.__delay = delay
+        self.__published = {}
+        self.__queries = 0
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__socket.bind(("127.0.0.1", 0))
+        self.__thread = threading.Thread(target=self._serve, daemon=True)
+
+    def _find(self, name, record_type):
+        for zone in self.__api.get_zones():
+            for record in self.__api.get_records(zone["id"]) or []:
+                if record["name"] == name and record["type"] == record_type:
+                    return record["content"]
+        return None
+
+    def _resolve(self, name, record_type):
+        content = self._find(name, record_type)
+        published, pending, since = self.__published.get((name, record_type), (content, content, monotonic()))
+        if content != pending:
+            pending, since = content, monotonic()
+        if pending != published and monotonic() - since >= self.__delay:
+            published = pending
+        self.__published[(name, record_type)] = (published, pending, since)
+        return published
+
+    def _answer(self, message):
+        identifier, _, _ = struct.unpack_from("!HHH", message)
+        labels, offset = [], 12
+        while message[offset]:
+            labels.append(message[offset + 1:offset + 1 + message[offset]].decode("ascii"))
+            offset += 1 + message[offset]
+        query_type = struct.unpack_from("!H", message, offset + 1)[0]
+        question = message[12:offset + 5]
+        record_type = {1: "A", 28: "AAAA"}.get(query_type)
+        content = self._resolve(".".join(labels), record_type) if record_type else None
+        if content is None:
+            return struct.pack("!HHHHHH", identifier, 0x8403, 1, 0, 0, 0) + question
+        family = socket.AF_INET if record_type == "A" else socket.AF_INET6
+        data = socket.inet_pton(family, content)
+        return (struct.pack("!HHHHHH", identifier, 0x8400, 1, 1, 0, 0) + question +
+                struct.pack("!HHHIH", 0xC00C, query_type, 1, 60, len(data)) + data)
+
+    def _serve(self):
+        while True:
+            try:
+                message, address = self.__socket.recvfrom(512)
+            except OSError:
+                return
+            self.__queries += 1
+            try:
+                answer = self._answer(message)
+            except (IndexError, struct.error, ValueError, UnicodeDecodeError):
+                continue
+            try:
+                self.__socket.sendto(answer, address)
+            except OSError:
+                # stopped while answering
+                return
+
+    def get_queries(self) -> int:
+        return self.__queries
+
+    def get_address(self):
+        return "{0}:{1}".format(*self.__socket.getsockname())
+
+    def start(self):
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__socket.close()
@@ -0,0 +1,270 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+Runs the updater against local stand-ins of the CloudFlare API and of a public IP echo service and writes a JSON report
+with the cycle times, requests per cycle, startup time and memory per record for several amounts of records:
+
+    python -m benchmarks.run_benchmarks --records 1 100 1000 10000 --output benchmark_report.json
+
+With "--verify_dns", a local name server answers with the records of the API stand-in, so records whose IP is already
+right are confirmed at DNS instead of being read from the API (see the cold restart cycle).
+"""
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime
+from datetime import timezone
+from time import perf_counter
+
+from benchmarks.fake_servers import FakeCloudFlare
+from benchmarks.fake_servers import FakeDNS
+from benchmarks.fake_servers import FakeIPEcho
+from benchmarks.fake_servers import FaultProfile
+
+# a couple of public addresses, the updater refuses private ones
+ADDRESSES = ("93.184.216.34", "93.184.216.35")
+
+
+def measure_startup(repeat=3):
+    code = "from time import perf_counter; start = perf_counter(); import pyCloudFlareUpdater.__main__; " \
+           "print(perf_counter() - start)"
+    times = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if process.returncode != 0:
+            return {"seconds": None, "error": process.stderr.strip().splitlines()[-1]}
+        times.append(float(process.stdout))
+    return {"seconds": min(times), "error": None}
+
+
+class _ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.errors = []
+
+    def emit(self, record):
+        self.errors.append(record.getMessage())
+
+
+class Benchmark(object):
+    def __init__(self, api, echo, args):
+        from pyCloudFlareUpdater import __main__ as updater
+        from pyCloudFlareUpdater.network import HTTPEchoProvider
+        from pyCloudFlareUpdater.network import IPDiscovery
+        from pyCloudFlareUpdater.network import get_rate_limiter
+        from pyCloudFlareUpdater.network import get_session
+        from pyCloudFlareUpdater.network import set_ip_discovery
+
+        self.api = api
+        self.echo = echo
+        self.args = args
+        self.updater = updater
+        self.log = logging.getLogger("benchmarks")
+        self.log.setLevel(logging.ERROR)
+        self.log.propagate = False
+        # the asyncio loop logs the errors of single records instead of raising them
+        self.errors = _ErrorCounter()
+        self.log.addHandler(self.errors)
+        # the same loop must run every cycle, as the daemon does
+        self.loop = asyncio.new_event_loop()
+        get_rate_limiter().configure(args.rate_limit)
+        get_session().configure(max_connections=max(args.connections, args.concurrency),
+                                read_timeout=args.timeout)
+        set_ip_discovery(IPDiscovery([HTTPEchoProvider(echo.get_url())], timeout=args.timeout, version=4), 4)
+        self.dns = None
+        if args.verify_dns:
+            from pyCloudFlareUpdater.network import get_dns_verifier
+
+            self.dns = FakeDNS(api).start()
+            get_dns_verifier().configure(servers=[self.dns.get_address()], timeout=min(2.0, args.timeout),
+                                         propagation_timeout=args.timeout)
+
+    def load(self, names, cache_file, latest_ip=None):
+        from pyCloudFlareUpdater.network import AsyncRecordSet
+        from pyCloudFlareUpdater.network import IdentifierCache
+        from pyCloudFlareUpdater.network import RecordSet
+
+        records = RecordSet(key="benchmark", mail="benchmark@example.com", log=self.log,
+                            cache=IdentifierCache(cache_file), batch_size=self.args.batch_size)
+        for domain, name in names:
+            records.add(domain=domain, name=name, latest_ip=latest_ip)
+        if self.args.asyncio:
+            return AsyncRecordSet(records, concurrency=self.args.concurrency)
+        return records
+
+    def cycle(self, records) -> dict:
+        before = self.api.get_requests()
+        queries = self.dns.get_queries() if self.dns is not None else 0
+        self.errors.errors = []
+        start = perf_counter()
+        try:
+            if self.args.asyncio:
+                self.loop.run_until_complete(self.updater.async_check_ip(records, 4, self.log))
+            else:
+                self.updater.check_ip(records, 4, self.log)
+        except Exception as e:
+            self.errors.errors.append("{0}: {1}".format(e.__class__.__name__, e))
+        seconds = perf_counter() - start
+        after = self.api.get_requests()
+        requests = {method: count - before.get(method, 0) for method, count in after.items()
+                    if count - before.get(method, 0)}
+        result = {"seconds": seconds, "requests": sum(requests.values()), "requests_by_method": requests,
+                  "errors": list(self.errors.errors)}
+        if self.dns is not None:
+            result["dns_queries"] = self.dns.get_queries() - queries
+        return result
+
+    def run(self, amount) -> dict:
+        self.api.reset()
+        self.echo.set_address(ADDRESSES[0])
+        names = self.api.populate(amount, content=ADDRESSES[1])
+        with tempfile.TemporaryDirectory() as directory:
+            cache_file = os.path.join(directory, "cloudflare.identifiers.cache")
+
+            start = perf_counter()
+            records = self.load(names, cache_file)
+            load_seconds = perf_counter() - start
+            # nothing is known yet: every record is looked up and updated
+            first = self.cycle(records)
+            unchanged = [self.cycle(records) for _ in range(self.args.cycles)]
+            self.echo.set_address(ADDRESSES[1])
+            changed = self.cycle(records)
+            self._close(records)
+
+            # a restarted daemon, with the identifiers cache and the latest IPs already stored
+            records = self.load(names, cache_file, latest_ip=ADDRESSES[1])
+            restart = self.cycle(records)
+            self._close(records)
+
+            # a restarted daemon that lost the latest IPs: CloudFlare already has the current one
+            records = self.load(names, cache_file)
+            cold_restart = self.cycle(records)
+            self._close(records)
+
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            records = self.load(names, cache_file)
+            self.cycle(records)
+            memory = tracemalloc.get_traced_memory()[0] - baseline
+            tracemalloc.stop()
+            self._close(records)
+        errors = [error for result in [first, changed, restart, cold_restart] + unchanged for error in result["errors"]]
+        return {"records": amount,
+                "load_seconds": load_seconds,
+                "first_cycle": first,
+                "unchanged_cycle": {"seconds": statistics.median(result["seconds"] for result in unchanged),
+                                    "requests": max(result["requests"] for result in unchanged)},
+                "changed_cycle": changed,
+                "warm_restart_cycle": restart,
+                "cold_restart_cycle": cold_restart,
+                "memory_per_record_bytes": memory / amount,
+                "errors": errors}
+
+    @staticmethod
+    def _close(records):
+        if hasattr(records, "close"):
+            records.close()
+
+    def close(self):
+        self.loop.close()
+        if self.dns is not None:
+            self.dns.stop()
+
+
+def parse_args():
+    args = ArgumentParser(description="pyCloudFlareUpdater benchmarks against a local CloudFlare API stand-in.")
+    args.add_argument("--records", type=int, nargs="+", default=[1, 100, 1000, 10000],
+                      help="Amounts of records to measure (defaults: 1 100 1000 10000).")
+    args.add_argument("--cycles", type=int, default=5,
+                      help="Checks measured while the IP does not change (defaults: 5).")
+    args.add_argument("--latency", type=float, default=0.0,
+                      help="Latency (in seconds) of every CloudFlare API response (defaults: 0).")
+    args.add_argument("--error_rate", type=float, default=0.0,
+                      help="Fraction of CloudFlare API requests answered with HTTP 500 (defaults: 0).")
+    args.add_argument("--throttle_rate", type=float, default=0.0,
+                      help="Fraction of CloudFlare API requests answered with HTTP 429 (defaults: 0).")
+    args.add_argument("--retry_after", type=float, default=1.0,
+                      help="Retry-After (in seconds) sent with the HTTP 429 answers (defaults: 1).")
+    args.add_argument("--ip_latency", type=float, default=0.0,
+                      help="Latency (in seconds) of the public IP echo service (defaults: 0).")
+    args.add_argument("--ip_error_rate", type=float, default=0.0,
+                      help="Fraction of public IP lookups answered with HTTP 500 (defaults: 0).")
+    args.add_argument("--rate_limit", type=int, default=10 ** 9,
+                      help="Client side rate limit (requests every 5 minutes) - unlimited by default.")
+    args.add_argument("--connections", type=int, default=4)
+    args.add_argument("--batch_size", type=int, default=100,
+                      help="Records per batch update request, 1 to send individual requests.")
+    args.add_argument("--timeout", type=float, default=15.0)
+    args.add_argument("--asyncio", action="store_true", default=False,
+                      help="Measure the asyncio update loop instead of the threaded one.")
+    args.add_argument("--concurrency", type=int, default=8)
+    args.add_argument("--verify_dns", action="store_true", default=False,
+                      help="Confirm the records at a local name server before reading them from the API.")
+    args.add_argument("--seed", type=int, default=None, help="Seed for the simulated failures.")
+    args.add_argument("--output", type=str, default="benchmark_report.json",
+                      help="File the JSON report is written to (defaults: benchmark_report.json).")
+    return args.parse_args()
+
+
+def main():
+    args = parse_args()
+    api = FakeCloudFlare(FaultProfile(args.latency, args.error_rate, args.throttle_rate, args.retry_after,
+                                      seed=args.seed)).start()
+    echo = FakeIPEcho(ADDRESSES[0], FaultProfile(args.ip_latency, args.ip_error_rate, seed=args.seed)).start()
+    # must be set before the updater is imported
+    os.environ["CLOUDFLARE_API_URL"] = api.get_url()
+    report = {"date": datetime.now(timezone.utc).isoformat(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "settings": vars(args),
+              "startup": measure_startup(),
+              "results": []}
+    benchmark = None
+    try:
+        benchmark = Benchmark(api, echo, args)
+        for amount in args.records:
+            result = benchmark.run(amount)
+            report["results"].append(result)
+            print("{0:>6} records | first {1:8.3f}s ({2} req) | unchanged {3:8.4f}s ({4} req) | changed {5:8.3f}s "
+                  "({6} req) | restart {7:8.4f}s ({8} req) | cold restart {9:8.4f}s ({10} req) | {11:7.0f} B/record{12}"
+                  .format(amount, result["first_cycle"]["seconds"], result["first_cycle"]["requests"],
+                          result["unchanged_cycle"]["seconds"], result["unchanged_cycle"]["requests"],
+                          result["changed_cycle"]["seconds"], result["changed_cycle"]["requests"],
+                          result["warm_restart_cycle"]["seconds"], result["warm_restart_cycle"]["requests"],
+                          result["cold_restart_cycle"]["seconds"], result["cold_restart_cycle"]["requests"],
+                          result["memory_per_record_bytes"],
+                          " | {0} errors".format(len(result["errors"])) if result["errors"] else ""))
+    finally:
+        if benchmark is not None:
+            benchmark.close()
+        api.stop()
+        echo.stop()
+    with open(args.output, "w") as freport:
+        json.dump(report, freport, indent=2)
+    print("Report written to " + args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,102 +16,600 @@
 import traceback
 from argparse import ArgumentParser
 from argparse import SUPPRESS
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from logging import WARNING
 from logging import getLogger
 from os import makedirs
 from os import path
+from signal import SIGHUP
+from signal import SIGINT
+from signal import SIGTERM
+from signal import signal
 from socket import gaierror
+from time import monotonic
 from time import sleep
 from urllib.error import URLError
 
-from daemonize import Daemonize
-
 from .logging_utils import LoggingHandler
-from .logging_utils import setup_logging
-from .network import CloudFlare
+from .metrics import count_error
+from .metrics import get_exporter
+from .metrics import record_check
+from .metrics import record_schedule
+from .metrics import set_managed_records
+from .network import Credentials
+from .network import IPDiscovery
+from .network import default_providers
+from .network import RECORD_TYPES
+from .network import UNKNOWN_IP
+from .network import configure_resilience
+from .network import get_circuit_breakers
 from .network import get_machine_public_ip
+from .network import get_rate_limiter
+from .network import get_ip_discovery
+from .network import get_ip_oracle
+from .network import get_session
+from .network import set_ip_discovery
 from .preferences import UserPreferences
+from .scheduling import AdaptiveScheduler
 from .values import description
 
 preferences = UserPreferences()
+# seconds between checks for changes at the configuration file
+CONFIG_POLL_INTERVAL = 5.0
+# latest public IP of each version, for the "ip_changed" hooks
+public_ips = {}
+
+
+def get_credentials() -> Credentials:
+    return Credentials(key=preferences.get_key(),
+                       mail=preferences.get_mail(),
+                       token=preferences.get_token(),
+                       zone_tokens=preferences.get_zone_tokens())
+
+
+def load_records(log, config=None, batch_size=100, sharding=None, sweep_interval=None):
+    credentials = get_credentials()
+    if sharding:
+        from .network import ShardedRecordSet
+
+        records = ShardedRecordSet(key=preferences.get_key(),
+                                   mail=preferences.get_mail(),
+                                   log=log,
+                                   cache_file=preferences.get_identifier_cache_file(),
+                                   batch_size=batch_size,
+                                   sweep_interval=sweep_interval,
+                                   credentials=credentials,
+                                   **sharding)
+    else:
+        from .network import IdentifierCache
+        from .network import RecordSet
+
+        records = RecordSet(key=preferences.get_key(),
+                            mail=preferences.get_mail(),
+                            log=log,
+                            cache=IdentifierCache(preferences.get_identifier_cache_file()),
+                            batch_size=batch_size,
+                            sweep_interval=sweep_interval,
+                            credentials=credentials)
+    stored_records = {(record["name"], record.get("type", "A")): record for record in preferences.get_records()}
+    if config is None:
+        for record in stored_records.values():
+            records.add(domain=record["domain"],
+                        name=record["name"],
+                        proxied=record["proxied"],
+                        latest_ip=record["latest_ip"],
+                        record_type=record.get("type", "A"))
+    else:
+        for key, spec in config.get_records().items():
+            records.add(domain=spec.domain,
+                        name=spec.name,
+                        proxied=spec.proxied,
+                        latest_ip=stored_records.get(key, {}).get("latest_ip"),
+                        record_type=spec.type,
+                        ttl=spec.ttl,
+                        interval=spec.interval)
+    log.info("Managing {0} record{1}".format(len(records), 's' if len(records) > 1 else ''))
+    set_managed_records(len(records))
+    return records
+
+
+def get_config_interval(config):
+    intervals = [spec.interval for spec in config.get_records().values() if spec.interval]
+    if config.get_settings().get("interval"):
+        intervals.append(config.get_settings()["interval"])
+    # a single public IP check serves every record, so the shortest interval is used
+    return int(min(intervals) * 60) if intervals else None
+
+
+def reload_config(records, config, scheduler, log):
+    hooks = config.get_settings().get("hooks")
+    try:
+        added, removed, changed = config.reload()
+    except (OSError, ValueError, ImportError) as error:
+        log.error("The configuration file could not be reloaded - keeping the current records: " + str(error))
+        return
+    settings = config.get_settings()
+    if settings.get("key", preferences.get_key()) != preferences.get_key() or \
+            settings.get("mail", preferences.get_mail()) != preferences.get_mail() or \
+            settings.get("token", preferences.get_token()) != preferences.get_token() or \
+            settings.get("zone_tokens", preferences.get_zone_tokens()) != preferences.get_zone_tokens():
+        log.warning("CloudFlare credentials changed at the configuration file - restart the daemon to use them")
+    if settings.get("hooks") != hooks:
+        log.warning("Hooks changed at the configuration file - restart the daemon to use them")
+    for spec in removed:
+        records.remove(spec.name, spec.type)
+        preferences.remove_record(spec.name, spec.type)
+    for spec in added:
+        records.add(domain=spec.domain,
+                    name=spec.name,
+                    proxied=spec.proxied,
+                    record_type=spec.type,
+                    ttl=spec.ttl,
+                    interval=spec.interval)
+        preferences.add_record(spec.domain, spec.name, spec.proxied, spec.type)
+    for spec in changed:
+        records.reconfigure(spec.name, spec.type, domain=spec.domain, proxied=spec.proxied, ttl=spec.ttl,
+                            interval=spec.interval)
+        preferences.add_record(spec.domain, spec.name, spec.proxied, spec.type)
+    preferences.save_preferences()
+    set_managed_records(len(records))
+    interval = get_config_interval(config)
+    if interval and interval != scheduler.get_base_interval():
+        scheduler.set_base_interval(interval)
+    log.warning("Configuration reloaded - {0} record{1} added, {2} removed and {3} changed"
+                .format(len(added), 's' if len(added) != 1 else '', len(removed), len(changed)))
+
+
+def has_ip_changed(config=None) -> bool:
+    latest_ips = {(record["name"], record.get("type", "A")): record["latest_ip"] for record in preferences.get_records()}
+    keys = config.get_records().keys() if config is not None else latest_ips.keys()
+    for version, record_type in sorted(RECORD_TYPES.items()):
+        stored = {latest_ips.get(key) for key in keys if key[1] == record_type}
+        if not stored:
+            continue
+        try:
+            current_ip = get_machine_public_ip(version)
+        except Exception:
+            # the whole run reports what failed
+            return True
+        if stored != {current_ip}:
+            return True
+    return False
+
+
+def get_ip_versions(records) -> list:
+    record_types = records.get_record_types()
+    return [version for version, record_type in sorted(RECORD_TYPES.items()) if record_type in record_types]
+
+
+def get_previous_ip(version):
+    if version not in public_ips:
+        # on start, the IP most records were left with
+        record_type = RECORD_TYPES[version]
+        stored = [record["latest_ip"] for record in preferences.get_records()
+                  if record.get("type", "A") == record_type and record["latest_ip"] != UNKNOWN_IP[record_type]]
+        public_ips[version] = max(set(stored), key=stored.count) if stored else None
+    return public_ips[version]
+
+
+def emit_events(version, current_ip, previous_ip, updated, failed):
+    from .hooks import get_hook_dispatcher
+
+    hooks = get_hook_dispatcher()
+    details = {"ip": current_ip, "version": version, "type": RECORD_TYPES[version]}
+    if current_ip != previous_ip:
+        hooks.emit("ip_changed", old_ip=previous_ip, **details)
+    if updated:
+        hooks.emit("records_updated", records=updated, **details)
+    if failed:
+        hooks.emit("update_failed", records=list(failed), errors=failed, **details)
 
 
-def main():
+def log_results(log, version, current_ip, results):
+    from .hooks import get_hook_dispatcher
+
+    previous_ip = get_previous_ip(version) if get_hook_dispatcher().has_hooks() else None
+    updated = []
+    failed = {}
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            # already logged when it happened
+            failed[name] = str(result)
+            continue
+        log.info("IP updated correctly for \"{0}\"! - Operation return code: {1}".format(name, result))
+        preferences.set_record_latest_ip(name, current_ip, RECORD_TYPES[version])
+        updated.append(name)
+    if not results:
+        log.info("IPv{0} has not changed - skipping".format(version))
+    if get_hook_dispatcher().has_hooks():
+        emit_events(version, current_ip, previous_ip, updated, failed)
+        public_ips[version] = current_ip
+
+
+def log_check_error(log, error):
+    from .hooks import get_hook_dispatcher
+
+    get_hook_dispatcher().emit("update_failed", error="{0}: {1}".format(error.__class__.__name__, error))
+    if isinstance(error, (URLError, gaierror)):
+        log.error("Failure to connect to the network - extended explanation: " + str(error))
+        return
+    log.error("The check failed - {0}: {1}".format(error.__class__.__name__, error))
+    log.debug("Stacktrace: " + "".join(traceback.format_exception(type(error), error, error.__traceback__)))
+
+
+def log_stats(log, versions):
+    from .hooks import get_hook_dispatcher
+    from .network import get_dns_verifier
+    from .network import get_update_planner
+
+    log.debug("HTTP session stats: {0}".format(get_session().get_stats()))
+    log.debug("Circuit breakers: {0}".format(get_circuit_breakers().get_stats()))
+    log.debug("CloudFlare rate limiter stats: {0}".format(get_rate_limiter().get_stats()))
+    log.debug("Update planner stats: {0}".format(get_update_planner().get_stats()))
+    if get_dns_verifier().is_enabled():
+        log.debug("DNS verification stats: {0}".format(get_dns_verifier().get_stats()))
+    if get_hook_dispatcher().has_hooks():
+        log.debug("Hooks stats: {0}".format(get_hook_dispatcher().get_stats()))
+    if get_ip_oracle().get_filename() is not None:
+        log.debug("Shared IP stats: {0}".format(get_ip_oracle().get_stats()))
+    for version in versions:
+        log.debug("Public IPv{0} providers stats: {1}".format(version, get_ip_discovery(version).get_stats()))
+
+
+def check_ip(records, version, log):
+    current_ip = get_machine_public_ip(version)
+    log.info("Current machine IPv{0}: \"{1}\"".format(version, current_ip))
+    results = records.update(current_ip)
+    log_results(log, version, current_ip, results)
+    return results
+
+
+async def async_check_ip(records, version, log):
+    current_ip = await records.get_public_ip(version)
+    log.info("Current machine IPv{0}: \"{1}\"".format(version, current_ip))
+    results = await records.update(current_ip)
+    log_results(log, version, current_ip, results)
+    return results
+
+
+def get_outcome(results, deferred=False) -> str:
+    # deferred updates are written on a next check, so it must be done soon
+    outcome = AdaptiveScheduler.CHANGED if deferred else AdaptiveScheduler.UNCHANGED
+    for result in results:
+        if isinstance(result, Exception) or \
+                (isinstance(result, dict) and any(isinstance(code, Exception) for code in result.values())):
+            return AdaptiveScheduler.FAILED
+        if result:
+            outcome = AdaptiveScheduler.CHANGED
+    return outcome
+
+
+def schedule_next_check(scheduler, outcome, log) -> float:
+    delay = scheduler.next_delay(outcome)
+    record_schedule(delay, scheduler.get_interval())
+    log.info("Next check in about {0:.1f} minute{1} - {2}"
+             .format(delay / 60, 's' if delay / 60 > 1 else '', scheduler.get_last_decision()["reason"]))
+    return delay
+
+
+def start_metrics(log):
+    exporter = get_exporter()
+    try:
+        exporter.start()
+    except OSError as error:
+        log.error("The metrics endpoint could not be started - " + str(error))
+        return
+    if exporter.get_address() is not None:
+        log.info("Serving metrics at http://{0}:{1}/metrics".format(*exporter.get_address()[:2]))
+
+
+def finish_check(start, results, log):
+    for result in results:
+        if isinstance(result, Exception):
+            count_error(result)
+    record_check(start, get_outcome(results) != AdaptiveScheduler.FAILED)
+    try:
+        get_exporter().write_textfile()
+    except OSError as error:
+        log.error("Metrics could not be written - " + str(error))
+
+
+def create_watcher(log):
+    from .network import create_address_watcher
+
+    watcher = create_address_watcher()
+    if watcher is None:
+        log.warning("Local address changes cannot be watched on this system - using timed checks only")
+    else:
+        log.info("Watching local address changes with {0}".format(watcher.__class__.__name__))
+    return watcher
+
+
+def wait_for_next_check(delay, watcher, config, log):
+    deadline = monotonic() + delay
+    while True:
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            return
+        timeout = remaining if config is None else min(remaining, CONFIG_POLL_INTERVAL)
+        if watcher is None:
+            sleep(timeout)
+        elif watcher.wait(timeout):
+            log.info("Local address change detected - checking now")
+            return
+        if config is not None and config.has_changed():
+            return
+
+
+def main(watch=False, scheduler=None, config=None, batch_size=100, sharding=None, sweep_interval=None):
+    from .hooks import get_hook_dispatcher
+
     log = LoggingHandler(logs=[getLogger("cloudflareLogger")])
+    scheduler = scheduler or AdaptiveScheduler(preferences.get_time())
     loop_continuation = True
+    watcher = None
+    executor = None
+    records = None
     try:
-        net = CloudFlare(domain=preferences.get_domain(),
-                         name=preferences.get_name(),
-                         key=preferences.get_key(),
-                         mail=preferences.get_mail(),
-                         proxied=preferences.is_record_behind_proxy())
+        start_metrics(log)
+        records = load_records(log, config, batch_size, sharding, sweep_interval)
+        executor = ThreadPoolExecutor(max_workers=len(RECORD_TYPES))
+        if watch and preferences.is_running_as_daemon():
+            watcher = create_watcher(log)
+        if config is not None:
+            signal(SIGHUP, lambda signal_number, frame: config.request_reload())
         while loop_continuation:
+            results = [RuntimeError("check not completed")]
+            start = monotonic()
             try:
-                current_ip = get_machine_public_ip()
-                log.info("Current machine IP: \"{0}\"".format(current_ip))
-                if preferences.get_latest_ip() == "0.0.0.0":
-                    preferences.set_latest_ip(net.get_cloudflare_latest_ip())
-                    log.warning(
-                        "User saved latest IP is not up to date - downloading CloudFlare A Record value: \"{0}\""
-                            .format(preferences.get_latest_ip()))
-                if preferences.get_latest_ip() != current_ip:
-                    log.warning("IP needs an upgrade - OLD IP: {0} | NEW IP: {1}"
-                                .format(preferences.get_latest_ip(), current_ip))
-                    result = net.set_cloudflare_ip(current_ip)
-                    log.info("IP updated correctly! - Operation return code: {0}".format(result))
-                    log.debug("Updating saved IP...")
-                    preferences.set_latest_ip(current_ip)
-                else:
-                    log.info("IP has not changed - skipping")
-            except (URLError, gaierror) as network_error:
-                log.error("Failure to connect to the network - extended explanation: " + str(network_error))
+                if config is not None and config.has_changed():
+                    reload_config(records, config, scheduler, log)
+                records.sweep()
+                versions = get_ip_versions(records)
+                # both address families are checked and updated at the same time
+                results = []
+                for future in [executor.submit(check_ip, records, version, log) for version in versions]:
+                    try:
+                        results.append(future.result())
+                    except Exception as error:
+                        log_check_error(log, error)
+                        results.append(error)
+                log_stats(log, versions)
+            except Exception as error:
+                # a failed check never stops the daemon - the next one is done sooner
+                log_check_error(log, error)
+                results = [error]
             finally:
+                finish_check(start, results, log)
                 if not preferences.is_running_as_daemon():
                     log.info("This script is only executed once. Finishing...")
                     loop_continuation = False
                 else:
-                    log.info("Next check in about {0} minute{1}"
-                             .format((preferences.get_time() / 60),
-                                     's' if (preferences.get_time() / 60) > 1 else ''))
-                    sleep(preferences.get_time())
+                    delay = schedule_next_check(scheduler, get_outcome(results, records.has_deferred()), log)
+                    wait_for_next_check(delay, watcher, config, log)
     except KeyboardInterrupt:
         log.warning("Received SIGINT - exiting...")
     except Exception as e:
+        count_error(e)
         log.error("Exception registered! - " + str(e))
         log.error("Stacktrace: " + traceback.format_exc())
     finally:
+        if watcher is not None:
+            watcher.close()
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if records is not None:
+            records.close()
+        get_hook_dispatcher().close()
+        get_exporter().close()
         preferences.save_preferences()
         exit(0)
 
 
+def watch_config_async(config, timer):
+    import asyncio
+
+    def on_reload_request():
+        config.request_reload()
+        timer.wake()
+
+    async def poll_periodically():
+        while True:
+            await asyncio.sleep(CONFIG_POLL_INTERVAL)
+            if config.has_changed():
+                timer.wake()
+
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(SIGHUP, on_reload_request)
+    loop.create_task(poll_periodically())
+
+
+def watch_async(watcher, timer, log):
+    import asyncio
+
+    def on_change():
+        if watcher.poll():
+            log.info("Local address change detected - checking now")
+            timer.wake()
+
+    loop = asyncio.get_running_loop()
+    if watcher.fileno() is not None:
+        loop.add_reader(watcher.fileno(), on_change)
+    else:
+        async def poll_periodically():
+            while True:
+                await asyncio.sleep(watcher.get_interval())
+                on_change()
+
+        loop.create_task(poll_periodically())
+
+
+async def async_main(concurrency, watch=False, scheduler=None, config=None, batch_size=100, sweep_interval=None):
+    import asyncio
+
+    from .hooks import get_hook_dispatcher
+    from .network import AsyncRecordSet
+    from .network import CancellableTimer
+
+    log = LoggingHandler(logs=[getLogger("cloudflareLogger")])
+    scheduler = scheduler or AdaptiveScheduler(preferences.get_time())
+    timer = CancellableTimer()
+    loop = asyncio.get_running_loop()
+    for signal_number in (SIGINT, SIGTERM):
+        loop.add_signal_handler(signal_number, timer.cancel)
+    records = None
+    watcher = None
+    try:
+        start_metrics(log)
+        records = AsyncRecordSet(load_records(log, config, batch_size, sweep_interval=sweep_interval),
+                                 concurrency=concurrency)
+        if watch and preferences.is_running_as_daemon():
+            watcher = create_watcher(log)
+            if watcher is not None:
+                watch_async(watcher, timer, log)
+        if config is not None and preferences.is_running_as_daemon():
+            watch_config_async(config, timer)
+        while not timer.is_cancelled():
+            start = monotonic()
+            try:
+                if config is not None and config.has_changed():
+                    reload_config(records.get_records(), config, scheduler, log)
+                await records.sweep()
+                versions = get_ip_versions(records.get_records())
+                results = await asyncio.gather(*(async_check_ip(records, version, log) for version in versions),
+                                               return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        log_check_error(log, result)
+                log_stats(log, versions)
+            except Exception as error:
+                # a failed check never stops the daemon - the next one is done sooner
+                log_check_error(log, error)
+                results = [error]
+            finish_check(start, results, log)
+            if not preferences.is_running_as_daemon():
+                log.info("This script is only executed once. Finishing...")
+                break
+            outcome = get_outcome(results, records.get_records().has_deferred())
+            await timer.sleep(schedule_next_check(scheduler, outcome, log))
+        if timer.is_cancelled():
+            log.warning("Received stop signal - exiting...")
+    except Exception as e:
+        count_error(e)
+        log.error("Exception registered! - " + str(e))
+        log.error("Stacktrace: " + traceback.format_exc())
+    finally:
+        if watcher is not None:
+            if watcher.fileno() is not None:
+                loop.remove_reader(watcher.fileno())
+            watcher.close()
+        if records is not None:
+            records.close()
+        get_hook_dispatcher().close()
+        get_exporter().close()
+        preferences.save_preferences()
+
+
+def run_async(concurrency, watch=False, scheduler=None, config=None, batch_size=100, sweep_interval=None):
+    # asyncio is only imported when it is going to be used - it is slow to import
+    import asyncio
+
+    asyncio.run(async_main(concurrency, watch, scheduler, config, batch_size, sweep_interval))
+    exit(0)
+
+
 def parser():
+    preferences_file = ArgumentParser(add_help=False)
+    preferences_file.add_argument("--preferences", type=str, default="cloudflare.user.preferences")
+    preferences_file.add_argument("--config", type=str, default=None)
+    preferences_file.add_argument("--token", type=str, default=None)
+    preferences_file.add_argument("--zone_token", type=str, nargs=2, action="append", default=[])
+    known_args = preferences_file.parse_known_args()[0]
+    preferences.set_preferences_file(known_args.preferences)
     is_first_execution = not preferences.are_preferences_stored()
+    config = None
+    if known_args.config:
+        try:
+            from .preferences import ConfigWatcher
+
+            config = ConfigWatcher(path.abspath(known_args.config))
+        except (OSError, ValueError, ImportError) as error:
+            ArgumentParser().error("the configuration file could not be read - " + str(error))
+    config_settings = config.get_settings() if config is not None else {}
+    # API tokens replace the global key and mail
+    uses_token = bool(known_args.token or known_args.zone_token or config_settings.get("token") or
+                      config_settings.get("zone_tokens"))
     args = ArgumentParser(description=description,
                           allow_abbrev=False)
     args.add_argument("--domain",
                       type=str,
-                      required=is_first_execution,
+                      required=False,
                       help="CloudFlare domain to be updated.")
     args.add_argument("--name",
                       type=str,
-                      required=is_first_execution,
+                      required=False,
                       help="CloudFlare 'A' Record name.")
+    args.add_argument("--record",
+                      type=str,
+                      nargs=2,
+                      action="append",
+                      default=[],
+                      required=False,
+                      metavar=("DOMAIN", "NAME"),
+                      help="Adds an extra CloudFlare 'A' Record to be updated by this same daemon - can be "
+                           "provided several times for managing many records across different zones.")
+    args.add_argument("--ipv6",
+                      action="store_true",
+                      required=False,
+                      default=False,
+                      help="Also keep the 'AAAA' Records of the given names updated with the public IPv6 address "
+                           "(dual-stack hosts). Both address families are checked at the same time.")
     args.add_argument("--time",
                       type=int,
                       default=SUPPRESS,
                       required=False,
                       help="Time (in minutes) to check for updated IP (defaults: 5 min.) - must be higher than 0.")
+    args.add_argument("--max_time",
+                      type=int,
+                      default=None,
+                      required=False,
+                      metavar="MAX TIME",
+                      help="While the IP does not change, the time between checks grows up to this value (in "
+                           "minutes). After a change or a failure, checks are done sooner (defaults: four times the "
+                           "\"--time\" value).")
+    args.add_argument("--jitter",
+                      type=float,
+                      default=0.1,
+                      required=False,
+                      metavar="FRACTION",
+                      help="Random variation applied to the time between checks, so many daemons do not run at the "
+                           "same time (defaults: 0.1, that is, +-10%%).")
     args.add_argument("--key",
                       type=str,
-                      required=is_first_execution,
+                      required=is_first_execution and "key" not in config_settings and not uses_token,
                       help="CloudFlare API key.")
     args.add_argument("--mail",
                       type=str,
-                      required=is_first_execution,
+                      required=is_first_execution and "mail" not in config_settings and not uses_token,
                       help="CloudFlare sign-in mail.")
+    args.add_argument("--token",
+                      type=str,
+                      required=False,
+                      help="CloudFlare API token, used instead of the API key and mail. It only needs the \"Zone - "
+                           "DNS - Edit\" permission on the managed zones.")
+    args.add_argument("--zone_token",
+                      type=str,
+                      nargs=2,
+                      action="append",
+                      default=[],
+                      required=False,
+                      metavar=("DOMAIN", "TOKEN"),
+                      help="CloudFlare API token for the zone DOMAIN only - can be provided several times. Zones "
+                           "without their own token use \"--token\" (or the API key and mail).")
     args.add_argument("--proxied",
                       action="store_true",
-                      required=is_first_execution,
+                      required=is_first_execution and config is None,
                       default=False,
                       help="Set this value if you want your 'A' Record to be behind the Cloudflare proxy "
                            "(disabled by default).")
@@ -121,6 +619,217 @@ def parser():
                       default=False,
                       help="By default, the program runs as a daemon in background. With this option enabled, "
                            "the program will run only once and then exit.")
+    args.add_argument("--check_only",
+                      action="store_true",
+                      required=False,
+                      default=False,
+                      help="Look up the public IP first and exit at once if every record already has it, without "
+                           "contacting CloudFlare or starting the daemon. Useful with \"--no_daemonize\" from cron.")
+    args.add_argument("--timeout",
+                      type=float,
+                      default=15.0,
+                      required=False,
+                      metavar="SECONDS",
+                      help="Maximum time (in seconds) to wait for a network response (defaults: 15 sec.).")
+    args.add_argument("--max_retries",
+                      type=int,
+                      default=3,
+                      required=False,
+                      metavar="N",
+                      help="Times a CloudFlare request is retried after a network error, a server error or an invalid "
+                           "answer (defaults: 3).")
+    args.add_argument("--retry_deadline",
+                      type=float,
+                      default=30,
+                      required=False,
+                      metavar="SECONDS",
+                      help="Maximum time spent on a single CloudFlare request, retries included (defaults: 30).")
+    args.add_argument("--failure_threshold",
+                      type=int,
+                      default=5,
+                      required=False,
+                      metavar="N",
+                      help="After N failures in a row, CloudFlare (or a public IP provider) is not contacted for a "
+                           "while: calls fail at once until a single probe succeeds. 0 disables it (defaults: 5).")
+    args.add_argument("--failure_cooldown",
+                      type=float,
+                      default=30,
+                      required=False,
+                      metavar="SECONDS",
+                      help="Time before probing a failing endpoint again - doubled after every failed probe, up to "
+                           "10 minutes (defaults: 30).")
+    args.add_argument("--connections",
+                      type=int,
+                      default=4,
+                      required=False,
+                      metavar="N",
+                      help="Maximum number of persistent connections kept open to each server (defaults: 4).")
+    args.add_argument("--watch",
+                      action="store_true",
+                      required=False,
+                      default=False,
+                      help="Check the public IP as soon as the addresses of the local interfaces change (Linux). The "
+                           "\"--time\" interval is still used as a safety net, so it can be safely increased.")
+    args.add_argument("--ip_quorum",
+                      type=int,
+                      default=1,
+                      required=False,
+                      metavar="N",
+                      help="Number of public IP providers that must return the same address before accepting it "
+                           "(defaults: 1, the first valid answer wins).")
+    args.add_argument("--rate_limit",
+                      type=int,
+                      default=1200,
+                      required=False,
+                      metavar="N",
+                      help="Maximum number of CloudFlare API requests every 5 minutes, shared by all the records "
+                           "(defaults: 1200, the CloudFlare limit).")
+    args.add_argument("--shared_ip",
+                      type=str,
+                      default=None,
+                      required=False,
+                      metavar="FILE",
+                      help="Share the public IP with the other daemons of this host through FILE: the first one that "
+                           "needs it looks it up and the others read it, so running more daemons does not send more "
+                           "requests to the IP providers (disabled by default).")
+    args.add_argument("--shared_ip_ttl",
+                      type=float,
+                      default=60,
+                      required=False,
+                      metavar="SECONDS",
+                      help="Seconds the IP stored at \"--shared_ip\" is trusted before looking it up again "
+                           "(defaults: 60).")
+    args.add_argument("--debounce",
+                      type=float,
+                      default=0,
+                      required=False,
+                      metavar="SECONDS",
+                      help="Only write a new IP once it has stayed the same for these seconds, so a flapping "
+                           "connection causes a single update (disabled by default).")
+    args.add_argument("--batch_size",
+                      type=int,
+                      default=100,
+                      required=False,
+                      metavar="N",
+                      help="Maximum number of records of the same zone updated with a single batch request when the IP "
+                           "changes (defaults: 100, use 1 for individual requests).")
+    args.add_argument("--asyncio",
+                      action="store_true",
+                      required=False,
+                      default=False,
+                      help="Run the update loop with asyncio, checking and updating many records concurrently.")
+    args.add_argument("--concurrency",
+                      type=int,
+                      default=8,
+                      required=False,
+                      metavar="N",
+                      help="Maximum number of concurrent CloudFlare requests when running with \"--asyncio\" "
+                           "(defaults: 8).")
+    args.add_argument("--verify_dns",
+                      action="store_true",
+                      required=False,
+                      default=False,
+                      help="Ask the authoritative name servers of each zone for the records: records already "
+                           "showing the current IP are not read from CloudFlare, and the time every update takes to "
+                           "be visible is logged.")
+    args.add_argument("--dns_server",
+                      type=str,
+                      action="append",
+                      default=None,
+                      required=False,
+                      metavar="HOST[:PORT]",
+                      help="With \"--verify_dns\", ask this DNS server instead of the authoritative ones. It can be "
+                           "given many times.")
+    args.add_argument("--propagation_timeout",
+                      type=float,
+                      default=60,
+                      required=False,
+                      metavar="SECONDS",
+                      help="With \"--verify_dns\", seconds to wait for an updated record to be visible before "
+                           "warning about it (defaults: 60).")
+    args.add_argument("--sweep_interval",
+                      type=float,
+                      default=60,
+                      required=False,
+                      metavar="MINUTES",
+                      help="Every record is compared with its real value at CloudFlare once every these minutes, "
+                           "with a listing per zone spread over the checks, so changes made outside the daemon "
+                           "(e.g. at the dashboard) are corrected. Use 0 to disable it (defaults: 60).")
+    args.add_argument("--workers",
+                      type=int,
+                      default=1,
+                      required=False,
+                      metavar="N",
+                      help="Spread the records by zone across N worker processes that update them in parallel. The "
+                           "public IP is still looked up once (defaults: 1, a single process).")
+    args.add_argument("--config",
+                      type=str,
+                      default=None,
+                      required=False,
+                      metavar="CONFIG FILE",
+                      help="A TOML, YAML or JSON file describing the CloudFlare credentials and the zones and records "
+                           "to be updated, each one with its own TTL, proxied flag and interval. The records of the "
+                           "file replace \"--domain\", \"--name\" and \"--record\". The daemon reloads it when "
+                           "the file changes or when receiving SIGHUP, without restarting.")
+    args.add_argument("--hook",
+                      type=str,
+                      nargs=2,
+                      action="append",
+                      default=[],
+                      required=False,
+                      metavar=("EVENT", "COMMAND"),
+                      help="Run COMMAND when EVENT happens: \"ip_changed\", \"records_updated\", \"update_failed\" "
+                           "or \"all\". The event is given as JSON on its standard input and as CLOUDFLARE_DDNS_* "
+                           "environment variables. It can be given many times.")
+    args.add_argument("--webhook",
+                      type=str,
+                      nargs=2,
+                      action="append",
+                      default=[],
+                      required=False,
+                      metavar=("EVENT", "URL"),
+                      help="POST the event as JSON to URL when EVENT happens (same events as \"--hook\"). It can be "
+                           "given many times.")
+    args.add_argument("--hook_timeout",
+                      type=float,
+                      default=10,
+                      required=False,
+                      metavar="SECONDS",
+                      help="Seconds a hook or webhook may run before it is stopped and considered failed (defaults: "
+                           "10).")
+    args.add_argument("--hook_retries",
+                      type=int,
+                      default=2,
+                      required=False,
+                      metavar="N",
+                      help="Times a failed hook or webhook is tried again, waiting longer each time (defaults: 2).")
+    args.add_argument("--hook_workers",
+                      type=int,
+                      default=4,
+                      required=False,
+                      metavar="N",
+                      help="Hooks and webhooks run at most N at a time, apart from the record updates so they are "
+                           "never delayed by them (defaults: 4).")
+    args.add_argument("--metrics_port",
+                      type=int,
+                      default=None,
+                      required=False,
+                      metavar="PORT",
+                      help="Serve Prometheus metrics (IP providers and CloudFlare API latencies, updates, errors, "
+                           "rate limiting...) at http://127.0.0.1:PORT/metrics (disabled by default).")
+    args.add_argument("--metrics_address",
+                      type=str,
+                      default="127.0.0.1",
+                      required=False,
+                      metavar="ADDRESS",
+                      help="Address the metrics endpoint listens at (defaults: 127.0.0.1, only local access).")
+    args.add_argument("--metrics_file",
+                      type=str,
+                      default=None,
+                      required=False,
+                      metavar="METRICS FILE",
+                      help="Write the Prometheus metrics to this file after every check, for the node_exporter "
+                           "textfile collector (the file name must end with \".prom\").")
     args.add_argument("--pid",
                       type=str,
                       default=SUPPRESS,
@@ -133,13 +842,38 @@ def parser():
                       required=False,
                       metavar="LOG FILE",
                       help="Specifies a custom LOG file for storing current daemon logs.")
+    args.add_argument("--log_max_size",
+                      type=float,
+                      default=10,
+                      required=False,
+                      metavar="MB",
+                      help="The LOG file is rotated (and the old one compressed) when it grows over this size, in "
+                           "megabytes (defaults: 10 MB).")
+    args.add_argument("--log_rotation",
+                      type=float,
+                      default=None,
+                      required=False,
+                      metavar="HOURS",
+                      help="Also rotate the LOG file every given hours (disabled by default).")
+    args.add_argument("--log_backups",
+                      type=int,
+                      default=5,
+                      required=False,
+                      metavar="N",
+                      help="Number of rotated (compressed) LOG files kept (defaults: 5).")
+    args.add_argument("--log_json",
+                      action="store_true",
+                      required=False,
+                      default=False,
+                      help="Write the LOG file as JSON lines, for log collectors.")
     args.add_argument("--preferences",
                       type=str,
                       default="cloudflare.user.preferences",
                       required=False,
                       metavar="PREFERENCES FILE",
-                      help="Provide a custom preferences file - useful for multiple running daemon for different 'A'"
-                           "Records. NOTICE THAT YOU MUST PROVIDE ALL REQUIRED PARAMS FOR A NEW CONFIGURATION")
+                      help="Provide a custom preferences file - useful for keeping different sets of 'A' Records "
+                           "(a single daemon can manage many of them with \"--record\"). "
+                           "NOTICE THAT YOU MUST PROVIDE ALL REQUIRED PARAMS FOR A NEW CONFIGURATION")
     args.add_argument("--user",
                       type=str,
                       default=None,
@@ -153,6 +887,24 @@ def parser():
                       metavar="GROUP NAME",
                       help="Run the daemon as the specified group.")
     p_args = args.parse_args()
+    if is_first_execution and config is None and not ((p_args.domain and p_args.name) or p_args.record):
+        args.error("the following arguments are required: --domain and --name, or at least one --record")
+    if p_args.workers > 1 and p_args.asyncio:
+        args.error("argument --workers: not allowed with argument --asyncio")
+    hooks = []
+    if p_args.hook or p_args.webhook or config_settings.get("hooks"):
+        from .hooks import ScriptHook
+        from .hooks import WebhookHook
+        from .hooks import create_hook
+
+        try:
+            hooks = [ScriptHook(command, event) for event, command in p_args.hook] + \
+                    [WebhookHook(url, event) for event, url in p_args.webhook] + \
+                    [create_hook(spec) for spec in config_settings.get("hooks", [])]
+        except (AttributeError, ValueError) as error:
+            args.error("invalid hook - " + str(error))
+    if not is_first_execution:
+        preferences.load_preferences()
     should_save_preferences = False
     if p_args.domain:
         preferences.set_domain(p_args.domain)
@@ -160,6 +912,14 @@ def parser():
     if p_args.name:
         preferences.set_name(p_args.name)
         should_save_preferences = True
+    if p_args.ipv6:
+        preferences.enable_ipv6(True)
+        should_save_preferences = True
+    for domain, name in p_args.record:
+        preferences.add_record(domain, name, p_args.proxied)
+        if p_args.ipv6:
+            preferences.add_record(domain, name, p_args.proxied, record_type="AAAA")
+        should_save_preferences = True
     if "time" in p_args:
         preferences.set_time(p_args.time * 60)
         should_save_preferences = True
@@ -172,6 +932,22 @@ def parser():
     if p_args.mail:
         preferences.set_mail(p_args.mail)
         should_save_preferences = True
+    if p_args.token:
+        preferences.set_token(p_args.token)
+        should_save_preferences = True
+    if p_args.zone_token:
+        preferences.set_zone_tokens(dict(preferences.get_zone_tokens(), **dict(p_args.zone_token)))
+        should_save_preferences = True
+    if config is not None:
+        for key, setter in (("key", preferences.set_key), ("mail", preferences.set_mail),
+                            ("token", preferences.set_token), ("zone_tokens", preferences.set_zone_tokens)):
+            if key in config_settings:
+                setter(config_settings[key])
+        for spec in config.get_records().values():
+            preferences.add_record(spec.domain, spec.name, spec.proxied, spec.type)
+        should_save_preferences = True
+        if get_config_interval(config) and "time" not in p_args:
+            preferences.set_time(get_config_interval(config))
     if p_args.no_daemonize:
         preferences.run_as_daemon(not p_args.no_daemonize)
     if "pid" in p_args:
@@ -186,28 +962,96 @@ def parser():
     else:
         if preferences.get_log_file() is None:
             preferences.set_log_file("/var/log/cloudflare.log")
+    get_session().configure(max_connections=max(p_args.connections, p_args.concurrency)
+                            if p_args.asyncio else p_args.connections,
+                            connect_timeout=min(5.0, p_args.timeout),
+                            read_timeout=p_args.timeout)
+    get_rate_limiter().configure(p_args.rate_limit, window=300.0)
+    resilience = {"max_retries": max(p_args.max_retries, 0),
+                  "deadline": p_args.retry_deadline,
+                  "threshold": max(p_args.failure_threshold, 0),
+                  "cooldown": p_args.failure_cooldown}
+    configure_resilience(**resilience)
+    get_ip_oracle().configure(p_args.shared_ip, ttl=p_args.shared_ip_ttl)
+    dns_verification = None
+    if p_args.verify_dns:
+        dns_verification = {"servers": p_args.dns_server,
+                            "timeout": min(2.0, p_args.timeout),
+                            "propagation_timeout": p_args.propagation_timeout}
+    get_exporter().configure(port=p_args.metrics_port,
+                             address=p_args.metrics_address,
+                             textfile=path.abspath(p_args.metrics_file) if p_args.metrics_file else None)
+    for version in RECORD_TYPES:
+        set_ip_discovery(IPDiscovery(default_providers(version),
+                                     quorum=p_args.ip_quorum,
+                                     parallel=max(3, p_args.ip_quorum),
+                                     timeout=p_args.timeout,
+                                     version=version), version)
+    sweep_interval = p_args.sweep_interval * 60 if p_args.sweep_interval > 0 else None
+    sharding = None
+    if p_args.workers > 1:
+        sharding = {"workers": p_args.workers,
+                    "connections": p_args.connections,
+                    "connect_timeout": min(5.0, p_args.timeout),
+                    "read_timeout": p_args.timeout,
+                    "rate_limit": p_args.rate_limit,
+                    "debounce": p_args.debounce,
+                    "dns_verification": dns_verification,
+                    "resilience": resilience,
+                    # an update reads, batches and writes in a few rounds of requests, each one bounded by the retry
+                    # deadline - a worker still busy after that is hung, so it is restarted
+                    "timeout": 4 * max(p_args.retry_deadline, p_args.timeout)}
     user = p_args.user
     group = p_args.group
 
-    if p_args.preferences:
-        if not (p_args.domain and p_args.name and p_args.key and p_args.mail):
+    if is_first_execution and config is None:
+        if not (p_args.domain and p_args.name and (p_args.key and p_args.mail or uses_token)):
             print("You must provide the required params for a new preferences file")
     if should_save_preferences:
         preferences.save_preferences(p_args.preferences)
-    if not is_first_execution:
-        preferences.load_preferences()
-    if preferences.is_record_behind_proxy() != p_args.proxied:
+    if config is None and preferences.is_record_behind_proxy() != p_args.proxied:
         preferences.record_behind_proxy(p_args.proxied)
         preferences.save_preferences()
-    file_handler = setup_logging("cloudflareLogger", preferences.get_log_file(), level=WARNING)
+    if p_args.check_only and not is_first_execution and not has_ip_changed(config):
+        preferences.close()
+        exit(0)
+    # only needed when the records are checked - a "--check_only" run that finds the same IP never imports them
+    from .hooks import get_hook_dispatcher
+    from .logging_utils import setup_logging
+    from .network import get_dns_verifier
+    from .network import get_update_planner
+
+    get_update_planner().configure(debounce=p_args.debounce)
+    if dns_verification is not None:
+        get_dns_verifier().configure(log=getLogger("cloudflareLogger"), **dns_verification)
+    get_hook_dispatcher().configure(hooks,
+                                    workers=p_args.hook_workers,
+                                    timeout=p_args.hook_timeout,
+                                    retries=p_args.hook_retries,
+                                    log=getLogger("cloudflareLogger"))
+    scheduler = AdaptiveScheduler(base_interval=preferences.get_time(),
+                                  max_interval=p_args.max_time * 60 if p_args.max_time else None,
+                                  jitter=p_args.jitter)
+    # the state store is opened again by the daemon process
+    preferences.close()
+    file_handler = setup_logging("cloudflareLogger", preferences.get_log_file(), level=WARNING,
+                                 max_bytes=int(p_args.log_max_size * 1024 * 1024),
+                                 rotate_every=p_args.log_rotation * 3600 if p_args.log_rotation else None,
+                                 backup_count=p_args.log_backups,
+                                 json_lines=p_args.log_json)
     fds = [file_handler.stream.fileno()]
     pid_dir = path.dirname(path.abspath(preferences.get_pid_file()))
     if not path.exists(pid_dir):
         makedirs(path=pid_dir, exist_ok=True)
 
+    from daemonize import Daemonize
+
     daemon = Daemonize(app="pyCloudFlareDaemon",
                        pid=preferences.get_pid_file(),
-                       action=main,
+                       action=partial(run_async, p_args.concurrency, p_args.watch, scheduler, config, p_args.batch_size,
+                                      sweep_interval=sweep_interval)
+                       if p_args.asyncio else partial(main, p_args.watch, scheduler, config, p_args.batch_size,
+                                                      sharding, sweep_interval=sweep_interval),
                        keep_fds=fds,
                        user=user,
                        group=group,
@@ -0,0 +1,34 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+# hooks are optional - the dispatcher and subprocess are only imported when one of these names is first used
+_LAZY_IMPORTS = {"ALL_EVENTS": "dispatcher",
+                 "EVENTS": "dispatcher",
+                 "HookDispatcher": "dispatcher",
+                 "HookError": "dispatcher",
+                 "ScriptHook": "dispatcher",
+                 "WebhookHook": "dispatcher",
+                 "create_hook": "dispatcher",
+                 "get_hook_dispatcher": "dispatcher"}
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    from importlib import import_module
+
+    value = getattr(import_module("{0}.{1}".format(__name__, _LAZY_IMPORTS[name])), name)
+    globals()[name] = value
+    return value
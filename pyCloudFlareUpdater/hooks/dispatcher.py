@@ -0,0 +1,268 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import queue
+import shlex
+import subprocess
+import threading
+from time import monotonic
+from time import sleep
+from time import time
+from urllib.error import HTTPError
+
+from ..metrics.instruments import HOOK_DURATION
+from ..metrics.instruments import HOOK_RUNS
+from ..network.session import HTTPSession
+
+IP_CHANGED = "ip_changed"
+RECORDS_UPDATED = "records_updated"
+UPDATE_FAILED = "update_failed"
+EVENTS = (IP_CHANGED, RECORDS_UPDATED, UPDATE_FAILED)
+ALL_EVENTS = "all"
+
+
+class HookError(Exception):
+    pass
+
+
+class Hook(object):
+    """Something run when one of its events happens - "all" matches every event."""
+
+    def __init__(self, events=ALL_EVENTS, timeout=None, retries=None):
+        events = [events] if isinstance(events, str) else list(events)
+        for event in events:
+            if event != ALL_EVENTS and event not in EVENTS:
+                raise ValueError("Unknown hook event \"{0}\" - use one of: {1}"
+                                 .format(event, ", ".join(EVENTS + (ALL_EVENTS,))))
+        self.__events = frozenset(events)
+        self.__timeout = timeout
+        self.__retries = retries
+
+    def matches(self, event) -> bool:
+        return ALL_EVENTS in self.__events or event in self.__events
+
+    def get_timeout(self, default):
+        return default if self.__timeout is None else self.__timeout
+
+    def get_retries(self, default):
+        return default if self.__retries is None else self.__retries
+
+    def get_name(self) -> str:
+        raise NotImplementedError
+
+    def run(self, payload: dict, timeout, session):
+        """Runs the hook once - "session" keeps the connections of the webhooks, apart from the CloudFlare ones."""
+        raise NotImplementedError
+
+    def is_retriable(self, error) -> bool:
+        return True
+
+
+class ScriptHook(Hook):
+    """
+    Runs a command (without a shell) with the event as JSON on its standard input and as CLOUDFLARE_DDNS_*
+    environment variables. A non-zero exit code is a failure.
+    """
+
+    def __init__(self, command, events=ALL_EVENTS, timeout=None, retries=None):
+        super().__init__(events, timeout, retries)
+        self.__args = shlex.split(command) if isinstance(command, str) else list(command)
+        if not self.__args:
+            raise ValueError("Empty hook command")
+
+    def get_name(self) -> str:
+        return os.path.basename(self.__args[0])
+
+    def run(self, payload: dict, timeout, session):
+        env = dict(os.environ)
+        for key, value in payload.items():
+            if isinstance(value, (list, tuple)):
+                value = " ".join(str(item) for item in value)
+            elif isinstance(value, dict):
+                value = json.dumps(value)
+            env["CLOUDFLARE_DDNS_" + key.upper()] = "" if value is None else str(value)
+        try:
+            process = subprocess.run(self.__args,
+                                     input=json.dumps(payload).encode("utf-8"),
+                                     stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.PIPE,
+                                     env=env,
+                                     timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise HookError("timed out after {0:.1f} seconds".format(timeout))
+        if process.returncode != 0:
+            output = process.stderr.decode("utf-8", "replace").strip().splitlines()
+            raise HookError("exited with code {0}{1}".format(process.returncode,
+                                                            " - " + output[-1] if output else ""))
+
+
+class WebhookHook(Hook):
+    """POSTs the event as JSON to an URL. Client errors (4xx but 429) are not retried."""
+
+    def __init__(self, url, events=ALL_EVENTS, timeout=None, retries=None):
+        super().__init__(events, timeout, retries)
+        if not url.startswith(("http://", "https://")):
+            raise ValueError("Invalid webhook URL \"{0}\"".format(url))
+        self.__url = url
+
+    def get_name(self) -> str:
+        return self.__url.split("/")[2]
+
+    def run(self, payload: dict, timeout, session):
+        session.request("POST", self.__url,
+                        data=json.dumps(payload).encode("utf-8"),
+                        headers={"Content-Type": "application/json"},
+                        deadline=monotonic() + timeout)
+
+    def is_retriable(self, error) -> bool:
+        return not isinstance(error, HTTPError) or error.code >= 500 or error.code == 429
+
+
+def create_hook(spec: dict) -> Hook:
+    """Creates a hook from a configuration entry like {"event": "ip_changed", "command": "..."} or {"url": "..."}."""
+    options = {"events": spec.get("event", spec.get("events", ALL_EVENTS)),
+               "timeout": spec.get("timeout"),
+               "retries": spec.get("retries")}
+    if spec.get("command"):
+        return ScriptHook(spec["command"], **options)
+    if spec.get("url"):
+        return WebhookHook(spec["url"], **options)
+    raise ValueError("A hook needs either a \"command\" or an \"url\"")
+
+
+class HookDispatcher(object):
+    """
+    Runs the hooks of every emitted event at a bounded pool of worker threads, so a slow or failing hook never delays
+    the record updates. Events are dropped (and counted) when too many are waiting, instead of blocking the caller.
+    Webhooks have their own HTTPSession, so they never take connections from the CloudFlare pool nor count in its stats.
+    """
+
+    def __init__(self, hooks=None, workers=4, timeout=10.0, retries=2, max_pending=256):
+        self.__lock = threading.Condition()
+        self.__queue = None
+        self.__threads = []
+        self.__pending = 0
+        self.__log = None
+        self.__session = HTTPSession(max_connections=workers)
+        self.__stats = {"succeeded": 0, "failed": 0, "dropped": 0}
+        self.configure(hooks, workers, timeout, retries, max_pending)
+
+    def configure(self, hooks=None, workers=4, timeout=10.0, retries=2, max_pending=256, log=None):
+        self.__hooks = list(hooks or [])
+        self.__workers = max(workers, 1)
+        # a connection for each worker at most
+        self.__session.configure(max_connections=self.__workers)
+        self.__timeout = timeout
+        self.__retries = max(retries, 0)
+        self.__max_pending = max_pending
+        self.__log = log
+
+    def has_hooks(self) -> bool:
+        return bool(self.__hooks)
+
+    def _start(self):
+        # the worker threads are started on the first event - they would not survive the fork of the daemon
+        if self.__queue is None:
+            self.__queue = queue.Queue(self.__max_pending)
+        while len(self.__threads) < self.__workers:
+            thread = threading.Thread(target=self._work, name="hooks-{0}".format(len(self.__threads)), daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def emit(self, event, **data):
+        hooks = [hook for hook in self.__hooks if hook.matches(event)]
+        if not hooks:
+            return
+        payload = dict(data, event=event, time=int(time()))
+        with self.__lock:
+            self._start()
+            for hook in hooks:
+                try:
+                    self.__queue.put_nowait((hook, payload))
+                except queue.Full:
+                    self.__stats["dropped"] += 1
+                    HOOK_RUNS.labels(event, "dropped").inc()
+                    self._warn("Too many hooks waiting - \"{0}\" dropped for event \"{1}\""
+                               .format(hook.get_name(), event))
+                    continue
+                self.__pending += 1
+
+    def _work(self):
+        while True:
+            hook, payload = self.__queue.get()
+            try:
+                self._execute(hook, payload)
+            finally:
+                with self.__lock:
+                    self.__pending -= 1
+                    self.__lock.notify_all()
+
+    def _execute(self, hook, payload):
+        event = payload["event"]
+        timeout = hook.get_timeout(self.__timeout)
+        retries = hook.get_retries(self.__retries)
+        for attempt in range(retries + 1):
+            start = monotonic()
+            try:
+                hook.run(payload, timeout, self.__session)
+            except Exception as error:
+                HOOK_DURATION.labels(event, "failure").observe(monotonic() - start)
+                if attempt < retries and hook.is_retriable(error):
+                    sleep(min(2 ** attempt, 30))
+                    continue
+                with self.__lock:
+                    self.__stats["failed"] += 1
+                HOOK_RUNS.labels(event, "failure").inc()
+                self._warn("Hook \"{0}\" failed for event \"{1}\" after {2} attempt{3} - {4}"
+                           .format(hook.get_name(), event, attempt + 1, 's' if attempt else '', error))
+                return
+            HOOK_DURATION.labels(event, "success").observe(monotonic() - start)
+            with self.__lock:
+                self.__stats["succeeded"] += 1
+            HOOK_RUNS.labels(event, "success").inc()
+            return
+
+    def _warn(self, message):
+        if self.__log is not None:
+            self.__log.warning(message)
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__stats, pending=self.__pending)
+
+    def get_session(self) -> HTTPSession:
+        return self.__session
+
+    def close(self, timeout=None):
+        """Waits, at most the given seconds, for the hooks already emitted - e.g. before a single check exits."""
+        deadline = monotonic() + (self.__timeout if timeout is None else timeout)
+        with self.__lock:
+            while self.__pending:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self._warn("{0} hook{1} still running - not waiting for them"
+                               .format(self.__pending, 's' if self.__pending > 1 else ''))
+                    break
+                self.__lock.wait(remaining)
+        self.__session.close()
+
+
+_dispatcher = HookDispatcher()
+
+
+def get_hook_dispatcher() -> HookDispatcher:
+    return _dispatcher
@@ -13,6 +13,18 @@
 #
 #     You should have received a copy of the GNU General Public License
 #    along with this program. If not, see <http://www.gnu.org/licenses/>.
-from ..logging_utils.utils import LoggingHandler
-from ..logging_utils.utils import cleanup_old_logs
-from ..logging_utils.utils import setup_logging
+# the background file handler (gzip, shutil) is only needed once the daemon starts logging, so it is loaded on first use
+_LAZY_IMPORTS = {"LoggingHandler": "utils",
+                 "setup_logging": "utils",
+                 "BackgroundFileHandler": "async_logging",
+                 "JSONFormatter": "async_logging"}
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    from importlib import import_module
+
+    value = getattr(import_module("{0}.{1}".format(__name__, _LAZY_IMPORTS[name])), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,250 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+from datetime import datetime
+from time import monotonic
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log collectors."""
+
+    def format(self, record) -> str:
+        entry = {"time": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+                 "level": record.levelname,
+                 "logger": record.name,
+                 "process": record.process,
+                 "message": record.getMessage()}
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+def compress_log(filename):
+    # an interrupted compression leaves the log untouched, so it can be compressed again later
+    with open(filename, "rb") as flog, gzip.open(filename + ".gz.tmp", "wb") as fcompressed:
+        shutil.copyfileobj(flog, fcompressed)
+    os.replace(filename + ".gz.tmp", filename + ".gz")
+    os.remove(filename)
+
+
+class BackgroundFileHandler(logging.Handler):
+    """
+    Log records are only queued by the calling thread: a background thread formats and writes them in batches, and
+    rotates the file when it grows over "max_bytes" or gets older than "rotate_every" seconds. Rotated files are
+    compressed by another thread, and only the latest "backup_count" of them are kept. Exiting does not wait for a
+    compression: the next process using the log finishes it.
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, rotate_every=None, backup_count=5, batch_size=256,
+                 flush_interval=1.0):
+        super().__init__()
+        self.__filename = os.path.abspath(filename)
+        self.__max_bytes = max_bytes
+        self.__rotate_every = rotate_every
+        self.__backup_count = backup_count
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__queue = queue.SimpleQueue()
+        self.__thread = None
+        self.__pid = None
+        self.__compressor = None
+        self.__compress_queue = queue.SimpleQueue()
+        self.__start_lock = threading.Lock()
+        self.__closed = False
+        # the previous log is appended to - it is rotated by the writer thread once it is too big or too old
+        self.stream = open(self.__filename, "a", encoding="utf-8")
+        self.__size = self.stream.tell()
+        self.__opened_at = monotonic()
+
+    def _rotated_name(self):
+        name = "{0}.{1}".format(self.__filename, datetime.now().strftime("%Y%m%d-%H%M%S"))
+        suffix = 1
+        candidate = name
+        while os.path.exists(candidate) or os.path.exists(candidate + ".gz"):
+            candidate = "{0}-{1}".format(name, suffix)
+            suffix += 1
+        return candidate
+
+    def _ensure_started(self):
+        # threads do not survive the daemon fork, so they are started by the process that logs
+        if self.__pid == os.getpid():
+            return
+        with self.__start_lock:
+            if self.__pid == os.getpid():
+                return
+            self.__queue = queue.SimpleQueue()
+            self.__compress_queue = queue.SimpleQueue()
+            self.__compressor = threading.Thread(target=self._run_compressor, name="log-compressor", daemon=True)
+            self.__compressor.start()
+            self.__thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self.__thread.start()
+            self.__pid = os.getpid()
+
+    def emit(self, record):
+        if self.__closed:
+            return
+        try:
+            # message and traceback are rendered now, as the arguments could change before being written
+            record.message = record.getMessage()
+            record.msg = record.message
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self._ensure_started()
+            self.__queue.put(record)
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            try:
+                record = self.__queue.get(timeout=self.__flush_interval)
+            except queue.Empty:
+                self._check_rotation()
+                continue
+            batch = [record]
+            while len(batch) < self.__batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write([item for item in batch if isinstance(item, logging.LogRecord)])
+            for item in batch:
+                # flush requests
+                if isinstance(item, threading.Event):
+                    item.set()
+            if None in batch:
+                return
+
+    def _write(self, records):
+        if not records:
+            return
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + "\n")
+            except Exception:
+                self.handleError(record)
+        try:
+            data = "".join(lines)
+            self.stream.write(data)
+            self.stream.flush()
+            self.__size += len(data)
+        except OSError as error:
+            sys.stderr.write("Unable to write the log file \"{0}\" - {1}\n".format(self.__filename, error))
+            return
+        self._check_rotation()
+
+    def _check_rotation(self):
+        too_big = self.__max_bytes and self.__size >= self.__max_bytes
+        too_old = self.__rotate_every and self.__size and monotonic() - self.__opened_at >= self.__rotate_every
+        if too_big or too_old:
+            self.rotate()
+
+    def rotate(self):
+        rotated = self._rotated_name()
+        try:
+            self.stream.close()
+            os.replace(self.__filename, rotated)
+        except OSError as error:
+            sys.stderr.write("Unable to rotate the log file \"{0}\" - {1}\n".format(self.__filename, error))
+            rotated = None
+        self.stream = open(self.__filename, "a", encoding="utf-8")
+        self.__size = 0
+        self.__opened_at = monotonic()
+        if rotated is not None:
+            self._compress(rotated)
+
+    def _compress(self, filename):
+        self.__compress_queue.put(filename)
+
+    def _get_backups(self) -> list:
+        directory, name = os.path.split(self.__filename)
+        rotated = re.compile(re.escape(name) + r"\.(\d{8}-\d{6})(?:-(\d+))?(\.gz)?$")
+        backups = []
+        for entry in os.scandir(directory):
+            match = rotated.match(entry.name)
+            if match:
+                # oldest first: by rotation time, then by the suffix added to names rotated at the same second
+                backups.append(((match.group(1), int(match.group(2) or 0)), entry))
+        return [entry for _, entry in sorted(backups, key=lambda backup: backup[0])]
+
+    def _prune(self):
+        # compressed or not, only the latest "backup_count" rotated logs are kept
+        backups = self._get_backups()
+        for entry in backups[:max(len(backups) - self.__backup_count, 0)]:
+            # with the partial result of an interrupted compression
+            for filename in (entry.path, entry.path + ".gz.tmp"):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+
+    def _run_compressor(self):
+        # rotated logs a previous process could not compress before exiting
+        self._prune()
+        for entry in self._get_backups():
+            if not entry.name.endswith(".gz"):
+                self._compress_and_prune(entry.path)
+        while True:
+            filename = self.__compress_queue.get()
+            if filename is None:
+                return
+            self._compress_and_prune(filename)
+
+    def _compress_and_prune(self, filename):
+        try:
+            compress_log(filename)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            sys.stderr.write("Unable to compress the log file \"{0}\" - {1}\n".format(filename, error))
+        self._prune()
+
+    def get_filename(self):
+        return self.__filename
+
+    def flush(self, timeout=5.0):
+        # waits until everything queued before is written
+        if self.__thread is not None and self.__thread.is_alive() and self.__pid == os.getpid():
+            done = threading.Event()
+            self.__queue.put(done)
+            done.wait(timeout)
+
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        if self.__thread is not None and self.__pid == os.getpid():
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__compress_queue.put(None)
+        try:
+            self.stream.close()
+        except OSError:
+            pass
+        super().close()
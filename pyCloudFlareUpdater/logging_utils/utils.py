@@ -16,34 +16,27 @@
 import logging
 
 
-def cleanup_old_logs(log_file: str):
-    import tarfile
-    import os
-
-    tar_log_filename = log_file + ".tar.gz"
-
-    if os.path.exists(log_file):
-        if os.path.exists(tar_log_filename):
-            os.remove(tar_log_filename)
-        with tarfile.open(tar_log_filename, "w:gz") as tar:
-            tar.add(log_file, arcname=os.path.basename(log_file))
-            tar.close()
-            os.remove(log_file)
-
-
 def setup_logging(logger_name: str, log_file: str, level=logging.DEBUG,
-                  formatter: str = "%(process)d - %(asctime)s | [%(levelname)s]: %(message)s"):
+                  formatter: str = "%(process)d - %(asctime)s | [%(levelname)s]: %(message)s",
+                  max_bytes: int = 10 * 1024 * 1024, rotate_every: float = None, backup_count: int = 5,
+                  json_lines: bool = False):
     from os import path
     from os import makedirs
 
+    from ..logging_utils.async_logging import BackgroundFileHandler
+    from ..logging_utils.async_logging import JSONFormatter
+
     log_dir = path.dirname(path.abspath(log_file))
     if not path.exists(log_dir):
         makedirs(log_dir)
 
-    cleanup_old_logs(log_file)
     new_logging = logging.getLogger(logger_name)
-    logging_formatter = logging.Formatter(formatter)
-    logging_file_handler = logging.FileHandler(log_file, mode="w")
+    logging_formatter = JSONFormatter() if json_lines else logging.Formatter(formatter)
+    # the previous log is appended to, and rotated (and compressed in background) once it is too big or too old
+    logging_file_handler = BackgroundFileHandler(log_file,
+                                                 max_bytes=max_bytes,
+                                                 rotate_every=rotate_every,
+                                                 backup_count=backup_count)
 
     logging_file_handler.setFormatter(logging_formatter)
 
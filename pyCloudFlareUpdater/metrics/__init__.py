@@ -0,0 +1,26 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from ..metrics.registry import Counter
+from ..metrics.registry import Gauge
+from ..metrics.registry import Histogram
+from ..metrics.registry import MetricsRegistry
+from ..metrics.registry import get_registry
+from ..metrics.exporter import MetricsExporter
+from ..metrics.exporter import get_exporter
+from ..metrics.instruments import count_error
+from ..metrics.instruments import record_check
+from ..metrics.instruments import record_schedule
+from ..metrics.instruments import set_managed_records
@@ -0,0 +1,101 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import threading
+
+from ..metrics.registry import get_registry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _create_server(address, port, registry):
+    # http.server takes long to import, so it is only loaded when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler
+    from http.server import ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    return server
+
+
+class MetricsExporter(object):
+    """
+    Exposes the metrics through a local HTTP endpoint (for Prometheus to scrape) and/or writes them to a file for the
+    node_exporter textfile collector. Nothing is done unless one of them is configured.
+    """
+
+    def __init__(self, registry=None):
+        self.__registry = registry if registry is not None else get_registry()
+        self.__address = None
+        self.__port = None
+        self.__textfile = None
+        self.__server = None
+
+    def configure(self, port=None, address="127.0.0.1", textfile=None):
+        self.__port = port
+        self.__address = address
+        self.__textfile = textfile
+
+    def is_enabled(self) -> bool:
+        return self.__port is not None or self.__textfile is not None
+
+    def start(self):
+        if self.__port is None or self.__server is not None:
+            return
+        self.__server = _create_server(self.__address, self.__port, self.__registry)
+        threading.Thread(target=self.__server.serve_forever, name="metrics", daemon=True).start()
+
+    def get_address(self):
+        return self.__server.server_address if self.__server is not None else None
+
+    def write_textfile(self):
+        if self.__textfile is None:
+            return
+        # the collector could read a partially written file, so it is replaced at once
+        temp_file = "{0}.{1}.tmp".format(self.__textfile, os.getpid())
+        with open(temp_file, "w") as fmetrics:
+            fmetrics.write(self.__registry.render())
+        os.replace(temp_file, self.__textfile)
+
+    def close(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+        self.write_textfile()
+
+
+_exporter = MetricsExporter()
+
+
+def get_exporter() -> MetricsExporter:
+    return _exporter
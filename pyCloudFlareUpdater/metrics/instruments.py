@@ -0,0 +1,147 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from time import monotonic
+from time import time
+
+from ..metrics.registry import Counter
+from ..metrics.registry import Gauge
+from ..metrics.registry import get_registry
+
+_registry = get_registry()
+
+IP_LOOKUP_DURATION = _registry.histogram("cloudflare_ddns_ip_lookup_duration_seconds",
+                                         "Time taken by each public IP provider to answer.",
+                                         labels=("provider", "result"))
+API_REQUEST_DURATION = _registry.histogram("cloudflare_ddns_api_request_duration_seconds",
+                                           "Time taken by the CloudFlare API to answer, by HTTP method.",
+                                           labels=("method",))
+API_REQUESTS = _registry.counter("cloudflare_ddns_api_requests_total",
+                                 "CloudFlare API requests, by HTTP method and status code (or error).",
+                                 labels=("method", "code"))
+RECORD_UPDATES = _registry.counter("cloudflare_ddns_record_updates_total",
+                                   "Records written to CloudFlare, by record type.",
+                                   labels=("type",))
+PROPAGATION_DURATION = _registry.histogram("cloudflare_ddns_propagation_seconds",
+                                           "Time since a record was written until its name servers returned the "
+                                           "new IP.",
+                                           labels=("type",),
+                                           buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120))
+DRIFTED_RECORDS = _registry.counter("cloudflare_ddns_drifted_records_total",
+                                    "Records found changed at CloudFlare by someone else during the reconciliation "
+                                    "sweeps, by record type.",
+                                    labels=("type",))
+HOOK_RUNS = _registry.counter("cloudflare_ddns_hook_runs_total",
+                              "Hooks run for an event, by result - succeeded, failed after its retries or dropped "
+                              "because too many were waiting.",
+                              labels=("event", "result"))
+HOOK_DURATION = _registry.histogram("cloudflare_ddns_hook_duration_seconds",
+                                    "Time taken by each attempt to run a hook (script or webhook).",
+                                    labels=("event", "result"))
+ERRORS = _registry.counter("cloudflare_ddns_errors_total",
+                           "Failed checks and updates, by error class.",
+                           labels=("class",))
+CHECK_DURATION = _registry.histogram("cloudflare_ddns_check_duration_seconds",
+                                     "Time taken by a whole check (public IP lookup and record updates).")
+LAST_SUCCESS = _registry.gauge("cloudflare_ddns_last_success_timestamp_seconds",
+                               "Unix time of the latest check that completed without errors.")
+NEXT_CHECK = _registry.gauge("cloudflare_ddns_next_check_seconds",
+                             "Delay until the next check chosen by the scheduler (jitter included).")
+CHECK_INTERVAL = _registry.gauge("cloudflare_ddns_check_interval_seconds",
+                                 "Current interval between checks - lower after changes or failures, higher while the "
+                                 "IP does not change.")
+MANAGED_RECORDS = _registry.gauge("cloudflare_ddns_records",
+                                  "Records managed by the daemon.")
+
+_last_success = [None]
+
+
+def count_error(error):
+    ERRORS.labels(error.__class__.__name__).inc()
+
+
+def record_check(start, succeeded):
+    CHECK_DURATION.observe(monotonic() - start)
+    if succeeded:
+        _last_success[0] = monotonic()
+        LAST_SUCCESS.set(time())
+
+
+def record_schedule(delay, interval):
+    NEXT_CHECK.set(delay)
+    CHECK_INTERVAL.set(interval)
+
+
+def set_managed_records(count):
+    MANAGED_RECORDS.set(count)
+
+
+def _collect_runtime_stats() -> list:
+    from ..network.circuit_breaker import get_circuit_breakers
+    from ..network.ip_oracle import get_ip_oracle
+    from ..network.rate_limit import get_rate_limiter
+    from ..network.session import get_session
+    from ..network.update_planner import get_update_planner
+
+    since_success = Gauge("cloudflare_ddns_seconds_since_last_success",
+                          "Seconds since the latest check that completed without errors.")
+    if _last_success[0] is not None:
+        since_success.set(monotonic() - _last_success[0])
+
+    rate_limiter = get_rate_limiter().get_stats()
+    waits = Counter("cloudflare_ddns_rate_limit_waits_total",
+                    "CloudFlare requests delayed by the rate limiter.")
+    waits.inc(rate_limiter["waits"])
+    waited = Counter("cloudflare_ddns_rate_limit_wait_seconds_total",
+                     "Time spent waiting for the rate limiter.")
+    waited.inc(rate_limiter["waited_seconds"])
+    throttled = Counter("cloudflare_ddns_rate_limit_throttled_total",
+                        "Times CloudFlare answered 429 (too many requests).")
+    throttled.inc(rate_limiter["throttled"])
+
+    session = get_session().get_stats()
+    connections = Counter("cloudflare_ddns_http_connections_total",
+                          "HTTP connections opened, reused from the keep-alive pool or dropped.",
+                          labels=("state",))
+    for state in ("created", "reused", "dropped"):
+        connections.labels(state).inc(session["connections_" + state])
+    idle = Gauge("cloudflare_ddns_http_idle_connections",
+                 "HTTP connections currently idle at the keep-alive pool.")
+    idle.set(session["connections_idle"])
+    planned = Counter("cloudflare_ddns_planned_updates_total",
+                      "Outdated records checked by the update planner: written, already up to date (suppressed) "
+                      "or waiting for a flapping IP to settle (deferred).",
+                      labels=("result",))
+    for result, count in get_update_planner().get_stats().items():
+        planned.labels(result).inc(count)
+    shared_ip = Counter("cloudflare_ddns_shared_ip_lookups_total",
+                        "Public IP lookups answered by the host shared IP file or sent to the IP providers.",
+                        labels=("source",))
+    for source, count in get_ip_oracle().get_stats().items():
+        shared_ip.labels(source).inc(count)
+    circuit_open = Gauge("cloudflare_ddns_circuit_open",
+                         "Whether the circuit breaker of an endpoint is open (1), probing (0.5) or closed (0).",
+                         labels=("endpoint",))
+    circuit_rejections = Counter("cloudflare_ddns_circuit_rejections_total",
+                                 "Calls failed at once because the circuit breaker of the endpoint was open.",
+                                 labels=("endpoint",))
+    for endpoint, stats in get_circuit_breakers().get_stats().items():
+        circuit_open.labels(endpoint).set({"open": 1.0, "half-open": 0.5}.get(stats["state"], 0.0))
+        circuit_rejections.labels(endpoint).inc(stats["rejected"])
+    return [since_success, waits, waited, throttled, connections, idle, planned, shared_ip, circuit_open,
+            circuit_rejections]
+
+
+_registry.register_collector(_collect_runtime_stats)
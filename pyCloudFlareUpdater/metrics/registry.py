@@ -0,0 +1,309 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import threading
+from bisect import bisect_left
+
+# request latencies are expected between a few milliseconds and the network timeout
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join("{0}=\"{1}\"".format(name, _escape(value)) for name, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    TYPE = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.label_names):
+            raise ValueError("{0} expects the labels {1}".format(self.name, self.label_names))
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def get_values(self) -> dict:
+        """The value of every child, by its label values - see "MetricsRegistry.snapshot"."""
+        raise NotImplementedError
+
+    def add_values(self, values):
+        raise NotImplementedError
+
+    def _samples(self, values, child) -> list:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = ["# HELP {0} {1}".format(self.name, self.documentation), "# TYPE {0} {1}".format(self.name, self.TYPE)]
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            for suffix, extra, value in self._samples(values, child):
+                lines.append("{0}{1}{2} {3}".format(self.name, suffix,
+                                                    _format_labels(self.label_names, values, extra),
+                                                    _format_value(value)))
+        return "\n".join(lines)
+
+
+class _Value(object):
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def get_values(self) -> dict:
+        with self._lock:
+            return {values: child.value for values, child in self._children.items()}
+
+    def add_values(self, values):
+        for labels, amount in values.items():
+            self.labels(*labels).inc(amount)
+
+    def _samples(self, values, child):
+        return [("", (), child.value)]
+
+
+class Gauge(_Metric):
+    TYPE = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def _samples(self, values, child):
+        return [("", (), child.value)]
+
+
+class _Buckets(object):
+    __slots__ = ("bounds", "counts", "total", "count", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def add(self, counts, total, count):
+        with self.lock:
+            self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+            self.total += total
+            self.count += count
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def get_values(self) -> dict:
+        with self._lock:
+            children = list(self._children.items())
+        values = {}
+        for labels, child in children:
+            with child.lock:
+                values[labels] = (tuple(child.counts), child.total, child.count)
+        return values
+
+    def add_values(self, values):
+        for labels, (counts, total, count) in values.items():
+            self.labels(*labels).add(counts, total, count)
+
+    def _samples(self, values, child):
+        with child.lock:
+            counts = list(child.counts)
+            total, count = child.total, child.count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            samples.append(("_bucket", (("le", _format_value(float(bound))),), cumulative))
+        samples.append(("_sum", (), total))
+        samples.append(("_count", (), count))
+        return samples
+
+
+def _subtract(value, previous):
+    if previous is None:
+        return value
+    if isinstance(value, tuple):
+        counts, total, count = value
+        return (tuple(mine - theirs for mine, theirs in zip(counts, previous[0])), total - previous[1],
+                count - previous[2])
+    return value - previous
+
+
+def _add(value, other):
+    if isinstance(value, tuple):
+        return (tuple(mine + theirs for mine, theirs in zip(value[0], other[0])), value[1] + other[1],
+                value[2] + other[2])
+    return value + other
+
+
+def get_changes(snapshot, previous) -> dict:
+    """
+    What changed between two snapshots of a registry, for "MetricsRegistry.merge" - a process that restarted starts
+    again from an empty previous snapshot.
+    """
+    changes = {}
+    for name, values in snapshot.items():
+        old = previous.get(name, {})
+        for labels, value in values.items():
+            change = _subtract(value, old.get(labels))
+            # histograms are (bucket counts, sum, count)
+            if (change[2] if isinstance(change, tuple) else change):
+                changes.setdefault(name, {})[labels] = change
+    return changes
+
+
+class MetricsRegistry(object):
+    """
+    In-process metrics, rendered with the Prometheus text format. Besides the metrics updated by the code, collectors
+    (callables returning metrics) are run on every render for values already kept elsewhere, like the session stats.
+    The counters and histograms of other processes (the shard workers) are added with "merge".
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__metrics = {}
+        self.__collectors = []
+        # the merged values of collected metrics, added to them on every render
+        self.__merged = {}
+
+    def _get_or_create(self, cls, name, documentation, labels, **kwargs):
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = self.__metrics[name] = cls(name, documentation, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError("Metric \"{0}\" is already registered as a {1}".format(name, metric.TYPE))
+            return metric
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labels, buckets=buckets)
+
+    def register_collector(self, collector):
+        with self.__lock:
+            self.__collectors.append(collector)
+
+    def _collect(self) -> list:
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+            collectors = list(self.__collectors)
+        for collector in collectors:
+            for metric in collector():
+                with self.__lock:
+                    merged = dict(self.__merged.get(metric.name, {}))
+                if merged:
+                    metric.add_values(merged)
+                metrics.append(metric)
+        return metrics
+
+    def snapshot(self) -> dict:
+        """
+        The values of every counter and histogram, collected ones included, by metric name and label values. Gauges
+        are left out - the gauges of several processes do not add up.
+        """
+        return {metric.name: metric.get_values() for metric in self._collect() if not isinstance(metric, Gauge)}
+
+    def merge(self, changes):
+        """Adds the changes of the snapshots of another process (see "get_changes") to this registry."""
+        for name, values in changes.items():
+            with self.__lock:
+                metric = self.__metrics.get(name)
+                if metric is None:
+                    merged = self.__merged.setdefault(name, {})
+                    for labels, value in values.items():
+                        merged[labels] = _add(merged[labels], value) if labels in merged else value
+            if metric is not None:
+                metric.add_values(values)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._collect()) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
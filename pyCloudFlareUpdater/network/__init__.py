@@ -13,5 +13,63 @@
 #
 #     You should have received a copy of the GNU General Public License
 #    along with this program. If not, see <http://www.gnu.org/licenses/>.
-from ..network.network_utils import CloudFlare
-from ..network.network_utils import get_machine_public_ip
+# every run mode needs a different part of the package (e.g. "--check_only" only looks up the public IP), so the
+# submodules are only imported when one of their names is first used
+_LAZY_IMPORTS = {"CircuitBreaker": "circuit_breaker",
+                 "CircuitBreakers": "circuit_breaker",
+                 "CircuitOpenError": "circuit_breaker",
+                 "RetryPolicy": "circuit_breaker",
+                 "configure_resilience": "circuit_breaker",
+                 "get_circuit_breakers": "circuit_breaker",
+                 "get_retry_policy": "circuit_breaker",
+                 "Credentials": "credentials",
+                 "DNSVerifier": "dns_verifier",
+                 "get_dns_verifier": "dns_verifier",
+                 "SharedIPCache": "ip_oracle",
+                 "get_ip_oracle": "ip_oracle",
+                 "DNSProvider": "ip_providers",
+                 "HTTPEchoProvider": "ip_providers",
+                 "IPDiscovery": "ip_providers",
+                 "IPProvider": "ip_providers",
+                 "InterfaceProvider": "ip_providers",
+                 "default_providers": "ip_providers",
+                 "get_ip_discovery": "ip_providers",
+                 "set_ip_discovery": "ip_providers",
+                 "AddressWatcher": "ip_watcher",
+                 "NetlinkAddressWatcher": "ip_watcher",
+                 "ProcAddressWatcher": "ip_watcher",
+                 "create_address_watcher": "ip_watcher",
+                 "CloudFlare": "network_utils",
+                 "RECORD_TYPES": "network_utils",
+                 "UNKNOWN_IP": "network_utils",
+                 "cloudflare_headers": "network_utils",
+                 "cloudflare_request": "network_utils",
+                 "cloudflare_send": "network_utils",
+                 "cloudflare_token_headers": "network_utils",
+                 "get_machine_public_ip": "network_utils",
+                 "is_record_not_found": "network_utils",
+                 "is_transient": "network_utils",
+                 "record_type_of": "network_utils",
+                 "IdentifierCache": "identifier_cache",
+                 "TokenBucket": "rate_limit",
+                 "get_rate_limiter": "rate_limit",
+                 "RecordIndex": "record_index",
+                 "Record": "record_set",
+                 "RecordSet": "record_set",
+                 "HTTPSession": "session",
+                 "get_session": "session",
+                 "UpdatePlanner": "update_planner",
+                 "get_update_planner": "update_planner",
+                 "AsyncRecordSet": "async_network_utils",
+                 "CancellableTimer": "async_network_utils",
+                 "ShardedRecordSet": "sharded_record_set"}
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    from importlib import import_module
+
+    value = getattr(import_module("{0}.{1}".format(__name__, _LAZY_IMPORTS[name])), name)
+    globals()[name] = value
+    return value
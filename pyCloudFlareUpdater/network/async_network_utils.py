@@ -0,0 +1,104 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from ..network.network_utils import get_machine_public_ip
+
+
+async def _run(executor, function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(function, *args, **kwargs))
+
+
+class AsyncRecordSet(object):
+    """
+    Runs the update of a RecordSet step by step from an executor, with the record reads and the writes left out of the
+    batches issued concurrently - at most "concurrency" requests in flight.
+    """
+
+    def __init__(self, records, concurrency=8):
+        self.__records = records
+        self.__concurrency = concurrency
+        self.__executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cloudflare")
+        self.__semaphore = None
+
+    def get_records(self):
+        return self.__records
+
+    async def _limited(self, function, *args):
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.__concurrency)
+        async with self.__semaphore:
+            return await _run(self.__executor, function, *args)
+
+    async def _gather(self, function, records, *args):
+        results = await asyncio.gather(*(self._limited(function, record, *args) for record in records),
+                                       return_exceptions=True)
+        return list(zip(records, results))
+
+    async def sweep(self):
+        return await _run(self.__executor, self.__records.sweep)
+
+    async def get_public_ip(self, version=4):
+        return await self._limited(get_machine_public_ip, version)
+
+    async def update(self, ip):
+        records = self.__records
+        reads = await self._gather(records.resolve, await _run(self.__executor, records.get_unread, ip))
+        outdated, results = await _run(self.__executor, records.get_outdated, ip, reads)
+        outdated = await _run(self.__executor, records.select_writes, outdated, ip)
+        written, remaining = await _run(self.__executor, records.write_batches, outdated, ip)
+        written += await self._gather(records.write, remaining, ip)
+        return await _run(self.__executor, records.complete_update, ip, written, results)
+
+    def close(self):
+        self.__records.close()
+        self.__executor.shutdown(wait=False)
+
+
+class CancellableTimer(object):
+    """An asyncio sleep that can be interrupted at any time by calling "cancel" (stop) or "wake" (check now)."""
+
+    def __init__(self):
+        self.__cancelled = None
+        self.__woken = None
+
+    def _events(self):
+        if self.__cancelled is None:
+            self.__cancelled = asyncio.Event()
+            self.__woken = asyncio.Event()
+        return self.__cancelled, self.__woken
+
+    async def sleep(self, seconds) -> bool:
+        cancelled, woken = self._events()
+        waiters = [asyncio.ensure_future(cancelled.wait()), asyncio.ensure_future(woken.wait())]
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        woken.clear()
+        return not done
+
+    def wake(self):
+        self._events()[1].set()
+
+    def cancel(self):
+        self._events()[0].set()
+
+    def is_cancelled(self) -> bool:
+        return self.__cancelled is not None and self.__cancelled.is_set()
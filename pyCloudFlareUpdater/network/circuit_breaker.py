@@ -0,0 +1,173 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import random
+import threading
+from time import monotonic
+from urllib.error import URLError
+
+CLOSED = "closed"
+HALF_OPEN = "half-open"
+OPEN = "open"
+
+
+class CircuitOpenError(URLError):
+    """The endpoint failed too many times in a row - it is not contacted until its cooldown ends."""
+
+
+class CircuitBreaker(object):
+    """
+    Counts the consecutive failures of an endpoint. After "threshold" of them the circuit opens and every call fails
+    at once for "cooldown" seconds. Then a single probe is let through (half-open): if it works the circuit closes,
+    otherwise it opens again for twice the time, up to "max_cooldown".
+    """
+
+    def __init__(self, name, threshold=5, cooldown=30.0, max_cooldown=600.0):
+        self.__name = name
+        self.__lock = threading.Lock()
+        self.__state = CLOSED
+        self.__failures = 0
+        self.__opened_until = 0.0
+        self.__current_cooldown = cooldown
+        self.__stats = {"opened": 0, "rejected": 0}
+        self.configure(threshold, cooldown, max_cooldown)
+
+    def configure(self, threshold=5, cooldown=30.0, max_cooldown=600.0):
+        with self.__lock:
+            self.__threshold = threshold
+            self.__cooldown = cooldown
+            self.__max_cooldown = max(max_cooldown, cooldown)
+
+    def get_name(self):
+        return self.__name
+
+    def allow(self) -> bool:
+        with self.__lock:
+            if self.__state == CLOSED or not self.__threshold:
+                return True
+            if self.__state == OPEN and monotonic() >= self.__opened_until:
+                # the caller is the probe - the others keep failing until it finishes
+                self.__state = HALF_OPEN
+                return True
+            self.__stats["rejected"] += 1
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError("{0} is failing - not contacted for {1:.0f} more seconds"
+                                   .format(self.__name, self.get_retry_in()))
+
+    def success(self):
+        with self.__lock:
+            self.__state = CLOSED
+            self.__failures = 0
+            self.__current_cooldown = self.__cooldown
+
+    def failure(self):
+        with self.__lock:
+            self.__failures += 1
+            if self.__state == HALF_OPEN:
+                self.__current_cooldown = min(self.__current_cooldown * 2, self.__max_cooldown)
+            elif self.__state == OPEN or not self.__threshold or self.__failures < self.__threshold:
+                return
+            self.__state = OPEN
+            self.__opened_until = monotonic() + self.__current_cooldown
+            self.__stats["opened"] += 1
+
+    def release(self):
+        """Ends a probe whose result says nothing about the endpoint health (e.g. it was cancelled)."""
+        with self.__lock:
+            if self.__state == HALF_OPEN:
+                self.__state = OPEN
+
+    def get_state(self) -> str:
+        with self.__lock:
+            return self.__state
+
+    def get_retry_in(self) -> float:
+        with self.__lock:
+            return max(self.__opened_until - monotonic(), 0.0) if self.__state != CLOSED else 0.0
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__stats, state=self.__state, failures=self.__failures)
+
+
+class CircuitBreakers(object):
+    """One CircuitBreaker for each endpoint (the CloudFlare API and every public IP provider), created on first use."""
+
+    def __init__(self, threshold=5, cooldown=30.0, max_cooldown=600.0):
+        self.__lock = threading.Lock()
+        self.__breakers = {}
+        self.configure(threshold, cooldown, max_cooldown)
+
+    def configure(self, threshold=5, cooldown=30.0, max_cooldown=600.0):
+        with self.__lock:
+            self.__settings = (threshold, cooldown, max_cooldown)
+            for breaker in self.__breakers.values():
+                breaker.configure(*self.__settings)
+
+    def get(self, name) -> CircuitBreaker:
+        with self.__lock:
+            breaker = self.__breakers.get(name)
+            if breaker is None:
+                breaker = self.__breakers[name] = CircuitBreaker(name, *self.__settings)
+            return breaker
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            breakers = list(self.__breakers.values())
+        return {breaker.get_name(): breaker.get_stats() for breaker in breakers}
+
+
+class RetryPolicy(object):
+    """
+    Transient failures (network errors, HTTP 5xx, malformed answers) are retried up to "max_retries" times with a
+    growing, jittered delay, while the call stays within "deadline" seconds - retries included.
+    """
+
+    def __init__(self, max_retries=3, deadline=30.0, backoff=0.5):
+        self.configure(max_retries, deadline, backoff)
+
+    def configure(self, max_retries=3, deadline=30.0, backoff=0.5):
+        self.__max_retries = max_retries
+        self.__deadline = deadline
+        self.__backoff = backoff
+
+    def get_max_retries(self) -> int:
+        return self.__max_retries
+
+    def get_deadline(self) -> float:
+        return monotonic() + self.__deadline
+
+    def get_delay(self, attempt) -> float:
+        return self.__backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+_breakers = CircuitBreakers()
+_retry_policy = RetryPolicy()
+
+
+def get_circuit_breakers() -> CircuitBreakers:
+    return _breakers
+
+
+def get_retry_policy() -> RetryPolicy:
+    return _retry_policy
+
+
+def configure_resilience(max_retries=3, deadline=30.0, threshold=5, cooldown=30.0):
+    _retry_policy.configure(max_retries=max_retries, deadline=deadline)
+    _breakers.configure(threshold=threshold, cooldown=cooldown)
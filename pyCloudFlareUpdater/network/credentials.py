@@ -0,0 +1,62 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from ..network.network_utils import cloudflare_headers
+from ..network.network_utils import cloudflare_token_headers
+
+
+def _zone_name(domain):
+    return domain.lower().rstrip(".")
+
+
+class Credentials(object):
+    """
+    CloudFlare API credentials: the global API key and account mail, or scoped API tokens - one for every zone and/or
+    one for each group of zones. The headers of every credential are built once and shared by all the requests.
+    """
+
+    def __init__(self, key=None, mail=None, token=None, zone_tokens=None):
+        if token:
+            self.__default = cloudflare_token_headers(token)
+        elif key and mail:
+            self.__default = cloudflare_headers(key, mail)
+        else:
+            self.__default = None
+        by_token = {}
+        self.__zones = {}
+        for domain, zone_token in (zone_tokens or {}).items():
+            # zones sharing a token also share its headers
+            if zone_token not in by_token:
+                by_token[zone_token] = cloudflare_token_headers(zone_token)
+            self.__zones[_zone_name(domain)] = by_token[zone_token]
+        if self.__default is None and not self.__zones:
+            raise ValueError("No CloudFlare credentials - an API token or the API key and mail are needed")
+
+    def get_headers(self, domain=None) -> dict:
+        headers = self.__zones.get(_zone_name(domain)) if domain and self.__zones else None
+        if headers is None:
+            headers = self.__default
+            if headers is None:
+                raise ValueError("There is no CloudFlare API token for zone \"{0}\"".format(domain))
+        return headers
+
+    def get_all_headers(self) -> list:
+        headers = list({id(value): value for value in self.__zones.values()}.values())
+        if self.__default is not None:
+            headers.insert(0, self.__default)
+        return headers
+
+    def is_scoped(self) -> bool:
+        return bool(self.__zones) or (self.__default is not None and "Authorization" in self.__default)
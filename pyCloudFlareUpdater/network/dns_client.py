@@ -0,0 +1,183 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import random
+import select
+import socket
+import struct
+from time import monotonic
+
+QUERY_TYPES = {"A": 1, "NS": 2, "TXT": 16, "AAAA": 28}
+
+
+class DNSError(OSError):
+    pass
+
+
+def build_query(name, query_type="A", identifier=None):
+    identifier = random.getrandbits(16) if identifier is None else identifier
+    header = struct.pack("!HHHHHH", identifier, 0x0100, 1, 0, 0, 0)
+    question = b"".join(struct.pack("!B", len(label)) + label.encode("idna")
+                        for label in name.rstrip(".").split(".") if label)
+    return identifier, header + question + b"\x00" + struct.pack("!HH", QUERY_TYPES[query_type], 1)
+
+
+def _skip_name(message, offset):
+    while True:
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1
+        if length == 0:
+            return offset
+        offset += length
+
+
+def _read_name(message, offset):
+    labels = []
+    for _ in range(128):
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            offset = struct.unpack_from("!H", message, offset)[0] & 0x3FFF
+            continue
+        if length == 0:
+            return ".".join(labels)
+        labels.append(message[offset + 1:offset + 1 + length].decode("ascii", "replace"))
+        offset += 1 + length
+    raise DNSError("Malformed DNS name")
+
+
+def parse_response(message):
+    try:
+        return _parse_records(message)
+    except (struct.error, IndexError, ValueError) as error:
+        # a truncated or malformed answer is handled like any other failed query
+        raise DNSError("Malformed DNS answer - {0}".format(error))
+
+
+def _parse_records(message):
+    _, flags, questions, answers = struct.unpack_from("!HHHH", message)
+    if flags & 0x000F:
+        raise DNSError("DNS server returned error code {0}".format(flags & 0x000F))
+    offset = 12
+    for _ in range(questions):
+        offset = _skip_name(message, offset) + 4
+    records = []
+    for _ in range(answers):
+        offset = _skip_name(message, offset)
+        record_type, _, ttl, length = struct.unpack_from("!HHIH", message, offset)
+        offset += 10
+        data = message[offset:offset + length]
+        if record_type == QUERY_TYPES["A"]:
+            records.append(("A", socket.inet_ntop(socket.AF_INET, data), ttl))
+        elif record_type == QUERY_TYPES["AAAA"]:
+            records.append(("AAAA", socket.inet_ntop(socket.AF_INET6, data), ttl))
+        elif record_type == QUERY_TYPES["TXT"]:
+            text, position = [], 0
+            while position < len(data):
+                text.append(data[position + 1:position + 1 + data[position]].decode("utf8", "replace"))
+                position += 1 + data[position]
+            records.append(("TXT", "".join(text), ttl))
+        elif record_type == QUERY_TYPES["NS"]:
+            records.append(("NS", _read_name(message, offset), ttl))
+        offset += length
+    return records
+
+
+def query(server, name, query_type="A", timeout=2.0, port=53):
+    identifier, packet = build_query(name, query_type)
+    family = socket.AF_INET6 if ":" in server else socket.AF_INET
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(packet, (server, port))
+        while True:
+            message, _ = sock.recvfrom(4096)
+            if len(message) >= 12 and struct.unpack_from("!H", message)[0] == identifier:
+                break
+    return [value for record_type, value, _ in parse_response(message) if record_type == query_type]
+
+
+def _send(sock, packet, address, timeout):
+    try:
+        sock.sendto(packet, address)
+    except BlockingIOError:
+        select.select([], [sock], [], timeout)
+        sock.sendto(packet, address)
+
+
+def query_many(server, questions, timeout=2.0, port=53, retries=1, window=64) -> dict:
+    """
+    Sends every (name, type) question to the same server over a single socket and returns the answers by question.
+    At most "window" questions wait for an answer at a time, so a burst does not overflow the buffers of the server.
+    Unanswered questions are sent again up to "retries" times and are missing from the result, like every question
+    left once the server stays "timeout" seconds without answering.
+    """
+    family = socket.AF_INET6 if ":" in server else socket.AF_INET
+    address = (server, port)
+    attempt_timeout = timeout / (retries + 1)
+    waiting = list(set(questions))
+    in_flight = {}
+    answers = {}
+    last_answer = monotonic()
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        while waiting or in_flight:
+            now = monotonic()
+            if now - last_answer >= timeout:
+                break
+            for identifier, (question, packet, expires, attempt) in list(in_flight.items()):
+                if expires <= now:
+                    del in_flight[identifier]
+                    if attempt < retries:
+                        _send(sock, packet, address, attempt_timeout)
+                        in_flight[identifier] = (question, packet, now + attempt_timeout, attempt + 1)
+            while waiting and len(in_flight) < window:
+                name, query_type = question = waiting.pop()
+                identifier, packet = build_query(name, query_type)
+                while identifier in in_flight:
+                    identifier, packet = build_query(name, query_type)
+                _send(sock, packet, address, attempt_timeout)
+                in_flight[identifier] = (question, packet, monotonic() + attempt_timeout, 0)
+            if not in_flight:
+                break
+            wait = min(expires for _, _, expires, _ in in_flight.values()) - monotonic()
+            if not select.select([sock], [], [], max(wait, 0))[0]:
+                continue
+            message, _ = sock.recvfrom(4096)
+            if len(message) < 12:
+                continue
+            entry = in_flight.pop(struct.unpack_from("!H", message)[0], None)
+            if entry is None:
+                continue
+            last_answer = monotonic()
+            name, query_type = entry[0]
+            try:
+                answers[entry[0]] = [value for record_type, value, _ in parse_response(message)
+                                     if record_type == query_type]
+            except DNSError:
+                answers[entry[0]] = []
+    return answers
+
+
+def get_system_resolver(default="1.1.1.1") -> str:
+    try:
+        with open("/etc/resolv.conf", "r") as fresolv:
+            for line in fresolv:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    return fields[1]
+    except OSError:
+        pass
+    return default
@@ -0,0 +1,193 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import queue
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from time import sleep
+
+from ..metrics.instruments import PROPAGATION_DURATION
+from ..network.dns_client import get_system_resolver
+from ..network.dns_client import query
+from ..network.dns_client import query_many
+
+
+def parse_server(server):
+    # "host", "host:port", "[ipv6]:port" or a bare IPv6 address
+    if server.startswith("["):
+        host, _, port = server[1:].partition("]")
+        return host, int(port.lstrip(":") or 53)
+    if server.count(":") == 1:
+        host, port = server.split(":")
+        return host, int(port)
+    return server, 53
+
+
+class DNSVerifier(object):
+    """
+    Asks the authoritative name servers of each zone (or the configured ones) for the managed records with plain UDP
+    queries, sent in parallel. It confirms records that already have the expected IP without reading them from
+    CloudFlare, and it measures how long written records take to be visible.
+    """
+
+    def __init__(self, servers=None, timeout=2.0, propagation_timeout=60.0, interval=1.0, enabled=False):
+        self.__lock = threading.Lock()
+        self.__authoritative = {}
+        self.__queue = queue.SimpleQueue()
+        self.__thread = None
+        self.__log = None
+        self.__stats = {"confirmed": 0, "visible": 0, "not_visible": 0}
+        self.configure(enabled, servers, timeout, propagation_timeout, interval)
+
+    def configure(self, enabled=True, servers=None, timeout=2.0, propagation_timeout=60.0, interval=1.0, log=None):
+        self.__enabled = enabled
+        self.__servers = [parse_server(server) for server in servers] if servers else None
+        self.__timeout = timeout
+        self.__propagation_timeout = propagation_timeout
+        self.__interval = interval
+        self.__log = log
+
+    def is_enabled(self) -> bool:
+        return self.__enabled
+
+    def get_servers(self, domain) -> list:
+        if self.__servers is not None:
+            return self.__servers
+        with self.__lock:
+            servers = self.__authoritative.get(domain)
+        if servers is None:
+            servers = []
+            for name in query(get_system_resolver(), domain, "NS", timeout=self.__timeout)[:2]:
+                try:
+                    servers.append((socket.getaddrinfo(name, 53, socket.AF_INET, socket.SOCK_DGRAM)[0][4][0], 53))
+                except OSError:
+                    continue
+            with self.__lock:
+                self.__authoritative[domain] = servers
+        return servers
+
+    def lookup(self, questions) -> dict:
+        """Returns the answers of every server for each (domain, name, type) question."""
+        by_server = {}
+        for domain, name, record_type in questions:
+            try:
+                servers = self.get_servers(domain)
+            except OSError as error:
+                self._debug("Unable to find the name servers of \"{0}\" - {1}".format(domain, error))
+                continue
+            for server in servers:
+                by_server.setdefault(server, []).append((name, record_type))
+        if not by_server:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(by_server), thread_name_prefix="dns-verifier") as executor:
+            futures = {server: executor.submit(query_many, server[0], names, self.__timeout, server[1])
+                       for server, names in by_server.items()}
+        answers = {}
+        for server, future in futures.items():
+            try:
+                result = future.result()
+            except OSError as error:
+                self._debug("DNS server {0} failed - {1}".format(server[0], error))
+                continue
+            for question, values in result.items():
+                answers.setdefault(question, []).append(values)
+        return {(domain, name, record_type): answers[(name, record_type)]
+                for domain, name, record_type in questions if (name, record_type) in answers}
+
+    def _is_visible(self, answers, ip) -> bool:
+        # every server that answered must already return the address
+        return bool(answers) and all(ip in values for values in answers)
+
+    def confirm(self, questions, ip) -> set:
+        if not self.__enabled or not questions:
+            return set()
+        confirmed = {question for question, answers in self.lookup(questions).items()
+                     if self._is_visible(answers, ip)}
+        with self.__lock:
+            self.__stats["confirmed"] += len(confirmed)
+        return confirmed
+
+    def watch(self, questions, ip):
+        if not self.__enabled or not questions:
+            return
+        with self.__lock:
+            # threads do not survive the daemon fork, so it is started by the process that writes the records
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__queue = queue.SimpleQueue()
+                self.__thread = threading.Thread(target=self._run, name="dns-verifier", daemon=True)
+                self.__thread.start()
+        self.__queue.put((list(questions), ip, monotonic()))
+
+    def _run(self):
+        while True:
+            questions, ip, written_at = self.__queue.get()
+            try:
+                self._wait_until_visible(questions, ip, written_at)
+            except Exception as error:
+                self._debug("DNS verification failed - {0}".format(error))
+
+    def _wait_until_visible(self, questions, ip, written_at):
+        pending = set(questions)
+        while pending:
+            visible = [question for question, answers in self.lookup(pending).items() if self._is_visible(answers, ip)]
+            latency = monotonic() - written_at
+            for question in visible:
+                pending.discard(question)
+                PROPAGATION_DURATION.labels(question[2]).observe(latency)
+                self._debug("\"{0}\" shows {1} at the name servers".format(question[1], ip))
+                self._count("visible")
+            if len(visible) == 1:
+                self._info("\"{0}\" shows {1} at the name servers {2:.1f} seconds after being updated"
+                           .format(visible[0][1], ip, latency))
+            elif visible:
+                self._info("{0} records show {1} at the name servers {2:.1f} seconds after being updated"
+                           .format(len(visible), ip, latency))
+            if pending and monotonic() - written_at >= self.__propagation_timeout:
+                for question in pending:
+                    self._warning("\"{0}\" does not show {1} at the name servers {2:.0f} seconds after being updated"
+                                  .format(question[1], ip, self.__propagation_timeout))
+                    self._count("not_visible")
+                return
+            if pending:
+                sleep(self.__interval)
+
+    def _count(self, counter):
+        with self.__lock:
+            self.__stats[counter] += 1
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__stats)
+
+    def _debug(self, msg):
+        if self.__log:
+            self.__log.debug(msg)
+
+    def _info(self, msg):
+        if self.__log:
+            self.__log.info(msg)
+
+    def _warning(self, msg):
+        if self.__log:
+            self.__log.warning(msg)
+
+
+_verifier = DNSVerifier()
+
+
+def get_dns_verifier() -> DNSVerifier:
+    return _verifier
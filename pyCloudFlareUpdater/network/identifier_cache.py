@@ -0,0 +1,101 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import threading
+from time import time
+
+
+class IdentifierCache(object):
+    """
+    Zone and record identifiers persisted on disk, so a restarted daemon does not need to look them up again.
+    Entries older than "ttl" seconds are ignored.
+    """
+
+    def __init__(self, filename, ttl=86400):
+        self.__filename = filename
+        self.__ttl = ttl
+        self.__zones = {}
+        self.__records = {}
+        self.__dirty = False
+        self.__lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _record_key(zone, name, record_type):
+        return "{0}/{1}/{2}".format(zone, name, record_type)
+
+    def load(self):
+        try:
+            with open(self.__filename, "r") as fcache:
+                content = json.load(fcache)
+            self.__zones = content.get("zones", {})
+            self.__records = content.get("records", {})
+        except (OSError, ValueError):
+            self.__zones = {}
+            self.__records = {}
+
+    def save(self):
+        with self.__lock:
+            if not self.__dirty:
+                return
+            file_dir = os.path.dirname(os.path.abspath(self.__filename))
+            if not os.path.exists(file_dir):
+                os.makedirs(file_dir, exist_ok=True)
+            temp_file = "{0}.{1}.tmp".format(self.__filename, os.getpid())
+            with open(temp_file, "w") as fcache:
+                json.dump({"zones": self.__zones, "records": self.__records}, fcache)
+            os.replace(temp_file, self.__filename)
+            self.__dirty = False
+
+    def _get(self, entries, key):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        identifier, stored_at = entry
+        if time() - stored_at > self.__ttl:
+            return None
+        return identifier
+
+    def _set(self, entries, key, identifier):
+        with self.__lock:
+            entry = entries.get(key)
+            if entry is None or entry[0] != identifier or time() - entry[1] > self.__ttl / 2:
+                entries[key] = [identifier, time()]
+                self.__dirty = True
+
+    def _drop(self, entries, key):
+        with self.__lock:
+            if entries.pop(key, None) is not None:
+                self.__dirty = True
+
+    def get_zone(self, domain):
+        return self._get(self.__zones, domain)
+
+    def set_zone(self, domain, zone):
+        self._set(self.__zones, domain, zone)
+
+    def drop_zone(self, domain):
+        self._drop(self.__zones, domain)
+
+    def get_record(self, zone, name, record_type="A"):
+        return self._get(self.__records, self._record_key(zone, name, record_type))
+
+    def set_record(self, zone, name, identifier, record_type="A"):
+        self._set(self.__records, self._record_key(zone, name, record_type), identifier)
+
+    def drop_record(self, zone, name, record_type="A"):
+        self._drop(self.__records, self._record_key(zone, name, record_type))
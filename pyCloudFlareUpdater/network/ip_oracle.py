@@ -0,0 +1,97 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import fcntl
+import json
+import os
+import threading
+from time import time
+
+
+class SharedIPCache(object):
+    """
+    Public IP shared by every daemon of the host through small files (one per IP version). The first daemon that
+    finds the address missing or older than "ttl" seconds looks it up while holding a lock, so the others wait for
+    its answer instead of querying the IP providers too. Without a file, every lookup goes to the providers.
+    """
+
+    def __init__(self, filename=None, ttl=60.0):
+        self.__lock = threading.Lock()
+        self.__stats = {"shared": 0, "looked_up": 0}
+        self.configure(filename, ttl)
+
+    def configure(self, filename=None, ttl=60.0):
+        self.__filename = os.path.abspath(filename) if filename else None
+        self.__ttl = ttl
+
+    def get_filename(self):
+        return self.__filename
+
+    def _count(self, counter):
+        with self.__lock:
+            self.__stats[counter] += 1
+
+    def _read(self, data_file):
+        try:
+            with open(data_file, "r") as fdata:
+                entry = json.load(fdata)
+            age = time() - entry["time"]
+            # entries from the future (clock changes) are not trusted either
+            return entry["ip"] if -1.0 <= age <= self.__ttl else None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write(self, data_file, ip):
+        temp_file = "{0}.{1}.tmp".format(data_file, os.getpid())
+        with open(temp_file, "w") as fdata:
+            json.dump({"ip": ip, "time": time(), "pid": os.getpid()}, fdata)
+        os.replace(temp_file, data_file)
+
+    def get_ip(self, version, lookup) -> str:
+        if self.__filename is None:
+            return lookup()
+        data_file = "{0}.v{1}".format(self.__filename, version)
+        ip = self._read(data_file)
+        if ip is not None:
+            self._count("shared")
+            return ip
+        file_dir = os.path.dirname(data_file)
+        if not os.path.exists(file_dir):
+            os.makedirs(file_dir, exist_ok=True)
+        with open(data_file + ".lock", "a") as flock:
+            fcntl.flock(flock.fileno(), fcntl.LOCK_EX)
+            try:
+                # another daemon may have looked it up while waiting for the lock
+                ip = self._read(data_file)
+                if ip is not None:
+                    self._count("shared")
+                    return ip
+                ip = lookup()
+                self._write(data_file, ip)
+                self._count("looked_up")
+                return ip
+            finally:
+                fcntl.flock(flock.fileno(), fcntl.LOCK_UN)
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__stats)
+
+
+_ip_oracle = SharedIPCache()
+
+
+def get_ip_oracle() -> SharedIPCache:
+    return _ip_oracle
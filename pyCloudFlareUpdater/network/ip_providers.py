@@ -0,0 +1,221 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import ipaddress
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from time import monotonic
+from urllib.error import URLError
+
+from ..metrics.instruments import IP_LOOKUP_DURATION
+from ..network.circuit_breaker import CircuitOpenError
+from ..network.circuit_breaker import get_circuit_breakers
+from ..network.dns_client import DNSError
+from ..network.dns_client import query
+from ..network.session import get_session
+
+
+class IPProvider(object):
+    """Source of the public IP address of this machine."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def lookup(self, timeout) -> str:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return "{0}({1})".format(self.__class__.__name__, self.name)
+
+
+class HTTPEchoProvider(IPProvider):
+    def __init__(self, url):
+        super().__init__(url)
+        self.__url = url
+
+    def lookup(self, timeout) -> str:
+        return get_session().request("GET", self.__url, timeout=timeout).text().strip()
+
+
+class DNSProvider(IPProvider):
+    def __init__(self, name, server, query_name, query_type="A"):
+        super().__init__(name)
+        self.__server = server
+        self.__query_name = query_name
+        self.__query_type = query_type
+
+    def lookup(self, timeout) -> str:
+        answers = query(self.__server, self.__query_name, self.__query_type, timeout=timeout)
+        if not answers:
+            raise DNSError("{0} returned no answer".format(self.name))
+        return answers[0].strip()
+
+
+class InterfaceProvider(IPProvider):
+    """Address of the local interface used for reaching the Internet - only useful when it is a public one."""
+
+    def __init__(self, family=socket.AF_INET):
+        super().__init__("interface-ipv{0}".format(6 if family == socket.AF_INET6 else 4))
+        self.__family = family
+
+    def lookup(self, timeout) -> str:
+        target = ("2001:4860:4860::8888", 53) if self.__family == socket.AF_INET6 else ("8.8.8.8", 53)
+        with socket.socket(self.__family, socket.SOCK_DGRAM) as sock:
+            # connecting an UDP socket sends nothing, it only selects the route
+            sock.connect(target)
+            return sock.getsockname()[0]
+
+
+class _ProviderStats(object):
+    __slots__ = ("latency", "successes", "failures")
+
+    def __init__(self):
+        self.latency = None
+        self.successes = 0
+        self.failures = 0
+
+    def score(self):
+        failure_rate = (self.failures + 1) / (self.successes + self.failures + 2)
+        return failure_rate * 10 + (self.latency if self.latency is not None else 1.0)
+
+    def as_dict(self):
+        return {"latency": self.latency, "successes": self.successes, "failures": self.failures}
+
+
+class IPDiscovery(object):
+    """
+    Queries several providers in parallel: the first valid address (or the first one returned by "quorum" providers)
+    wins. Providers with lower latency and fewer failures are started first on later lookups, and the ones that keep
+    failing are skipped until their circuit breaker lets a probe through.
+    """
+
+    def __init__(self, providers, quorum=1, parallel=3, timeout=5.0, version=None):
+        self.__providers = list(providers)
+        self.__quorum = quorum
+        self.__timeout = timeout
+        self.__version = version
+        self.__stats = {provider.name: _ProviderStats() for provider in self.__providers}
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=max(parallel, 1), thread_name_prefix="ip-discovery")
+
+    def get_providers(self) -> list:
+        with self.__lock:
+            return sorted(self.__providers, key=lambda provider: self.__stats[provider.name].score())
+
+    def get_version(self):
+        return self.__version
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return {name: stats.as_dict() for name, stats in self.__stats.items()}
+
+    def _validate(self, address):
+        ip = ipaddress.ip_address(address)
+        if not ip.is_global:
+            raise ValueError("\"{0}\" is not a public address".format(address))
+        if self.__version is not None and ip.version != self.__version:
+            raise ValueError("\"{0}\" is not an IPv{1} address".format(address, self.__version))
+        return str(ip)
+
+    def _timed_lookup(self, provider, breaker, deadline):
+        start = monotonic()
+        try:
+            address = self._validate(provider.lookup(max(deadline - start, 0.1)))
+        except Exception:
+            IP_LOOKUP_DURATION.labels(provider.name, "failure").observe(monotonic() - start)
+            breaker.failure()
+            with self.__lock:
+                self.__stats[provider.name].failures += 1
+            raise
+        breaker.success()
+        elapsed = monotonic() - start
+        IP_LOOKUP_DURATION.labels(provider.name, "success").observe(elapsed)
+        with self.__lock:
+            stats = self.__stats[provider.name]
+            stats.successes += 1
+            stats.latency = elapsed if stats.latency is None else stats.latency * 0.7 + elapsed * 0.3
+        return address
+
+    def get_ip(self) -> str:
+        deadline = monotonic() + self.__timeout
+        breakers = get_circuit_breakers()
+        lookups = {}
+        for provider in self.get_providers():
+            breaker = breakers.get("ip-provider:" + provider.name)
+            if breaker.allow():
+                lookups[self.__executor.submit(self._timed_lookup, provider, breaker, deadline)] = breaker
+        if not lookups:
+            raise CircuitOpenError("Every public IP{0} provider is failing - retrying after their cooldown"
+                                   .format("v{0}".format(self.__version) if self.__version else ""))
+        pending = set(lookups)
+        votes = {}
+        errors = []
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=max(deadline - monotonic(), 0), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    try:
+                        address = future.result()
+                    except Exception as error:
+                        errors.append(error)
+                        continue
+                    votes[address] = votes.get(address, 0) + 1
+                    if votes[address] >= self.__quorum:
+                        return address
+        finally:
+            for future in pending:
+                if future.cancel():
+                    # never started, so a probe it was holding is given back
+                    lookups[future].release()
+        raise URLError("No public IP provider returned a valid address (answers: {0}, errors: {1})"
+                       .format(votes, "; ".join(str(error) for error in errors) or "timeout"))
+
+    def close(self):
+        self.__executor.shutdown(wait=False)
+
+
+def default_providers(version=4) -> list:
+    if version == 6:
+        return [HTTPEchoProvider("https://v6.ident.me"),
+                HTTPEchoProvider("https://api6.ipify.org"),
+                HTTPEchoProvider("https://ipv6.icanhazip.com"),
+                DNSProvider("opendns-ipv6", "2620:119:35::35", "myip.opendns.com", "AAAA"),
+                DNSProvider("google-dns-ipv6", "2001:4860:4802:32::a", "o-o.myaddr.l.google.com", "TXT"),
+                InterfaceProvider(socket.AF_INET6)]
+    return [HTTPEchoProvider("https://v4.ident.me"),
+            HTTPEchoProvider("https://api.ipify.org"),
+            HTTPEchoProvider("https://ipv4.icanhazip.com"),
+            HTTPEchoProvider("https://ifconfig.me/ip"),
+            DNSProvider("opendns", "208.67.222.222", "myip.opendns.com", "A"),
+            DNSProvider("google-dns", "216.239.32.10", "o-o.myaddr.l.google.com", "TXT"),
+            InterfaceProvider()]
+
+
+_discovery = {}
+
+
+def get_ip_discovery(version=4) -> IPDiscovery:
+    if version not in _discovery:
+        _discovery[version] = IPDiscovery(default_providers(version), version=version)
+    return _discovery[version]
+
+
+def set_ip_discovery(discovery: IPDiscovery, version=4):
+    _discovery[version] = discovery
@@ -0,0 +1,136 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+import select
+import socket
+import struct
+from time import monotonic
+from time import sleep
+
+NETLINK_ROUTE = 0
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+
+
+class AddressWatcher(object):
+    """Notifies about address changes of the local interfaces."""
+
+    def fileno(self):
+        return None
+
+    def poll(self) -> bool:
+        raise NotImplementedError
+
+    def wait(self, timeout) -> bool:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class NetlinkAddressWatcher(AddressWatcher):
+    """Listens to RTM_NEWADDR/RTM_DELADDR kernel notifications (Linux only)."""
+
+    def __init__(self, settle_time=1.0):
+        self.__socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.__socket.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        self.__socket.setblocking(False)
+        self.__settle_time = settle_time
+
+    def fileno(self):
+        return self.__socket.fileno()
+
+    def poll(self) -> bool:
+        changed = False
+        while True:
+            try:
+                data = self.__socket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return changed
+            offset = 0
+            while offset + 16 <= len(data):
+                length, message_type = struct.unpack_from("=IH", data, offset)
+                if message_type in (RTM_NEWADDR, RTM_DELADDR):
+                    changed = True
+                if length < 16:
+                    break
+                offset += (length + 3) & ~3
+
+    def wait(self, timeout) -> bool:
+        deadline = monotonic() + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([self.__socket], [], [], remaining)
+            if readable and self.poll():
+                # addresses usually change in bursts (DHCP, PPP reconnections...)
+                sleep(self.__settle_time)
+                self.poll()
+                return True
+
+    def close(self):
+        self.__socket.close()
+
+
+class ProcAddressWatcher(AddressWatcher):
+    """Fallback that compares the local addresses listed at /proc/net every "interval" seconds."""
+    SOURCES = ("/proc/net/fib_trie", "/proc/net/if_inet6")
+
+    def __init__(self, interval=5.0):
+        self.__interval = interval
+        self.__snapshot = self._read_snapshot()
+
+    def _read_snapshot(self):
+        snapshot = []
+        for source in self.SOURCES:
+            try:
+                with open(source, "r") as fsource:
+                    snapshot.append(fsource.read())
+            except OSError:
+                snapshot.append(None)
+        return tuple(snapshot)
+
+    def get_interval(self):
+        return self.__interval
+
+    def poll(self) -> bool:
+        snapshot = self._read_snapshot()
+        changed = snapshot != self.__snapshot
+        self.__snapshot = snapshot
+        return changed
+
+    def wait(self, timeout) -> bool:
+        deadline = monotonic() + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            sleep(min(self.__interval, remaining))
+            if self.poll():
+                return True
+
+
+def create_address_watcher():
+    try:
+        return NetlinkAddressWatcher()
+    except (AttributeError, OSError):
+        pass
+    if os.path.exists(ProcAddressWatcher.SOURCES[0]):
+        return ProcAddressWatcher()
+    return None
@@ -15,83 +15,213 @@
 #    along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 
-def get_machine_public_ip():
-    import urllib.request
-
-    return urllib.request.urlopen('https://ident.me').read().decode('utf8')
+try:
+    import ujson as json
+except ImportError:
+    import json
+from time import monotonic
+from time import sleep
+from urllib.error import HTTPError
+
+from ..metrics.instruments import API_REQUEST_DURATION
+from ..metrics.instruments import API_REQUESTS
+from ..network.circuit_breaker import CircuitOpenError
+from ..network.circuit_breaker import get_circuit_breakers
+from ..network.circuit_breaker import get_retry_policy
+from ..network.ip_oracle import get_ip_oracle
+from ..network.ip_providers import get_ip_discovery
+from ..network.rate_limit import get_rate_limiter
+from ..network.rate_limit import parse_retry_after
+from ..network.session import get_session
+from ..values import cloudflare_base_url
+
+UNKNOWN_IP = {"A": "0.0.0.0", "AAAA": "::"}
+RECORD_TYPES = {4: "A", 6: "AAAA"}
+CLOUDFLARE_ENDPOINT = "cloudflare-api"
+
+
+def record_type_of(ip) -> str:
+    return "AAAA" if ":" in ip else "A"
+
+
+def get_machine_public_ip(version=4):
+    return get_ip_oracle().get_ip(version, get_ip_discovery(version).get_ip)
+
+
+def cloudflare_headers(key, mail) -> dict:
+    return {"X-Auth-Email": mail,
+            "X-Auth-Key": key,
+            "Content-Type": "application/json"}
+
+
+def cloudflare_token_headers(token) -> dict:
+    return {"Authorization": "Bearer " + token,
+            "Content-Type": "application/json"}
+
+
+def cloudflare_request(headers, url_extra_attrs, method="GET", data=None, max_retries=None):
+    if data is not None:
+        data = json.dumps(data).encode("utf-8")
+    return cloudflare_send(headers, cloudflare_base_url.format(url_extra_attrs), method, data, max_retries)
+
+
+def is_transient(error) -> bool:
+    # network errors, timeouts, server errors and malformed answers - anything else is an answer of the API
+    if isinstance(error, HTTPError):
+        return error.code >= 500 and error.code != 501
+    return isinstance(error, (OSError, ValueError)) and not isinstance(error, CircuitOpenError)
+
+
+def cloudflare_send(headers, url, method="GET", body=None, max_retries=None):
+    """
+    Sends an already built request - the full URL and the JSON body, encoded. Transient failures are retried while
+    the deadline of the retry policy allows it, and nothing is sent while the circuit of the API is open.
+    """
+    rate_limiter = get_rate_limiter()
+    breaker = get_circuit_breakers().get(CLOUDFLARE_ENDPOINT)
+    policy = get_retry_policy()
+    max_retries = policy.get_max_retries() if max_retries is None else max_retries
+    deadline = policy.get_deadline()
+    attempt = 0
+    while True:
+        breaker.check()
+        rate_limiter.acquire()
+        start = monotonic()
+        try:
+            response = get_session().request(method, url, data=body, headers=headers, deadline=deadline)
+        except HTTPError as error:
+            API_REQUESTS.labels(method, error.code).inc()
+            failure = error
+        except Exception as error:
+            API_REQUESTS.labels(method, error.__class__.__name__).inc()
+            failure = error
+        else:
+            API_REQUESTS.labels(method, response.getcode()).inc()
+            try:
+                result = json.loads(response.text())
+                breaker.success()
+                break
+            except ValueError as error:
+                failure = ValueError("CloudFlare returned an invalid answer - {0}".format(error))
+        finally:
+            API_REQUEST_DURATION.labels(method).observe(monotonic() - start)
+        if isinstance(failure, HTTPError) and failure.code == 429:
+            # the request never ran, so the health of the API is still unknown
+            breaker.release()
+            delay = parse_retry_after(failure.headers.get("Retry-After"), default=2 ** attempt)
+            # every request waits for the time CloudFlare asked for, not only this one
+            rate_limiter.pause(delay)
+            if attempt >= max_retries or monotonic() + delay >= deadline:
+                raise failure
+        elif not is_transient(failure):
+            # only an answer that worked closes the circuit
+            breaker.release()
+            raise failure
+        else:
+            breaker.failure()
+            delay = policy.get_delay(attempt)
+            if attempt >= max_retries or monotonic() + delay >= deadline:
+                raise failure
+            sleep(delay)
+        attempt += 1
+    if not result.get("success"):
+        raise ValueError("CloudFlare returned error code with the request data - more info: " +
+                         ("; ".join(str(error) for error in result.get("errors") or []) or "no details"))
+    return response.getcode(), result
+
+
+def cloudflare_batch(headers, zone, patches):
+    """Applies the patches, each one already encoded (see "CloudFlare.encode_changes"), in a single request."""
+    body = b'{"patches":[' + b",".join(patches) + b"]}"
+    code, result = cloudflare_send(headers, cloudflare_base_url.format("zones/{0}/dns_records/batch".format(zone)),
+                                   method="POST", body=body)
+    return code, result["result"] or {}
+
+
+def is_batch_unsupported(error) -> bool:
+    return isinstance(error, HTTPError) and error.code in (404, 405, 501)
+
+
+def is_record_not_found(error) -> bool:
+    if isinstance(error, HTTPError):
+        return error.code == 404
+    return isinstance(error, ValueError) and "81044" in str(error)
 
 
 class CloudFlare(object):
-    def __init__(self, domain, name, key, mail, proxied):
+    """
+    A single DNS record. Its URL and the JSON bodies sent to update it are built once, so writing a new IP only fills
+    the address into a template.
+    """
+
+    def __init__(self, domain, name, key, mail, proxied, zone=None, identifier=None, record_type="A", ttl=600,
+                 headers=None):
         self.__domain = domain
         self.__name = name
-        self.__headers = {"X-Auth-Email": mail,
-                          "X-Auth-Key": key,
-                          "Content-Type": "application/json"}
+        self.__type = record_type
+        self.__headers = headers if headers is not None else cloudflare_headers(key, mail)
         self.__proxied = proxied
-        self.__zone = self._get_zone()
-        self.__id = self._get_identifier()
+        self.__ttl = ttl
+        self.__zone = zone if zone is not None else self._get_zone()
+        self.__id = identifier if identifier is not None else self._get_identifier()
+        self.__url = cloudflare_base_url.format("zones/{0}/dns_records/{1}".format(self.__zone, self.__id))
+        self.__fields = {"type": self.__type, "name": self.__name, "ttl": self.__ttl, "proxied": self.__proxied}
+        self.__templates = {}
+
+    def _get_template(self, fields, with_id=False):
+        key = (fields, with_id)
+        template = self.__templates.get(key)
+        if template is None:
+            members = [("id", self.__id)] if with_id else []
+            members.extend((field, self.__fields[field]) for field in fields)
+            # the address goes last, so the body is the prefix, the IP and the closing characters
+            prefix = "{" + "".join("{0}:{1},".format(json.dumps(name), json.dumps(value)) for name, value in members)
+            template = ((prefix + '"content":"').encode("utf-8"), b'"}')
+            self.__templates[key] = template
+        return template
+
+    def encode_changes(self, changes: dict, with_id=False) -> bytes:
+        fields = tuple(sorted(field for field in changes if field != "content"))
+        if "content" not in changes or any(changes[field] != self.__fields.get(field) for field in fields):
+            return json.dumps(dict(changes, id=self.__id) if with_id else changes).encode("utf-8")
+        prefix, suffix = self._get_template(fields, with_id)
+        return prefix + changes["content"].encode("ascii") + suffix
+
+    def _request(self, url_extra_attrs, method="GET", data=None):
+        code, result = cloudflare_request(self.__headers, url_extra_attrs, method, data)
+        return code, result["result"]
 
     def _get_zone(self):
-        try:
-            import ujson as json
-        except ImportError:
-            import json
-        from urllib.request import Request, urlopen
-
-        from ..values import cloudflare_base_url
-
-        url_extra_attrs = "zones?name={0}&status=active&page=1&per_page=1&match=all".format(self.__name)
-        request = Request(cloudflare_base_url.format(url_extra_attrs), headers=self.__headers)
-        result = json.loads(urlopen(request).read().decode("utf8"))
-        if not result["success"]:
-            raise ValueError("CloudFlare returned error code with the request data - more info: " + result["errors"][0])
-
-        return result["result"][0]["id"]
+        url_extra_attrs = "zones?name={0}&status=active&page=1&per_page=1&match=all".format(self.__domain)
+        return self._request(url_extra_attrs)[1][0]["id"]
 
     def _get_identifier(self):
-        try:
-            import ujson as json
-        except ImportError:
-            import json
-        from urllib.request import Request, urlopen
+        url_extra_attrs = "zones/{0}/dns_records?type={1}&name={2}&page=1&per_page=1" \
+            .format(self.__zone, self.__type, self.__name)
+        return self._request(url_extra_attrs)[1][0]["id"]
 
-        from ..values import cloudflare_base_url
+    def get_cloudflare_latest_ip(self):
+        return cloudflare_send(self.__headers, self.__url)[1]["result"]["content"]
 
-        url_extra_attrs = "zones/{0}/dns_records?type=A&name={1}&page=1&per_page=1".format(self.__zone, self.__name)
-        request = Request(cloudflare_base_url.format(url_extra_attrs), headers=self.__headers)
-        result = json.loads(urlopen(request).read().decode("utf8"))
-        if not result["success"]:
-            raise ValueError("CloudFlare returned error code with the request data - more info: " + result["errors"][0])
+    def set_cloudflare_ip(self, ip):
+        prefix, suffix = self._get_template(("name", "proxied", "ttl", "type"))
+        return cloudflare_send(self.__headers, self.__url, "PUT", prefix + ip.encode("ascii") + suffix)[0]
 
-        return result["result"][0]["id"]
+    def update_record(self, changes: dict):
+        code, result = cloudflare_send(self.__headers, self.__url, "PATCH", self.encode_changes(changes))
+        return code, result["result"]
 
-    def get_cloudflare_latest_ip(self):
-        try:
-            import ujson as json
-        except ImportError:
-            import json
-        from urllib.request import Request, urlopen
-        from ..values import cloudflare_base_url
+    def get_domain(self):
+        return self.__domain
 
-        url_extra_attrs = "zones/{0}/dns_records/{1}".format(self.__zone, self.__id)
-        request = Request(cloudflare_base_url.format(url_extra_attrs), headers=self.__headers)
-        result = json.loads(urlopen(request).read().decode("utf8"))
+    def get_name(self):
+        return self.__name
 
-        return result["result"]["content"]
+    def get_zone(self):
+        return self.__zone
 
-    def set_cloudflare_ip(self, ip):
-        try:
-            from ujson import dumps
-        except ImportError:
-            from json import dumps
-        from urllib.request import Request, urlopen
-        from ..values import cloudflare_base_url
-
-        data = dumps({"type": "A", "name": self.__name, "content": ip, "ttl": 600, "proxied": self.__proxied})
-        url_extra_attrs = "zones/{0}/dns_records/{1}".format(self.__zone, self.__id)
-        request = Request(url=cloudflare_base_url.format(url_extra_attrs),
-                          data=data.encode("utf-8"),
-                          headers=self.__headers,
-                          method="PUT")
-        return urlopen(request).getcode()
+    def get_record_type(self):
+        return self.__type
+
+    def get_identifier(self):
+        return self.__id
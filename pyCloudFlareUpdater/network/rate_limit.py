@@ -0,0 +1,100 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import threading
+from email.utils import parsedate_to_datetime
+from time import monotonic
+from time import sleep
+from time import time
+
+
+def parse_retry_after(value, default=1.0) -> float:
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket(object):
+    """
+    Keeps the CloudFlare requests under "limit" calls per "window" seconds (CloudFlare allows 1200 requests every
+    5 minutes per user). When the API answers 429, every caller waits for the time the server asked for.
+    """
+
+    def __init__(self, limit=1200, window=300.0):
+        self.__lock = threading.Lock()
+        self.__stats = {"acquired": 0, "waits": 0, "waited_seconds": 0.0, "throttled": 0}
+        self.__paused_until = 0.0
+        self.configure(limit, window)
+
+    def configure(self, limit, window=300.0):
+        with self.__lock:
+            self.__capacity = float(limit)
+            self.__rate = limit / window
+            self.__tokens = float(limit)
+            self.__updated = monotonic()
+
+    def _refill(self, now):
+        # nothing is refilled while paused by a 429, so no burst is sent as soon as the pause ends
+        start = max(self.__updated, self.__paused_until)
+        if now > start:
+            self.__tokens = min(self.__capacity, self.__tokens + (now - start) * self.__rate)
+        self.__updated = now
+
+    def acquire(self) -> float:
+        waited = 0.0
+        while True:
+            with self.__lock:
+                now = monotonic()
+                self._refill(now)
+                delay = self.__paused_until - now
+                if delay <= 0:
+                    if self.__tokens >= 1:
+                        self.__tokens -= 1
+                        self.__stats["acquired"] += 1
+                        if waited:
+                            self.__stats["waits"] += 1
+                            self.__stats["waited_seconds"] += waited
+                        return waited
+                    delay = (1 - self.__tokens) / self.__rate
+            sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        with self.__lock:
+            now = monotonic()
+            self.__paused_until = max(self.__paused_until, now + seconds)
+            self.__tokens = 0.0
+            self.__updated = now
+            self.__stats["throttled"] += 1
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats["tokens"] = self.__tokens
+            return stats
+
+
+_rate_limiter = TokenBucket()
+
+
+def get_rate_limiter() -> TokenBucket:
+    return _rate_limiter
@@ -0,0 +1,137 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import threading
+from time import monotonic
+
+from ..network.network_utils import cloudflare_request
+
+
+class RecordIndex(object):
+    """
+    In-memory index of every A/AAAA record of the managed zones, keyed by (zone, name, type).
+    Each zone is pulled with a single paginated listing instead of one request per record. The listings run without
+    holding the index, so different zones are loaded at the same time - callers of the same zone wait for one listing.
+    """
+    RECORD_TYPES = ("A", "AAAA")
+
+    def __init__(self, credentials, per_page=100, max_age=None):
+        self.__credentials = credentials
+        self.__per_page = per_page
+        self.__max_age = max_age
+        self.__zones = {}
+        self.__domains = {}
+        self.__records = {}
+        self.__loaded = {}
+        self.__loading = {}
+        self.__lock = threading.Lock()
+
+    def _get_loading_lock(self, key) -> threading.Lock:
+        with self.__lock:
+            return self.__loading.setdefault(key, threading.Lock())
+
+    def _list(self, url_extra_attrs, headers):
+        page = 1
+        while True:
+            _, result = cloudflare_request(headers, "{0}&page={1}&per_page={2}"
+                                           .format(url_extra_attrs, page, self.__per_page))
+            yield from result["result"]
+            info = result.get("result_info") or {}
+            if page >= info.get("total_pages", 1):
+                break
+            page += 1
+
+    def load_zones(self, headers=None):
+        zones = []
+        # a scoped token only lists the zones it has access to
+        for zone_headers in [headers] if headers is not None else self.__credentials.get_all_headers():
+            zones.extend(self._list("zones?status=active&match=all", zone_headers))
+        with self.__lock:
+            for zone in zones:
+                self.__zones[zone["name"]] = zone["id"]
+                self.__domains[zone["id"]] = zone["name"]
+            return len(self.__zones)
+
+    def get_zone_id(self, domain):
+        zone = self.__zones.get(domain)
+        if zone is None:
+            # the zones are listed once - the domains looked up meanwhile wait for that listing
+            with self._get_loading_lock("zones"):
+                zone = self.__zones.get(domain)
+                if zone is None:
+                    self.load_zones(self.__credentials.get_headers(domain))
+                    zone = self.__zones.get(domain)
+            if zone is None:
+                raise ValueError("CloudFlare has no active zone named \"{0}\"{1}".format(
+                    domain, " (or its API token has no access to it)" if self.__credentials.is_scoped() else ""))
+        return zone
+
+    def set_zone_id(self, domain, zone):
+        with self.__lock:
+            self.__zones[domain] = zone
+            self.__domains[zone] = domain
+
+    def get_headers(self, zone) -> dict:
+        return self.__credentials.get_headers(self.__domains.get(zone))
+
+    def load_zone(self, zone, reload=True):
+        with self._get_loading_lock(zone):
+            if not reload and self.is_loaded(zone):
+                # loaded by another caller while this one was waiting
+                return None
+            entries = {}
+            for record in self._list("zones/{0}/dns_records?match=all".format(zone), self.get_headers(zone)):
+                if record["type"] in self.RECORD_TYPES:
+                    entries[(zone, record["name"], record["type"])] = record
+            with self.__lock:
+                for key in [key for key in self.__records if key[0] == zone]:
+                    if key not in entries:
+                        del self.__records[key]
+                self.__records.update(entries)
+                self.__loaded[zone] = monotonic()
+            return len(entries)
+
+    def is_loaded(self, zone) -> bool:
+        loaded_at = self.__loaded.get(zone)
+        if loaded_at is None:
+            return False
+        return self.__max_age is None or monotonic() - loaded_at < self.__max_age
+
+    def lookup(self, zone, name, record_type="A"):
+        if not self.is_loaded(zone):
+            self.load_zone(zone, reload=False)
+        with self.__lock:
+            return self.__records.get((zone, name, record_type))
+
+    def get_cached(self, zone, name, record_type="A"):
+        with self.__lock:
+            return self.__records.get((zone, name, record_type)) if self.is_loaded(zone) else None
+
+    def update(self, zone, record):
+        with self.__lock:
+            key = (zone, record["name"], record["type"])
+            self.__records[key] = dict(self.__records.get(key, {}), **record)
+
+    def invalidate(self, zone, name=None, record_type=None):
+        with self.__lock:
+            self.__loaded.pop(zone, None)
+            if name is None:
+                for key in [key for key in self.__records if key[0] == zone]:
+                    del self.__records[key]
+            else:
+                self.__records.pop((zone, name, record_type or "A"), None)
+
+    def __len__(self):
+        return len(self.__records)
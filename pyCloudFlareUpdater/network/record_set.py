@@ -0,0 +1,489 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from ..metrics.instruments import DRIFTED_RECORDS
+from ..metrics.instruments import RECORD_UPDATES
+from ..metrics.instruments import count_error
+from ..network.credentials import Credentials
+from ..network.dns_verifier import get_dns_verifier
+from ..network.network_utils import CloudFlare
+from ..network.network_utils import UNKNOWN_IP
+from ..network.network_utils import record_type_of
+from ..network.network_utils import cloudflare_batch
+from ..network.network_utils import is_batch_unsupported
+from ..network.network_utils import is_record_not_found
+from ..network.record_index import RecordIndex
+from ..network.update_planner import DEFERRED
+from ..network.update_planner import get_update_planner
+
+
+class Record(object):
+    """A managed 'A'/'AAAA' Record - its CloudFlare client is only created when an API call is needed."""
+    __slots__ = ("domain", "name", "record_type", "proxied", "ttl", "interval", "latest_ip", "client", "validated",
+                 "pending")
+
+    def __init__(self, domain, name, proxied=False, latest_ip=None, record_type="A", ttl=600, interval=None):
+        self.domain = domain
+        self.name = name
+        self.record_type = record_type
+        self.proxied = proxied
+        self.ttl = ttl
+        self.interval = interval
+        self.latest_ip = latest_ip if latest_ip is not None else UNKNOWN_IP[record_type]
+        self.client = None
+        self.validated = False
+        # the proxied flag or the TTL changed, so the record must be written even if the IP is the same
+        self.pending = False
+
+    def is_unknown(self) -> bool:
+        return self.latest_ip == UNKNOWN_IP[self.record_type]
+
+    def is_outdated(self, ip) -> bool:
+        return not self.is_unknown() and (self.pending or self.latest_ip != ip)
+
+    def __repr__(self):
+        return "Record({0}, {1}, {2})".format(self.domain, self.name, self.record_type)
+
+
+def describe_update(record, ip) -> str:
+    if record.latest_ip == ip:
+        return "Settings changed for \"{0}\" - TTL: {1} | PROXIED: {2}".format(record.name, record.ttl, record.proxied)
+    return "IP needs an upgrade for \"{0}\" - OLD IP: {1} | NEW IP: {2}".format(record.name, record.latest_ip, ip)
+
+
+class RecordSet(object):
+    """Many 'A'/'AAAA' Records across several zones, resolved from a zone-wide RecordIndex."""
+
+    def __init__(self, key, mail, log=None, index=None, cache=None, planner=None, batch_size=100, parallel=8,
+                 sweep_interval=None, verifier=None, credentials=None):
+        self.__log = log
+        self.__credentials = credentials if credentials is not None else Credentials(key, mail)
+        self.__index = index if index is not None else RecordIndex(self.__credentials)
+        self.__cache = cache
+        self.__planner = planner if planner is not None else get_update_planner()
+        self.__verifier = verifier if verifier is not None else get_dns_verifier()
+        self.__records = {}
+        self.__deferred = set()
+        self.__lock = threading.Lock()
+        self.__batch_size = batch_size
+        self.__batch_supported = True
+        self.__parallel = parallel
+        self.__executor = None
+        self.__sweep_interval = sweep_interval
+        self.__swept = {}
+        self.__sweep_credit = 0.0
+        self.__last_sweep = None
+
+    def add(self, domain, name, proxied=False, latest_ip=None, record_type="A", ttl=600, interval=None):
+        record = Record(domain, name, proxied, latest_ip, record_type, ttl, interval)
+        self.__records[(name, record_type)] = record
+        return record
+
+    def remove(self, name, record_type="A"):
+        with self.__lock:
+            self.__deferred.discard((name, record_type))
+        record = self.__records.pop((name, record_type), None)
+        if record is not None:
+            # a record added again later starts settling from scratch
+            self.__planner.forget(record)
+        return record
+
+    def reconfigure(self, name, record_type="A", domain=None, proxied=None, ttl=None, interval=None):
+        record = self.__records[(name, record_type)]
+        if domain is not None and domain != record.domain:
+            # the record lives now at another zone - its value and identifier must be looked up again
+            record.domain = domain
+            record.latest_ip = UNKNOWN_IP[record_type]
+            record.validated = False
+            record.client = None
+        if (proxied is not None and proxied != record.proxied) or (ttl is not None and ttl != record.ttl):
+            record.proxied = record.proxied if proxied is None else proxied
+            record.ttl = record.ttl if ttl is None else ttl
+            record.pending = True
+            # the zone and identifier are kept at the cache, so no lookup is done when creating it again
+            record.client = None
+        if interval is not None:
+            record.interval = interval
+        return record
+
+    def get(self, name, record_type="A"):
+        return self.__records.get((name, record_type))
+
+    def get_record_types(self) -> set:
+        return {record.record_type for record in self.__records.values()}
+
+    def get_records(self):
+        return list(self.__records.values())
+
+    def get_index(self) -> RecordIndex:
+        return self.__index
+
+    def __len__(self):
+        return len(self.__records)
+
+    def __iter__(self):
+        return iter(self.__records.values())
+
+    def _get_zone_id(self, record):
+        zone = self.__cache.get_zone(record.domain) if self.__cache else None
+        if zone is None:
+            zone = self.__index.get_zone_id(record.domain)
+            if self.__cache:
+                self.__cache.set_zone(record.domain, zone)
+        else:
+            # the index needs the domain for choosing the API token of the zone
+            self.__index.set_zone_id(record.domain, zone)
+        return zone
+
+    def _lookup(self, record):
+        zone = self._get_zone_id(record)
+        entry = self.__index.lookup(zone, record.name, record.record_type)
+        if entry is None:
+            raise ValueError("CloudFlare has no '{0}' Record named \"{1}\" at zone \"{2}\""
+                             .format(record.record_type, record.name, record.domain))
+        if self.__cache:
+            self.__cache.set_record(zone, record.name, entry["id"], record.record_type)
+        return zone, entry
+
+    def get_client(self, record):
+        if record.client is None:
+            zone = self._get_zone_id(record)
+            identifier = self.__cache.get_record(zone, record.name, record.record_type) if self.__cache else None
+            if identifier is None:
+                zone, entry = self._lookup(record)
+                identifier = entry["id"]
+                record.validated = True
+            record.client = CloudFlare(domain=record.domain,
+                                       name=record.name,
+                                       key=None,
+                                       mail=None,
+                                       proxied=record.proxied,
+                                       zone=zone,
+                                       identifier=identifier,
+                                       record_type=record.record_type,
+                                       ttl=record.ttl,
+                                       headers=self.__credentials.get_headers(record.domain))
+        return record.client
+
+    def resolve(self, record):
+        if record.is_unknown():
+            record.latest_ip = self._lookup(record)[1]["content"]
+            self._debug("CloudFlare {0} Record value for \"{1}\": \"{2}\""
+                        .format(record.record_type, record.name, record.latest_ip))
+        return record.latest_ip
+
+    def _get_current(self, record):
+        zone = record.client.get_zone() if record.client is not None else self._get_zone_id(record)
+        return self.__index.get_cached(zone, record.name, record.record_type)
+
+    def write(self, record, ip):
+        client = self.get_client(record)
+        # a newer IP could have replaced the planned one while waiting - it may be already there
+        changes = self.__planner.diff(record, ip, self._get_current(record))
+        if not changes:
+            record.latest_ip = ip
+            record.pending = False
+            return None
+        try:
+            code, result = client.update_record(changes)
+        except Exception as error:
+            self.__index.invalidate(client.get_zone(), record.name, record.record_type)
+            record.client = None
+            if not is_record_not_found(error) or not self.__cache:
+                raise
+            # the cached identifier is no longer valid - look it up again
+            self.__cache.drop_record(client.get_zone(), record.name, record.record_type)
+            self.__cache.drop_zone(record.domain)
+            self._debug("Cached identifier for \"{0}\" is outdated - dropping it".format(record.name))
+            if record.validated:
+                raise
+            client = self.get_client(record)
+            code, result = client.update_record(changes)
+        self._written(record, client.get_zone(), ip, changes, result)
+        return code
+
+    def _written(self, record, zone, ip, changes, result):
+        record.validated = True
+        record.pending = False
+        self.__planner.written(record)
+        RECORD_UPDATES.labels(record.record_type).inc()
+        entry = dict(changes, name=record.name, type=record.record_type)
+        if isinstance(result, dict):
+            entry.update(result)
+        self.__index.update(zone, entry)
+        record.latest_ip = ip
+
+    def write_batches(self, records, ip):
+        """
+        Writes the records grouped by zone through the batch endpoint. Returns the (record, code) pairs written and the
+        records that must be written one by one (alone at their zone, or their batch failed).
+        """
+        if self.__batch_size < 2 or not self.__batch_supported or len(records) < 2:
+            return [], list(records)
+        results = []
+        remaining = []
+        zones = {}
+        for record in records:
+            try:
+                zones.setdefault(self.get_client(record).get_zone(), []).append(record)
+            except Exception as error:
+                results.append((record, error))
+        for zone, zone_records in zones.items():
+            for start in range(0, len(zone_records), self.__batch_size):
+                chunk = zone_records[start:start + self.__batch_size]
+                if len(chunk) < 2 or not self.__batch_supported:
+                    remaining.extend(chunk)
+                    continue
+                try:
+                    results.extend(self._write_batch(zone, chunk, ip))
+                except Exception as error:
+                    # batches are applied atomically, so every record is still pending
+                    self._debug("Batch update of {0} records at zone \"{1}\" failed - writing them one by one ({2})"
+                                .format(len(chunk), zone, error))
+                    self.__index.invalidate(zone)
+                    if is_batch_unsupported(error):
+                        self.__batch_supported = False
+                    remaining.extend(chunk)
+        return results, remaining
+
+    def _write_batch(self, zone, records, ip):
+        results = []
+        patches = []
+        planned = []
+        for record in records:
+            changes = self.__planner.diff(record, ip, self._get_current(record))
+            if not changes:
+                record.latest_ip = ip
+                record.pending = False
+                results.append((record, None))
+                continue
+            patches.append(record.client.encode_changes(changes, with_id=True))
+            planned.append((record, record.client.get_identifier(), changes))
+        if not patches:
+            return results
+        code, result = cloudflare_batch(self.__credentials.get_headers(records[0].domain), zone, patches)
+        returned = {entry.get("id"): entry for entry in result.get("patches") or []}
+        for record, identifier, changes in planned:
+            self._written(record, zone, ip, changes, returned.get(identifier))
+            results.append((record, code))
+        return results
+
+    def write_all(self, records, ip):
+        results, remaining = self.write_batches(records, ip)
+
+        def write(record):
+            try:
+                return record, self.write(record, ip)
+            except Exception as error:
+                return record, error
+
+        if len(remaining) < 2:
+            results.extend(write(record) for record in remaining)
+        else:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.__parallel, thread_name_prefix="cloudflare")
+            results.extend(self.__executor.map(write, remaining))
+        return results
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+
+    def flush(self):
+        if self.__cache:
+            self.__cache.save()
+
+    def sweep(self) -> int:
+        """
+        Reconciles the records of some zones with their real state at CloudFlare, so that every zone is listed once
+        every "sweep_interval" seconds, spread over the checks. Returns how many records were changed by someone else.
+        """
+        if not self.__sweep_interval:
+            return 0
+        now = monotonic()
+        by_zone = {}
+        for record in list(self.__records.values()):
+            if record.is_unknown():
+                # it is read from CloudFlare anyway
+                continue
+            try:
+                by_zone.setdefault(self._get_zone_id(record), []).append(record)
+            except Exception as error:
+                self._debug("Unable to find the zone of \"{0}\" - {1}".format(record.name, error))
+        elapsed = now - self.__last_sweep if self.__last_sweep is not None else 0.0
+        self.__last_sweep = now
+        self.__sweep_credit = min(self.__sweep_credit + len(by_zone) * elapsed / self.__sweep_interval, len(by_zone))
+        count = int(self.__sweep_credit)
+        if not count:
+            return 0
+        self.__sweep_credit -= count
+        drifted = 0
+        # the zones that were never reconciled, or the longest ago, go first
+        for zone in sorted(by_zone, key=lambda zone: (self.__swept.get(zone, 0.0), zone))[:count]:
+            self.__swept[zone] = now
+            try:
+                drifted += self._reconcile(zone, by_zone[zone])
+            except Exception as error:
+                count_error(error)
+                self._error("Unable to check the records of zone \"{0}\" for changes - {1}"
+                            .format(by_zone[zone][0].domain, error))
+        self.flush()
+        return drifted
+
+    def _reconcile(self, zone, records) -> int:
+        # a single paginated listing of the zone - never one request per record
+        self.__index.load_zone(zone)
+        drifted = 0
+        for record in records:
+            entry = self.__index.get_cached(zone, record.name, record.record_type)
+            if entry is None:
+                self._warning("\"{0}\" ('{1}') no longer exists at CloudFlare".format(record.name, record.record_type))
+                record.client = None
+                record.validated = False
+                if self.__cache:
+                    self.__cache.drop_record(zone, record.name, record.record_type)
+                continue
+            if record.client is not None and record.client.get_identifier() != entry["id"]:
+                # deleted and created again
+                record.client = None
+                if self.__cache:
+                    self.__cache.set_record(zone, record.name, entry["id"], record.record_type)
+            # only the address counts - the TTL and proxied flag are set by the planner whenever the record is written
+            if entry["content"] == record.latest_ip:
+                continue
+            drifted += 1
+            DRIFTED_RECORDS.labels(record.record_type).inc()
+            self._warning("\"{0}\" was changed outside the daemon - expected IP: {1} | IP at CloudFlare: {2}"
+                          .format(record.name, record.latest_ip, entry["content"]))
+            record.latest_ip = entry["content"]
+        return drifted
+
+    def get_records_for(self, ip) -> list:
+        record_type = record_type_of(ip)
+        return [record for record in self.__records.values() if record.record_type == record_type]
+
+    def confirm_by_dns(self, records, ip) -> list:
+        if not self.__verifier.is_enabled():
+            return records
+        # proxied records are answered with CloudFlare addresses, never with their own
+        questions = [(record.domain, record.name, record.record_type) for record in records if not record.proxied]
+        try:
+            confirmed = self.__verifier.confirm(questions, ip)
+        except OSError as error:
+            self._debug("Unable to check the records at DNS - {0}".format(error))
+            return records
+        remaining = []
+        for record in records:
+            if (record.domain, record.name, record.record_type) in confirmed:
+                self._debug("\"{0}\" already shows \"{1}\" at DNS - not read from CloudFlare".format(record.name, ip))
+                record.latest_ip = ip
+            else:
+                remaining.append(record)
+        return remaining
+
+    def watch_propagation(self, records, ip):
+        self.__verifier.watch([(record.domain, record.name, record.record_type)
+                               for record in records if not record.proxied], ip)
+
+    def get_unread(self, ip) -> list:
+        """Returns the records of the family of "ip" whose value must be read from CloudFlare."""
+        return self.confirm_by_dns([record for record in self.get_records_for(ip) if record.is_unknown()], ip)
+
+    def get_outdated(self, ip, reads=None):
+        """
+        Returns the records that must be written, and the errors of the records whose value could not be read. "reads"
+        are the (record, value or error) pairs of the records from get_unread - they are read one by one if not given.
+        """
+        if reads is None:
+            reads = []
+            for record in self.get_unread(ip):
+                try:
+                    reads.append((record, self.resolve(record)))
+                except Exception as error:
+                    reads.append((record, error))
+        failures = {}
+        for record, content in reads:
+            if isinstance(content, Exception):
+                # e.g. the record does not exist - the others are updated anyway
+                count_error(content)
+                self._error("Unable to read CloudFlare {0} Record value for \"{1}\" - {2}"
+                            .format(record.record_type, record.name, content))
+                failures[record.name] = content
+        return [record for record in self.get_records_for(ip) if record.is_outdated(ip)], failures
+
+    def select_writes(self, records, ip) -> list:
+        record_type = record_type_of(ip)
+        with self.__lock:
+            previous = self.__deferred
+            self.__deferred = {key for key in previous if key[1] != record_type}
+        selected = []
+        deferred = set()
+        for record in records:
+            plan = self.__planner.plan(record, ip, self._get_current(record))
+            if plan is None:
+                self._debug("\"{0}\" already has the expected values at CloudFlare - skipping".format(record.name))
+                record.latest_ip = ip
+                record.pending = False
+            elif plan == DEFERRED:
+                key = (record.name, record.record_type)
+                if key not in previous:
+                    self._warning("IP for \"{0}\" changed to {1} - waiting for it to settle before writing it"
+                                  .format(record.name, ip))
+                deferred.add(key)
+            else:
+                self._warning(describe_update(record, ip))
+                selected.append(record)
+        with self.__lock:
+            self.__deferred |= deferred
+        return selected
+
+    def has_deferred(self) -> bool:
+        return bool(self.__deferred)
+
+    def update(self, ip):
+        outdated, results = self.get_outdated(ip)
+        return self.complete_update(ip, self.write_all(self.select_writes(outdated, ip), ip), results)
+
+    def complete_update(self, ip, writes, results) -> dict:
+        """Adds the (record, code or error) pairs of the writes to the results of the update and saves the state."""
+        written = []
+        for record, code in writes:
+            if isinstance(code, Exception):
+                count_error(code)
+                self._error("Unable to update \"{0}\" - {1}".format(record.name, code))
+                results[record.name] = code
+            elif code is not None:
+                results[record.name] = code
+                written.append(record)
+        self.watch_propagation(written, ip)
+        self.flush()
+        return results
+
+    def _debug(self, msg):
+        if self.__log:
+            self.__log.debug(msg)
+
+    def _warning(self, msg):
+        if self.__log:
+            self.__log.warning(msg)
+
+    def _error(self, msg):
+        if self.__log:
+            self.__log.error(msg)
@@ -0,0 +1,186 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import gzip
+import http.client
+import io
+import threading
+import zlib
+from time import monotonic
+from urllib.error import HTTPError
+from urllib.error import URLError
+from urllib.parse import urlsplit
+
+
+class Response(object):
+    __slots__ = ("url", "status", "headers", "body")
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getcode(self):
+        return self.status
+
+    def read(self):
+        return self.body
+
+    def text(self, encoding="utf8"):
+        return self.body.decode(encoding)
+
+
+class _HostPool(object):
+    def __init__(self, max_connections):
+        self.idle = []
+        self.slots = threading.BoundedSemaphore(max_connections)
+
+
+class HTTPSession(object):
+    """Keep-alive HTTP(S) connections, bounded per host and shared by every request of the process."""
+    _RETRY_ON_STALE = (http.client.RemoteDisconnected,
+                       http.client.BadStatusLine,
+                       ConnectionResetError,
+                       BrokenPipeError)
+
+    def __init__(self, max_connections=4, connect_timeout=5.0, read_timeout=15.0):
+        self.__max_connections = max_connections
+        self.__connect_timeout = connect_timeout
+        self.__read_timeout = read_timeout
+        self.__pools = {}
+        self.__lock = threading.Lock()
+        self.__stats = {"requests": 0,
+                        "connections_created": 0,
+                        "connections_reused": 0,
+                        "connections_dropped": 0}
+
+    def configure(self, max_connections=None, connect_timeout=None, read_timeout=None):
+        if max_connections is not None:
+            self.close()
+            self.__max_connections = max_connections
+        if connect_timeout is not None:
+            self.__connect_timeout = connect_timeout
+        if read_timeout is not None:
+            self.__read_timeout = read_timeout
+
+    def _get_pool(self, key):
+        with self.__lock:
+            pool = self.__pools.get(key)
+            if pool is None:
+                pool = _HostPool(self.__max_connections)
+                self.__pools[key] = pool
+            return pool
+
+    def _count(self, counter):
+        with self.__lock:
+            self.__stats[counter] += 1
+
+    def _new_connection(self, scheme, host, port, timeout):
+        connect_timeout = self.__connect_timeout if timeout is None else min(timeout, self.__connect_timeout)
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(host, port, timeout=connect_timeout)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.__read_timeout if timeout is None else timeout)
+        self._count("connections_created")
+        return connection
+
+    def request(self, method, url, data=None, headers=None, timeout=None, deadline=None):
+        if deadline is not None:
+            # no socket operation may outlive the deadline of the whole call
+            timeout = max(min(self.__read_timeout if timeout is None else timeout, deadline - monotonic()), 0.1)
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        request_headers = {"Connection": "keep-alive",
+                           "Accept-Encoding": "gzip, deflate"}
+        if headers:
+            request_headers.update(headers)
+
+        pool = self._get_pool((scheme, parts.hostname, port))
+        pool.slots.acquire()
+        try:
+            with self.__lock:
+                connection = pool.idle.pop() if pool.idle else None
+            reused = connection is not None
+            while True:
+                try:
+                    if connection is None:
+                        connection = self._new_connection(scheme, parts.hostname, port, timeout)
+                    elif timeout is not None:
+                        connection.sock.settimeout(timeout)
+                    connection.request(method, path, body=data, headers=request_headers)
+                    response = connection.getresponse()
+                    body = response.read()
+                    break
+                except self._RETRY_ON_STALE as error:
+                    if connection is not None:
+                        connection.close()
+                    connection = None
+                    self._count("connections_dropped")
+                    if not reused:
+                        raise URLError(error)
+                    reused = False
+                except (OSError, http.client.HTTPException) as error:
+                    if connection is not None:
+                        connection.close()
+                    self._count("connections_dropped")
+                    if isinstance(error, URLError):
+                        raise
+                    raise URLError(error)
+            self._count("requests")
+            if reused:
+                self._count("connections_reused")
+            if response.will_close:
+                connection.close()
+            else:
+                with self.__lock:
+                    pool.idle.append(connection)
+        finally:
+            pool.slots.release()
+
+        encoding = response.getheader("Content-Encoding", "").lower()
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "deflate":
+            body = zlib.decompress(body)
+        if response.status >= 400:
+            raise HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+        return Response(url, response.status, response.headers, body)
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats["connections_idle"] = sum(len(pool.idle) for pool in self.__pools.values())
+        return stats
+
+    def close(self):
+        with self.__lock:
+            for pool in self.__pools.values():
+                for connection in pool.idle:
+                    connection.close()
+            self.__pools = {}
+
+
+_session = HTTPSession()
+
+
+def get_session() -> HTTPSession:
+    return _session
@@ -0,0 +1,356 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import logging
+import multiprocessing
+import pickle
+import signal
+import threading
+import zlib
+from logging.handlers import QueueHandler
+
+from ..metrics.instruments import count_error
+from ..metrics.registry import get_changes
+from ..metrics.registry import get_registry
+from ..network.network_utils import record_type_of
+
+
+def shard_of(domain, shards) -> int:
+    # stable across restarts, so every worker keeps finding its zones at its own identifier cache
+    return zlib.crc32(domain.encode("utf-8")) % shards
+
+
+def _portable(error) -> Exception:
+    try:
+        return pickle.loads(pickle.dumps(error))
+    except Exception:
+        return RuntimeError("{0}: {1}".format(error.__class__.__name__, error))
+
+
+def _serve(connection, log_queue, options):
+    from ..network.circuit_breaker import configure_resilience
+    from ..network.dns_verifier import get_dns_verifier
+    from ..network.identifier_cache import IdentifierCache
+    from ..network.rate_limit import get_rate_limiter
+    from ..network.record_set import RecordSet
+    from ..network.session import get_session
+    from ..network.update_planner import get_update_planner
+
+    # the supervisor handles the signals and tells the workers when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    log = logging.getLogger(options["logger"])
+    log.handlers = [QueueHandler(log_queue)]
+    log.setLevel(options["log_level"])
+    log.propagate = False
+    get_session().configure(max_connections=options["connections"],
+                            connect_timeout=options["connect_timeout"],
+                            read_timeout=options["read_timeout"])
+    get_rate_limiter().configure(options["rate_limit"], window=300.0)
+    get_update_planner().configure(debounce=options["debounce"])
+    if options["resilience"]:
+        configure_resilience(**options["resilience"])
+    if options["dns_verification"]:
+        get_dns_verifier().configure(log=log, **options["dns_verification"])
+    records = RecordSet(key=options["key"],
+                        mail=options["mail"],
+                        log=log,
+                        cache=IdentifierCache(options["cache_file"]) if options["cache_file"] else None,
+                        batch_size=options["batch_size"],
+                        sweep_interval=options["sweep_interval"],
+                        credentials=options["credentials"])
+    # every answer carries what changed at the metrics of the worker since the previous one
+    metrics = {}
+    try:
+        while True:
+            command, args, kwargs = connection.recv()
+            if command == "stop":
+                break
+            if command == "add":
+                records.add(*args, **kwargs)
+            elif command == "remove":
+                records.remove(*args, **kwargs)
+            elif command == "reconfigure":
+                records.reconfigure(*args, **kwargs)
+            elif command == "sweep":
+                drifted = records.sweep()
+                snapshot = get_registry().snapshot()
+                connection.send((command, args, (drifted, get_changes(snapshot, metrics))))
+                metrics = snapshot
+            elif command == "update":
+                try:
+                    results = {name: _portable(code) if isinstance(code, Exception) else code
+                               for name, code in records.update(*args).items()}
+                except Exception as error:
+                    results = _portable(error)
+                snapshot = get_registry().snapshot()
+                # the answer repeats the request, so the supervisor can tell the answers to the IPv4 and IPv6 updates
+                connection.send((command, args, (results, records.has_deferred(),
+                                                 {"rate_limiter": get_rate_limiter().get_stats(),
+                                                  "planner": get_update_planner().get_stats()},
+                                                 get_changes(snapshot, metrics))))
+                metrics = snapshot
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        records.flush()
+        records.close()
+        get_session().close()
+
+
+class _Worker(object):
+    def __init__(self, context, shard, log_queue, options):
+        self.shard = shard
+        self.records = {}
+        self.deferred = False
+        self.stats = {}
+        # held from a request until its answer - the IPv4 and IPv6 updates are sent from different threads
+        self.lock = threading.Lock()
+        self.__context = context
+        self.__log_queue = log_queue
+        self.__options = options
+        self.__connection = None
+        self.__process = None
+
+    def is_alive(self) -> bool:
+        return self.__process is not None and self.__process.is_alive()
+
+    def start(self):
+        self.__connection, child_connection = self.__context.Pipe()
+        self.__process = self.__context.Process(target=_serve,
+                                                args=(child_connection, self.__log_queue, self.__options),
+                                                name="cloudflare-shard-{0}".format(self.shard),
+                                                daemon=True)
+        self.__process.start()
+        child_connection.close()
+        # a restarted worker gets every record of its shard again
+        for kwargs in self.records.values():
+            self.send("add", **kwargs)
+
+    def send(self, command, *args, **kwargs):
+        self.__connection.send((command, args, kwargs))
+
+    def receive(self, command, args, timeout=None):
+        if not self.__connection.poll(timeout):
+            raise TimeoutError("Shard {0} did not answer in {1} seconds".format(self.shard, timeout))
+        answered, answered_args, answer = self.__connection.recv()
+        if (answered, answered_args) != (command, args):
+            raise OSError("Shard {0} answered \"{1}\" instead of \"{2}\"".format(self.shard, answered, command))
+        return answer
+
+    def stop(self, timeout=5.0):
+        if self.__process is None:
+            return
+        try:
+            self.send("stop")
+        except (OSError, ValueError):
+            pass
+        self.__process.join(timeout)
+        if self.__process.is_alive():
+            self.__process.terminate()
+            self.__process.join(timeout)
+        self.__connection.close()
+        self.__process = None
+
+
+class ShardedRecordSet(object):
+    """
+    Same interface as RecordSet for the update loop, but the records are spread by zone across "workers" processes
+    that update them in parallel. The public IP is looked up once by the caller and sent to every worker, and the
+    results (and logs) of the workers are collected back.
+    """
+
+    def __init__(self, key, mail, workers, log=None, cache_file=None, batch_size=100, connections=4,
+                 connect_timeout=5.0, read_timeout=15.0, rate_limit=1200, debounce=0.0, sweep_interval=None,
+                 dns_verification=None, resilience=None, credentials=None, timeout=None, log_level=logging.WARNING,
+                 logger="cloudflareLogger"):
+        # workers are started with "spawn" - the supervisor has threads (logging, metrics) that must not be forked
+        self.__context = multiprocessing.get_context("spawn")
+        self.__log = log
+        self.__timeout = timeout
+        self.__log_queue = self.__context.Queue()
+        self.__log_thread = None
+        self.__lock = threading.Lock()
+        self.__shards = {}
+        self.__workers = []
+        for shard in range(workers):
+            options = {"key": key,
+                       "mail": mail,
+                       "credentials": credentials,
+                       "cache_file": "{0}.{1}".format(cache_file, shard) if cache_file else None,
+                       "batch_size": batch_size,
+                       "connections": connections,
+                       "connect_timeout": connect_timeout,
+                       "read_timeout": read_timeout,
+                       # every worker shares the same CloudFlare account limit
+                       "rate_limit": max(1, rate_limit // workers),
+                       "debounce": debounce,
+                       "sweep_interval": sweep_interval,
+                       "dns_verification": dns_verification,
+                       "resilience": resilience,
+                       "log_level": log_level,
+                       "logger": logger}
+            self.__workers.append(_Worker(self.__context, shard, self.__log_queue, options))
+
+    def _forward_logs(self):
+        while True:
+            record = self.__log_queue.get()
+            if record is None:
+                break
+            logger = logging.getLogger(record.name)
+            if logger.isEnabledFor(record.levelno):
+                logger.handle(record)
+
+    def _start(self, worker):
+        # the caller holds the lock of the worker
+        if worker.is_alive():
+            return
+        with self.__lock:
+            if self.__log_thread is None:
+                self.__log_thread = threading.Thread(target=self._forward_logs, name="cloudflare-shard-logs",
+                                                     daemon=True)
+                self.__log_thread.start()
+        worker.start()
+
+    def _ask(self, command, *args) -> list:
+        """
+        Sends a command to every worker with records and returns their (worker, answer) - the error when the worker
+        failed, after stopping it. It is started again (with its records) on the next use.
+        """
+        workers = [self.__workers[shard] for shard in sorted(set(self.__shards.values()))]
+        failures = {}
+        held = []
+        try:
+            # always taken in the same order, so two callers never wait for each other
+            for worker in workers:
+                worker.lock.acquire()
+                held.append(worker)
+                try:
+                    self._start(worker)
+                    worker.send(command, *args)
+                except (OSError, ValueError) as error:
+                    failures[worker.shard] = error
+            answers = []
+            for worker in workers:
+                try:
+                    if worker.shard in failures:
+                        raise failures[worker.shard]
+                    answers.append((worker, worker.receive(command, args, self.__timeout)))
+                except (EOFError, OSError, ValueError, TimeoutError) as error:
+                    worker.stop(timeout=0)
+                    answers.append((worker, RuntimeError("Shard {0} failed - {1}"
+                                                         .format(worker.shard, error or "stopped"))))
+                # the next caller can use this worker while the others answer
+                worker.lock.release()
+                held.remove(worker)
+            return answers
+        finally:
+            for worker in held:
+                worker.lock.release()
+
+    def add(self, domain, name, proxied=False, latest_ip=None, record_type="A", ttl=600, interval=None):
+        self.remove(name, record_type)
+        shard = shard_of(domain, len(self.__workers))
+        kwargs = {"domain": domain, "name": name, "proxied": proxied, "latest_ip": latest_ip,
+                  "record_type": record_type, "ttl": ttl, "interval": interval}
+        worker = self.__workers[shard]
+        with worker.lock:
+            self._start(worker)
+            worker.records[(name, record_type)] = kwargs
+            worker.send("add", **kwargs)
+        self.__shards[(name, record_type)] = shard
+
+    def remove(self, name, record_type="A"):
+        shard = self.__shards.pop((name, record_type), None)
+        if shard is None:
+            return None
+        worker = self.__workers[shard]
+        with worker.lock:
+            kwargs = worker.records.pop((name, record_type))
+            if worker.is_alive():
+                worker.send("remove", name, record_type)
+        return kwargs
+
+    def reconfigure(self, name, record_type="A", domain=None, proxied=None, ttl=None, interval=None):
+        shard = self.__shards[(name, record_type)]
+        kwargs = dict(self.__workers[shard].records[(name, record_type)])
+        if domain is not None and shard_of(domain, len(self.__workers)) != shard:
+            # the record moves to the worker of its new zone
+            kwargs.update({key: value for key, value in (("domain", domain), ("proxied", proxied), ("ttl", ttl),
+                                                         ("interval", interval)) if value is not None})
+            kwargs["latest_ip"] = None
+            self.add(**kwargs)
+            return
+        for key, value in (("domain", domain), ("proxied", proxied), ("ttl", ttl), ("interval", interval)):
+            if value is not None:
+                kwargs[key] = value
+        worker = self.__workers[shard]
+        with worker.lock:
+            self._start(worker)
+            worker.records[(name, record_type)] = kwargs
+            worker.send("reconfigure", name, record_type, domain=domain, proxied=proxied, ttl=ttl,
+                        interval=interval)
+
+    def get_record_types(self) -> set:
+        return {record_type for _, record_type in self.__shards}
+
+    def __len__(self):
+        return len(self.__shards)
+
+    def has_deferred(self) -> bool:
+        return any(worker.deferred for worker in self.__workers)
+
+    def get_stats(self) -> list:
+        return [worker.stats for worker in self.__workers]
+
+    def sweep(self) -> int:
+        drifted = 0
+        for worker, answer in self._ask("sweep"):
+            if isinstance(answer, Exception):
+                if self.__log:
+                    self.__log.error(str(answer))
+                continue
+            answer, metrics = answer
+            get_registry().merge(metrics)
+            drifted += answer
+        return drifted
+
+    def update(self, ip):
+        record_type = record_type_of(ip)
+        results = {}
+        for worker, answer in self._ask("update", ip):
+            if not isinstance(answer, Exception):
+                # the updates and errors of the worker are counted by its own metrics
+                answer, worker.deferred, worker.stats, metrics = answer
+                get_registry().merge(metrics)
+            if isinstance(answer, Exception):
+                answer = {name: answer for name, kind in worker.records if kind == record_type}
+                if self.__log:
+                    self.__log.error("Unable to update the records of shard {0} - {1}"
+                                     .format(worker.shard, next(iter(answer.values()), "")))
+                for code in answer.values():
+                    count_error(code)
+            results.update(answer)
+        if self.__log:
+            self.__log.debug("Shard stats: {0}".format(self.get_stats()))
+        return results
+
+    def close(self):
+        for worker in self.__workers:
+            worker.stop()
+        if self.__log_thread is not None:
+            self.__log_queue.put(None)
+            self.__log_thread.join(5.0)
+            self.__log_thread = None
@@ -0,0 +1,87 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import threading
+from time import monotonic
+
+DEFERRED = "deferred"
+
+
+class UpdatePlanner(object):
+    """
+    Compares the desired state of a record with the one known at CloudFlare and returns only the fields that differ
+    (None when nothing needs to be written). A new IP is only written once it has stayed the same for "debounce"
+    seconds - until then it is deferred, so an IP going back and forth ends up in a single write, or in none.
+    """
+
+    def __init__(self, debounce=0.0):
+        self.__debounce = debounce
+        self.__lock = threading.Lock()
+        self.__seen = {}
+        self.__stats = {"planned": 0, "suppressed": 0, "deferred": 0}
+
+    def configure(self, debounce):
+        self.__debounce = debounce
+
+    @staticmethod
+    def diff(record, ip, current=None) -> dict:
+        desired = {"content": ip, "ttl": record.ttl, "proxied": record.proxied}
+        if current is None:
+            # nothing else is known about the record at CloudFlare - send everything that may have changed
+            return desired if record.pending or record.latest_ip != ip else {}
+        changes = {key: value for key, value in desired.items() if current.get(key) != value}
+        if desired["proxied"]:
+            # CloudFlare always sets 'automatic' TTL for proxied records
+            changes.pop("ttl", None)
+        return changes
+
+    def plan(self, record, ip, current=None):
+        changes = self.diff(record, ip, current)
+        key = (record.name, record.record_type)
+        with self.__lock:
+            if not changes:
+                # e.g. the IP went back to the one at CloudFlare while it was settling
+                self.__seen.pop(key, None)
+                self.__stats["suppressed"] += 1
+                return None
+            if self.__debounce and "content" in changes:
+                now = monotonic()
+                seen_ip, since = self.__seen.get(key, (None, None))
+                if seen_ip != ip:
+                    self.__seen[key] = (ip, now)
+                    since = now
+                if now - since < self.__debounce:
+                    self.__stats["deferred"] += 1
+                    return DEFERRED
+            self.__stats["planned"] += 1
+            return changes
+
+    def written(self, record):
+        self.forget(record)
+
+    def forget(self, record):
+        with self.__lock:
+            self.__seen.pop((record.name, record.record_type), None)
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__stats)
+
+
+_planner = UpdatePlanner()
+
+
+def get_update_planner() -> UpdatePlanner:
+    return _planner
@@ -13,4 +13,20 @@
 #
 #     You should have received a copy of the GNU General Public License
 #    along with this program. If not, see <http://www.gnu.org/licenses/>.
-from ..preferences.user_preferences import UserPreferences
+# the state store (sqlite3) and the configuration file are only needed by some runs, so they are loaded on first use
+_LAZY_IMPORTS = {"UserPreferences": "user_preferences",
+                 "StateStore": "state_store",
+                 "ConfigWatcher": "config_file",
+                 "RecordSpec": "config_file",
+                 "diff_records": "config_file",
+                 "load_config": "config_file"}
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    from importlib import import_module
+
+    value = getattr(import_module("{0}.{1}".format(__name__, _LAZY_IMPORTS[name])), name)
+    globals()[name] = value
+    return value
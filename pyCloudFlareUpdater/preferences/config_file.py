@@ -0,0 +1,150 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+from collections import namedtuple
+
+RecordSpec = namedtuple("RecordSpec", ["domain", "name", "type", "ttl", "proxied", "interval"])
+
+
+def _read(filename) -> dict:
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".json":
+        import json
+
+        with open(filename, "r", encoding="utf-8") as fconfig:
+            return json.load(fconfig)
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError("Reading TOML files needs Python 3.11 or the \"tomli\" package")
+        with open(filename, "rb") as fconfig:
+            return tomllib.load(fconfig)
+    if extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("Reading YAML files needs the \"PyYAML\" package")
+        with open(filename, "r", encoding="utf-8") as fconfig:
+            try:
+                return yaml.safe_load(fconfig) or {}
+            except yaml.YAMLError as error:
+                raise ValueError(str(error))
+    raise ValueError("Unsupported configuration file \"{0}\" - use a .json, .toml or .yaml file".format(filename))
+
+
+def parse_config(content: dict):
+    """
+    Returns the global settings and the records described by a configuration like:
+
+        key = "..."
+        mail = "..."
+        token = "..."                 # or a scoped API token instead of the key and mail
+        interval = 5                  # minutes
+
+        [[zones]]
+        domain = "example.com"
+        token = "..."                 # optional, scoped API token for this zone only
+        proxied = false               # defaults for every record of the zone
+        ttl = 600                     # seconds, 1 is 'automatic'
+
+        [[zones.records]]
+        name = "home.example.com"
+        type = "AAAA"                 # optional, 'A' by default
+        interval = 1                  # optional, minutes
+
+        [[hooks]]
+        event = "ip_changed"          # "records_updated", "update_failed" or "all"
+        command = "/usr/local/bin/update-firewall"    # or url = "https://..." for a webhook
+        timeout = 10                  # optional, seconds
+    """
+    try:
+        settings = {key: value for key, value in content.items() if key != "zones"}
+        records = {}
+        for zone in content.get("zones", []):
+            domain = zone["domain"]
+            if zone.get("token"):
+                settings.setdefault("zone_tokens", {})[domain] = zone["token"]
+            for record in zone.get("records", []):
+                if isinstance(record, str):
+                    record = {"name": record}
+                spec = RecordSpec(domain=domain,
+                                  name=record["name"],
+                                  type=record.get("type", zone.get("type", "A")).upper(),
+                                  ttl=int(record.get("ttl", zone.get("ttl", 600))),
+                                  proxied=bool(record.get("proxied", zone.get("proxied", False))),
+                                  interval=record.get("interval", zone.get("interval", settings.get("interval"))))
+                if spec.type not in ("A", "AAAA"):
+                    raise ValueError("Record \"{0}\" has an unsupported type \"{1}\"".format(spec.name, spec.type))
+                records[(spec.name, spec.type)] = spec
+    except (AttributeError, KeyError, TypeError) as error:
+        raise ValueError("Invalid configuration - {0}: {1}".format(error.__class__.__name__, error))
+    return settings, records
+
+
+def load_config(filename):
+    return parse_config(_read(filename))
+
+
+def diff_records(old: dict, new: dict):
+    added = [spec for key, spec in new.items() if key not in old]
+    removed = [spec for key, spec in old.items() if key not in new]
+    changed = [spec for key, spec in new.items() if key in old and old[key] != spec]
+    return added, removed, changed
+
+
+class ConfigWatcher(object):
+    """Notices when the configuration file changes on disk or when a reload is requested (e.g. on SIGHUP)."""
+
+    def __init__(self, filename):
+        self.__filename = filename
+        self.__mtime = self._get_mtime()
+        self.__reload_requested = False
+        self.__settings, self.__records = load_config(filename)
+
+    def _get_mtime(self):
+        try:
+            stat = os.stat(self.__filename)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def get_filename(self):
+        return self.__filename
+
+    def get_settings(self) -> dict:
+        return self.__settings
+
+    def get_records(self) -> dict:
+        return self.__records
+
+    def request_reload(self):
+        self.__reload_requested = True
+
+    def has_changed(self) -> bool:
+        return self.__reload_requested or self._get_mtime() != self.__mtime
+
+    def reload(self):
+        """Reads the file again and returns the (added, removed, changed) records since the previous load."""
+        self.__reload_requested = False
+        self.__mtime = self._get_mtime()
+        settings, records = load_config(self.__filename)
+        changes = diff_records(self.__records, records)
+        self.__settings, self.__records = settings, records
+        return changes
@@ -0,0 +1,95 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import sqlite3
+import threading
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+def is_state_store(filename) -> bool:
+    try:
+        with open(filename, "rb") as fstore:
+            return fstore.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+
+class StateStore(object):
+    """
+    SQLite (WAL mode) storage for the user preferences: configuration values and the state of every record are kept
+    in different tables, so updating the latest IP of a record is a single small write.
+    """
+
+    def __init__(self, filename):
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        with self.__lock:
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute("PRAGMA synchronous=NORMAL")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS config ("
+                                      "key TEXT PRIMARY KEY, "
+                                      "value TEXT)")
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS records ("
+                                      "name TEXT NOT NULL, "
+                                      "type TEXT NOT NULL, "
+                                      "domain TEXT NOT NULL, "
+                                      "proxied INTEGER NOT NULL, "
+                                      "latest_ip TEXT NOT NULL, "
+                                      "PRIMARY KEY (name, type))")
+
+    def get_config(self) -> dict:
+        with self.__lock:
+            rows = self.__connection.execute("SELECT key, value FROM config").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set_config(self, config: dict):
+        with self.__lock, self.__connection:
+            self.__connection.execute("BEGIN")
+            self.__connection.executemany("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
+                                          [(key, json.dumps(value)) for key, value in config.items()])
+
+    def set_value(self, key, value):
+        with self.__lock:
+            self.__connection.execute("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
+                                      (key, json.dumps(value)))
+
+    def get_records(self) -> list:
+        with self.__lock:
+            rows = self.__connection.execute("SELECT name, type, domain, proxied, latest_ip FROM records").fetchall()
+        return [{"name": name, "type": record_type, "domain": domain, "proxied": bool(proxied), "latest_ip": latest_ip}
+                for name, record_type, domain, proxied, latest_ip in rows]
+
+    def set_records(self, records):
+        with self.__lock, self.__connection:
+            self.__connection.execute("BEGIN")
+            self.__connection.executemany("INSERT OR REPLACE INTO records (name, type, domain, proxied, latest_ip) "
+                                          "VALUES (?, ?, ?, ?, ?)",
+                                          [(record["name"], record.get("type", "A"), record["domain"],
+                                            int(record["proxied"]), record["latest_ip"]) for record in records])
+
+    def remove_record(self, name, record_type="A"):
+        with self.__lock:
+            self.__connection.execute("DELETE FROM records WHERE name = ? AND type = ?", (name, record_type))
+
+    def set_latest_ip(self, name, ip, record_type="A"):
+        with self.__lock:
+            self.__connection.execute("UPDATE records SET latest_ip = ? WHERE name = ? AND type = ?",
+                                      (ip, name, record_type))
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
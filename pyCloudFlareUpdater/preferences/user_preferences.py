@@ -42,9 +42,18 @@ class UserPreferences(object):
             self.__mail = None
             self.__pid = None
             self.__log = None
+        self.__token = None
+        self.__zone_tokens = {}
         self.__latest_ip = "0.0.0.0"
+        self.__latest_ipv6 = "::"
+        self.__ipv6 = False
+        self.__records = {}
+        self.__dirty_records = set()
         self.__proxy = True
         self.__daemonize = True
+        self.__filename = "cloudflare.user.preferences"
+        self.__store = None
+        self.__persisted = False
 
     @staticmethod
     def get_preferences_file():
@@ -52,48 +61,114 @@ class UserPreferences(object):
 
         return os.path.dirname(os.path.abspath(__file__)) + "/cloudflare.user.preferences"
 
-    def load_preferences(self):
+    def get_identifier_cache_file(self):
+        import os
+
+        return os.path.join(os.path.dirname(os.path.abspath(self.__filename)), "cloudflare.identifiers.cache")
+
+    def set_preferences_file(self, filename):
+        self.__filename = filename
+
+    def get_preferences_file_name(self):
+        return self.__filename
+
+    def _get_store(self):
+        from os import path
+        from os import makedirs
+
+        from ..preferences.state_store import StateStore
+        from ..preferences.state_store import is_state_store
+
+        if self.__store is None:
+            file_dir = path.dirname(path.abspath(self.__filename))
+            if not path.exists(file_dir):
+                makedirs(path=file_dir, exist_ok=True)
+            if path.exists(self.__filename) and not is_state_store(self.__filename):
+                self._migrate_pickle()
+            self.__store = StateStore(self.__filename)
+            self.__persisted = True
+        return self.__store
+
+    def _migrate_pickle(self):
+        import os
         import pickle
+
+        from ..preferences.state_store import StateStore
+
+        with open(self.__filename, "rb") as fpreferences:
+            preferences = pickle.load(fpreferences)
+        preferences["key"] = preferences["key"].decode("utf-8")
+        preferences["mail"] = preferences["mail"].decode("utf-8")
+        records = preferences.pop("records", [])
+        # the new store is completely written before replacing the old file
+        temp_file = self.__filename + ".migration"
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        store = StateStore(temp_file)
+        store.set_config(preferences)
+        store.set_records(records)
+        store.close()
+        os.replace(temp_file, self.__filename)
+
+    def load_preferences(self):
         import os
 
         from base64 import b64decode
 
-        if os.path.exists("cloudflare.user.preferences"):
-            with open("cloudflare.user.preferences", "rb") as fpreferences:
-                preferences = pickle.load(fpreferences)
+        if os.path.exists(self.__filename):
+            store = self._get_store()
+            preferences = store.get_config()
             self.__domain = preferences["domain"]
             self.__time = preferences["time"]
             self.__key = b64decode(preferences["key"]).decode("utf-8")
             self.__mail = b64decode(preferences["mail"]).decode("utf-8")
+            self.__token = b64decode(preferences.get("token", "")).decode("utf-8") or None
+            self.__zone_tokens = {domain: b64decode(token).decode("utf-8")
+                                  for domain, token in preferences.get("zone_tokens", {}).items()}
             self.__name = preferences["name"]
             self.__proxy = preferences["proxy"]
             self.__latest_ip = preferences["latest_ip"]
             self.__pid = preferences["pid"]
             self.__log = preferences["log"]
+            self.__latest_ipv6 = preferences.get("latest_ipv6", "::")
+            self.__ipv6 = preferences.get("ipv6", False)
+            self.__records = {(record["name"], record["type"]): record for record in store.get_records()}
+            self.__dirty_records = set()
         else:
             raise FileNotFoundError("There are no saved user preferences. Call \"save_preferences\" the first time")
 
-    def save_preferences(self, filename="cloudflare.user.preferences"):
-        import pickle
-
+    def save_preferences(self, filename=None):
         from base64 import b64encode
-        from os import path
-        from os import makedirs
 
+        if filename is not None and filename != self.__filename:
+            self.close()
+            self.__filename = filename
+            self.__persisted = False
+            self.__dirty_records = set(self.__records)
         preferences = {"domain": self.__domain,
                        "name": self.__name,
                        "time": self.__time,
-                       "key": b64encode(bytes(self.__key, "utf-8")),
-                       "mail": b64encode(bytes(self.__mail, "utf-8")),
+                       "key": b64encode(bytes(self.__key or "", "utf-8")).decode("utf-8"),
+                       "mail": b64encode(bytes(self.__mail or "", "utf-8")).decode("utf-8"),
+                       "token": b64encode(bytes(self.__token or "", "utf-8")).decode("utf-8"),
+                       "zone_tokens": {domain: b64encode(bytes(token, "utf-8")).decode("utf-8")
+                                       for domain, token in self.__zone_tokens.items()},
                        "proxy": self.__proxy,
                        "latest_ip": self.__latest_ip,
+                       "latest_ipv6": self.__latest_ipv6,
+                       "ipv6": self.__ipv6,
                        "pid": self.__pid,
                        "log": self.__log}
-        file_dir = path.dirname(path.abspath(filename))
-        if not path.exists(file_dir):
-            makedirs(path=file_dir, exist_ok=True)
-        with open(filename, "wb") as fpreferences:
-            pickle.dump(preferences, fpreferences, pickle.HIGHEST_PROTOCOL)
+        store = self._get_store()
+        store.set_config(preferences)
+        if self.__dirty_records:
+            store.set_records([self.__records[key] for key in self.__dirty_records])
+            self.__dirty_records = set()
+
+    def close(self):
+        if self.__store is not None:
+            self.__store.close()
+            self.__store = None
 
     def get_domain(self):
         return self.__domain
@@ -110,12 +185,37 @@ class UserPreferences(object):
     def get_mail(self):
         return self.__mail
 
+    def get_token(self):
+        return self.__token
+
+    def get_zone_tokens(self) -> dict:
+        return self.__zone_tokens
+
     def is_record_behind_proxy(self):
         return self.__proxy
 
     def get_latest_ip(self):
         return self.__latest_ip
 
+    def get_latest_ipv6(self):
+        return self.__latest_ipv6
+
+    def is_ipv6_enabled(self):
+        return self.__ipv6
+
+    def get_records(self) -> list:
+        records = list(self.__records.values())
+        if self.__domain and self.__name:
+            legacy = [("AAAA", self.__latest_ipv6)] if self.__ipv6 else []
+            for record_type, latest_ip in [("A", self.__latest_ip)] + legacy:
+                if (self.__name, record_type) not in self.__records:
+                    records.append({"domain": self.__domain,
+                                    "name": self.__name,
+                                    "type": record_type,
+                                    "proxied": self.__proxy,
+                                    "latest_ip": latest_ip})
+        return records
+
     def get_pid_file(self):
         return self.__pid
 
@@ -140,8 +240,52 @@ class UserPreferences(object):
     def set_mail(self, mail):
         self.__mail = mail
 
+    def set_token(self, token):
+        self.__token = token
+
+    def set_zone_tokens(self, zone_tokens: dict):
+        self.__zone_tokens = dict(zone_tokens)
+
     def set_latest_ip(self, ip):
         self.__latest_ip = ip
+        if self.__persisted:
+            self._get_store().set_value("latest_ip", ip)
+
+    def set_latest_ipv6(self, ip):
+        self.__latest_ipv6 = ip
+        if self.__persisted:
+            self._get_store().set_value("latest_ipv6", ip)
+
+    def enable_ipv6(self, enabled: bool):
+        self.__ipv6 = enabled
+
+    def add_record(self, domain, name, proxied=False, record_type="A"):
+        record = self.__records.get((name, record_type))
+        if record is None:
+            record = self.__records[(name, record_type)] = {"name": name,
+                                                            "type": record_type,
+                                                            "latest_ip": "::" if record_type == "AAAA" else "0.0.0.0"}
+        record["domain"] = domain
+        record["proxied"] = proxied
+        self.__dirty_records.add((name, record_type))
+
+    def remove_record(self, name, record_type="A"):
+        if self.__records.pop((name, record_type), None) is not None:
+            self.__dirty_records.discard((name, record_type))
+            if self.__persisted:
+                self._get_store().remove_record(name, record_type)
+
+    def set_record_latest_ip(self, name, ip, record_type="A"):
+        record = self.__records.get((name, record_type))
+        if record is not None:
+            record["latest_ip"] = ip
+            if self.__persisted and (name, record_type) not in self.__dirty_records:
+                self._get_store().set_latest_ip(name, ip, record_type)
+        if name == self.__name:
+            if record_type == "AAAA":
+                self.set_latest_ipv6(ip)
+            else:
+                self.set_latest_ip(ip)
 
     def set_pid_file(self, pid):
         self.__pid = pid
@@ -155,8 +299,7 @@ class UserPreferences(object):
     def run_as_daemon(self, daemonize: bool):
         self.__daemonize = daemonize
 
-    @staticmethod
-    def are_preferences_stored():
+    def are_preferences_stored(self):
         import os
 
-        return os.path.exists("cloudflare.user.preferences")
+        return os.path.exists(self.__filename)
@@ -0,0 +1,94 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import random
+
+
+class AdaptiveScheduler(object):
+    """
+    Decides how long to wait until the next check: faster right after a change or a failure, exponentially slower
+    while the IP stays the same, and always with some random jitter so many daemons do not wake up together.
+    """
+    CHANGED = "changed"
+    DEFAULT_BACKOFF_LIMIT = 4
+    FAILED = "failed"
+    UNCHANGED = "unchanged"
+
+    def __init__(self, base_interval, min_interval=None, max_interval=None, backoff_factor=2.0, stable_cycles=3,
+                 jitter=0.1):
+        self.__base_interval = base_interval
+        self.__min_interval = min(base_interval, 60) if min_interval is None else min_interval
+        # without an explicit ceiling, back off up to a few times the regular interval
+        self.__default_max = max_interval is None
+        self.__max_interval = base_interval * self.DEFAULT_BACKOFF_LIMIT if max_interval is None \
+            else max(max_interval, base_interval)
+        self.__backoff_factor = backoff_factor
+        self.__stable_cycles = stable_cycles
+        self.__jitter = jitter
+        self.__interval = base_interval
+        self.__unchanged = 0
+        self.__failures = 0
+        self.__last_decision = None
+
+    def next_delay(self, outcome) -> float:
+        if outcome == self.CHANGED:
+            # confirm quickly that the new address is stable
+            self.__unchanged = 0
+            self.__failures = 0
+            self.__interval = self.__min_interval
+            reason = "IP changed - checking again soon"
+        elif outcome == self.FAILED:
+            self.__unchanged = 0
+            self.__failures += 1
+            self.__interval = min(self.__min_interval * self.__backoff_factor ** (self.__failures - 1),
+                                  self.__base_interval)
+            reason = "check failed {0} time{1} in a row - retrying".format(self.__failures,
+                                                                           's' if self.__failures > 1 else '')
+        else:
+            self.__failures = 0
+            self.__unchanged += 1
+            if self.__interval < self.__base_interval:
+                self.__interval = self.__base_interval
+                reason = "IP unchanged - back to the regular interval"
+            elif self.__unchanged > self.__stable_cycles and self.__interval < self.__max_interval:
+                self.__interval = min(self.__interval * self.__backoff_factor, self.__max_interval)
+                reason = "IP unchanged for {0} checks - backing off".format(self.__unchanged)
+            else:
+                reason = "IP unchanged"
+        delay = self.__interval * random.uniform(1 - self.__jitter, 1 + self.__jitter)
+        self.__last_decision = {"outcome": outcome,
+                                "interval": self.__interval,
+                                "delay": delay,
+                                "reason": reason}
+        return delay
+
+    def set_base_interval(self, base_interval):
+        if self.__default_max:
+            self.__max_interval = base_interval * self.DEFAULT_BACKOFF_LIMIT
+        else:
+            self.__max_interval = max(self.__max_interval, base_interval)
+        self.__min_interval = min(self.__min_interval, base_interval)
+        self.__base_interval = base_interval
+        self.__interval = base_interval
+        self.__unchanged = 0
+
+    def get_base_interval(self):
+        return self.__base_interval
+
+    def get_last_decision(self) -> dict:
+        return self.__last_decision
+
+    def get_interval(self):
+        return self.__interval
@@ -13,7 +13,10 @@
 #
 #     You should have received a copy of the GNU General Public License
 #    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+
 description = """pyCloudFlareUpdater\n\n
 The first time this application is executed, all params must be included in order to save the user preferences 
 and do this process automatically."""
-cloudflare_base_url = "https://api.cloudflare.com/client/v4/{0}"
+# can be changed for running against a local API (e.g. the benchmarks stand-in)
+cloudflare_base_url = os.environ.get("CLOUDFLARE_API_URL", "https://api.cloudflare.com/client/v4").rstrip("/") + "/{0}"
@@ -17,7 +17,10 @@ setup(
               'pyCloudFlareUpdater.values',
               'pyCloudFlareUpdater.network',
               'pyCloudFlareUpdater.preferences',
-              'pyCloudFlareUpdater.logging_utils'],
+              'pyCloudFlareUpdater.logging_utils',
+              'pyCloudFlareUpdater.scheduling',
+              'pyCloudFlareUpdater.metrics',
+              'pyCloudFlareUpdater.hooks'],
     url='https://gitlab.javinator9889.com/ddns-clients/pyCloudFlareUpdater',
     license='GPLv3',
     author='Javinator9889',
@@ -33,6 +36,7 @@ setup(
         'console_scripts': ['cloudflare_ddns=pyCloudFlareUpdater.__main__:parser']
     },
     install_requires=['daemonize'],
+    extras_require={'yaml': ['PyYAML'], 'toml': ['tomli; python_version < "3.11"']},
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Programming Language :: Python',
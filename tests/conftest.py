@@ -0,0 +1,42 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import os
+
+import pytest
+
+from benchmarks.fake_servers import FakeCloudFlare
+
+# the API URL is read when the updater is imported, so a single stand-in serves every test
+_api = FakeCloudFlare().start()
+os.environ["CLOUDFLARE_API_URL"] = _api.get_url()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    _api.stop()
+
+
+@pytest.fixture
+def api():
+    _api.reset()
+    return _api
+
+
+@pytest.fixture(autouse=True)
+def resilience():
+    from pyCloudFlareUpdater.network import configure_resilience
+
+    # failures are answered at once and never open the circuit of the following tests
+    configure_resilience(max_retries=0, deadline=10.0, threshold=0)
@@ -0,0 +1,62 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from pyCloudFlareUpdater.scheduling.adaptive_scheduler import AdaptiveScheduler
+
+
+def _scheduler(**kwargs):
+    kwargs.setdefault("jitter", 0)
+    return AdaptiveScheduler(300, **kwargs)
+
+
+def test_backs_off_up_to_default_ceiling():
+    scheduler = _scheduler(stable_cycles=1)
+    intervals = []
+    for _ in range(6):
+        scheduler.next_delay(AdaptiveScheduler.UNCHANGED)
+        intervals.append(scheduler.get_interval())
+    assert intervals == [300, 600, 1200, 1200, 1200, 1200]
+
+
+def test_explicit_ceiling_is_honoured():
+    scheduler = _scheduler(stable_cycles=0, max_interval=500)
+    for _ in range(5):
+        scheduler.next_delay(AdaptiveScheduler.UNCHANGED)
+    assert scheduler.get_interval() == 500
+
+
+def test_new_base_interval_moves_default_ceiling():
+    scheduler = _scheduler(stable_cycles=0)
+    scheduler.set_base_interval(60)
+    for _ in range(10):
+        scheduler.next_delay(AdaptiveScheduler.UNCHANGED)
+    assert scheduler.get_interval() == 240
+
+
+def test_change_and_failures_check_sooner():
+    scheduler = _scheduler(stable_cycles=1)
+    for _ in range(4):
+        scheduler.next_delay(AdaptiveScheduler.UNCHANGED)
+    assert scheduler.next_delay(AdaptiveScheduler.CHANGED) == 60
+    delays = [scheduler.next_delay(AdaptiveScheduler.FAILED) for _ in range(5)]
+    assert delays == [60, 120, 240, 300, 300]
+    assert scheduler.next_delay(AdaptiveScheduler.UNCHANGED) == 300
+
+
+def test_jitter_stays_within_bounds():
+    scheduler = _scheduler(jitter=0.1, stable_cycles=1000)
+    delays = [scheduler.next_delay(AdaptiveScheduler.UNCHANGED) for _ in range(500)]
+    assert all(270 <= delay <= 330 for delay in delays)
+    assert len(set(delays)) > 1
@@ -0,0 +1,115 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import pytest
+
+from pyCloudFlareUpdater.network import circuit_breaker
+from pyCloudFlareUpdater.network.circuit_breaker import CLOSED
+from pyCloudFlareUpdater.network.circuit_breaker import HALF_OPEN
+from pyCloudFlareUpdater.network.circuit_breaker import OPEN
+from pyCloudFlareUpdater.network.circuit_breaker import CircuitBreaker
+from pyCloudFlareUpdater.network.circuit_breaker import CircuitOpenError
+from pyCloudFlareUpdater.network.circuit_breaker import RetryPolicy
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker, "monotonic", lambda: now[0])
+    return now
+
+
+def _open(breaker, failures=3):
+    for _ in range(failures):
+        assert breaker.allow()
+        breaker.failure()
+
+
+def test_opens_after_threshold(clock):
+    breaker = CircuitBreaker("api", threshold=3, cooldown=30)
+    _open(breaker, 2)
+    assert breaker.get_state() == CLOSED
+    _open(breaker, 1)
+    assert breaker.get_state() == OPEN
+    assert not breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert breaker.get_stats() == {"opened": 1, "rejected": 2, "state": OPEN, "failures": 3}
+    assert breaker.get_retry_in() == 30
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("api", threshold=3)
+    _open(breaker, 2)
+    breaker.success()
+    _open(breaker, 2)
+    assert breaker.get_state() == CLOSED
+
+
+def test_single_probe_after_cooldown_closes_on_success(clock):
+    breaker = CircuitBreaker("api", threshold=3, cooldown=30)
+    _open(breaker)
+    clock[0] += 30
+    assert breaker.allow()
+    assert breaker.get_state() == HALF_OPEN
+    # only the probe goes through
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.get_state() == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_doubles_cooldown_up_to_max(clock):
+    breaker = CircuitBreaker("api", threshold=3, cooldown=30, max_cooldown=100)
+    _open(breaker)
+    for expected in (60, 100, 100):
+        clock[0] += breaker.get_retry_in()
+        assert breaker.allow()
+        breaker.failure()
+        assert breaker.get_state() == OPEN
+        assert breaker.get_retry_in() == expected
+    clock[0] += 100
+    assert breaker.allow()
+    breaker.success()
+    # the cooldown starts over once the endpoint recovers
+    _open(breaker)
+    assert breaker.get_retry_in() == 30
+
+
+def test_release_reopens_without_longer_cooldown(clock):
+    breaker = CircuitBreaker("api", threshold=3, cooldown=30)
+    _open(breaker)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.get_state() == OPEN
+    # the cooldown already ended, so the next caller is the probe
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.get_retry_in() == 60
+
+
+def test_zero_threshold_never_opens(clock):
+    breaker = CircuitBreaker("api", threshold=0)
+    _open(breaker, 50)
+    assert breaker.get_state() == CLOSED
+    assert breaker.allow()
+
+
+def test_retry_delay_grows_within_bounds():
+    policy = RetryPolicy(backoff=0.5)
+    for attempt in range(5):
+        delay = policy.get_delay(attempt)
+        assert 0.25 * 2 ** attempt <= delay <= 0.5 * 2 ** attempt
@@ -0,0 +1,166 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+
+import pytest
+
+from pyCloudFlareUpdater.preferences.config_file import ConfigWatcher
+from pyCloudFlareUpdater.preferences.config_file import RecordSpec
+from pyCloudFlareUpdater.preferences.config_file import diff_records
+from pyCloudFlareUpdater.preferences.config_file import load_config
+from pyCloudFlareUpdater.preferences.config_file import parse_config
+
+TOML = """
+key = "api-key"
+mail = "mail@example.com"
+interval = 5
+
+[[zones]]
+domain = "example.com"
+token = "zone-token"
+proxied = true
+ttl = 1
+
+[[zones.records]]
+name = "home.example.com"
+
+[[zones.records]]
+name = "home.example.com"
+type = "aaaa"
+proxied = false
+interval = 1
+
+[[zones]]
+domain = "example.org"
+records = ["www.example.org"]
+"""
+
+CONFIG = {"key": "api-key",
+          "mail": "mail@example.com",
+          "interval": 5,
+          "zones": [{"domain": "example.com",
+                     "token": "zone-token",
+                     "proxied": True,
+                     "ttl": 1,
+                     "records": [{"name": "home.example.com"},
+                                 {"name": "home.example.com", "type": "aaaa", "proxied": False, "interval": 1}]},
+                    {"domain": "example.org", "records": ["www.example.org"]}]}
+
+RECORDS = {("home.example.com", "A"): RecordSpec("example.com", "home.example.com", "A", 1, True, 5),
+           ("home.example.com", "AAAA"): RecordSpec("example.com", "home.example.com", "AAAA", 1, False, 1),
+           ("www.example.org", "A"): RecordSpec("example.org", "www.example.org", "A", 600, False, 5)}
+
+
+def _write(filename, content):
+    with open(filename, "w", encoding="utf-8") as fconfig:
+        fconfig.write(content)
+
+
+def _touch(filename):
+    # a rewrite within the same clock tick keeps the modification time
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+
+@pytest.mark.parametrize("extension,content", [(".toml", TOML), (".json", json.dumps(CONFIG))])
+def test_toml_and_json_files_describe_the_same_records(tmp_path, extension, content):
+    filename = str(tmp_path / ("config" + extension))
+    _write(filename, content)
+    settings, records = load_config(filename)
+    assert settings == {"key": "api-key", "mail": "mail@example.com", "interval": 5,
+                        "zone_tokens": {"example.com": "zone-token"}}
+    assert records == RECORDS
+
+
+def test_records_override_the_zone_defaults():
+    _, records = parse_config({"interval": 10,
+                               "zones": [{"domain": "example.com", "type": "AAAA", "ttl": 300, "interval": 2,
+                                          "records": [{"name": "a.example.com"},
+                                                      {"name": "b.example.com", "type": "A", "ttl": 60,
+                                                       "proxied": True, "interval": 1}]}]})
+    assert records == {("a.example.com", "AAAA"): RecordSpec("example.com", "a.example.com", "AAAA", 300, False, 2),
+                       ("b.example.com", "A"): RecordSpec("example.com", "b.example.com", "A", 60, True, 1)}
+
+
+@pytest.mark.parametrize("content", [{"zones": [{"records": ["home.example.com"]}]},
+                                     {"zones": [{"domain": "example.com", "records": [{"type": "A"}]}]},
+                                     {"zones": [{"domain": "example.com",
+                                                 "records": [{"name": "home.example.com", "type": "MX"}]}]},
+                                     {"zones": "example.com"}])
+def test_invalid_configurations_are_rejected(content):
+    with pytest.raises(ValueError):
+        parse_config(content)
+
+
+def test_unsupported_files_are_rejected(tmp_path):
+    filename = str(tmp_path / "config.ini")
+    _write(filename, "key = api-key")
+    with pytest.raises(ValueError):
+        load_config(filename)
+
+
+def test_diff_records():
+    old = dict(RECORDS)
+    new = dict(RECORDS)
+    removed = new.pop(("www.example.org", "A"))
+    new[("home.example.com", "AAAA")] = new[("home.example.com", "AAAA")]._replace(ttl=600)
+    new[("api.example.com", "A")] = RecordSpec("example.com", "api.example.com", "A", 1, True, 5)
+    assert diff_records(old, new) == ([new[("api.example.com", "A")]], [removed],
+                                      [new[("home.example.com", "AAAA")]])
+    assert diff_records(old, dict(old)) == ([], [], [])
+
+
+def test_the_watcher_notices_a_changed_file(tmp_path):
+    filename = str(tmp_path / "config.json")
+    _write(filename, json.dumps(CONFIG))
+    watcher = ConfigWatcher(filename)
+    assert not watcher.has_changed()
+    assert watcher.get_records() == RECORDS
+
+    config = json.loads(json.dumps(CONFIG))
+    config["zones"][1]["records"] = ["api.example.org"]
+    _write(filename, json.dumps(config))
+    _touch(filename)
+    assert watcher.has_changed()
+    added, removed, changed = watcher.reload()
+    assert [spec.name for spec in added] == ["api.example.org"]
+    assert [spec.name for spec in removed] == ["www.example.org"]
+    assert changed == []
+    assert not watcher.has_changed()
+
+
+def test_a_reload_request_reads_the_file_again(tmp_path):
+    filename = str(tmp_path / "config.json")
+    _write(filename, json.dumps(CONFIG))
+    watcher = ConfigWatcher(filename)
+    # as on SIGHUP - the file did not change
+    watcher.request_reload()
+    assert watcher.has_changed()
+    assert watcher.reload() == ([], [], [])
+    assert not watcher.has_changed()
+    assert watcher.get_settings()["interval"] == 5
+
+
+def test_an_invalid_file_keeps_the_previous_records(tmp_path):
+    filename = str(tmp_path / "config.json")
+    _write(filename, json.dumps(CONFIG))
+    watcher = ConfigWatcher(filename)
+    _write(filename, "{\"zones\": [{\"records\": []}]}")
+    _touch(filename)
+    with pytest.raises(ValueError):
+        watcher.reload()
+    assert watcher.get_records() == RECORDS
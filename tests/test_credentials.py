@@ -0,0 +1,76 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import pytest
+
+from pyCloudFlareUpdater.network import RecordSet
+from pyCloudFlareUpdater.network.credentials import Credentials
+
+IP = "93.184.216.34"
+
+
+def _update(api, credentials):
+    records = RecordSet(key=None, mail=None, credentials=credentials)
+    for domain, name in api.populate(4, "1.1.1.1", records_per_zone=2):
+        records.add(domain, name)
+    try:
+        return records.update(IP)
+    finally:
+        records.close()
+
+
+def _sent(api) -> dict:
+    # the credentials seen at the requests of each zone - the zones are listed by name
+    sent = {}
+    for path, credential in api.get_credentials():
+        zone = path.split("/")[1] if path.startswith("zones/") else path
+        sent.setdefault(zone, set()).add(credential)
+    return sent
+
+
+def test_a_zone_token_is_used_for_its_zone_only(api):
+    api.add_token("zone-token", ["zone00000"])
+    api.add_token("global-token", ["zone00000", "zone00001"])
+    results = _update(api, Credentials(token="global-token", zone_tokens={"Zone0.example.": "zone-token"}))
+    assert results == {"host0.zone0.example": 200, "host1.zone0.example": 200, "host2.zone1.example": 200,
+                       "host3.zone1.example": 200}
+    sent = _sent(api)
+    assert sent["zone00000"] == {"Bearer zone-token"}
+    assert sent["zone00001"] == {"Bearer global-token"}
+    assert sent["zones"] == {"Bearer zone-token", "Bearer global-token"}
+
+
+def test_zones_without_a_token_fall_back_to_the_api_key(api):
+    api.add_token("zone-token", ["zone00000"])
+    results = _update(api, Credentials(key="api-key", mail="mail@example.com",
+                                       zone_tokens={"zone0.example": "zone-token"}))
+    assert not any(isinstance(code, Exception) for code in results.values()) and len(results) == 4
+    sent = _sent(api)
+    assert sent["zone00000"] == {"Bearer zone-token"}
+    assert sent["zone00001"] == {"X-Auth-Key api-key"}
+
+
+def test_a_zone_without_any_credential_fails_alone(api):
+    api.add_token("zone-token", ["zone00000"])
+    results = _update(api, Credentials(zone_tokens={"zone0.example": "zone-token"}))
+    assert results.pop("host0.zone0.example") == 200 and results.pop("host1.zone0.example") == 200
+    assert sorted(results) == ["host2.zone1.example", "host3.zone1.example"]
+    assert all(isinstance(code, ValueError) for code in results.values())
+    assert set(_sent(api)) == {"zones", "zone00000"}
+
+
+def test_credentials_are_needed():
+    with pytest.raises(ValueError):
+        Credentials(key="api-key")
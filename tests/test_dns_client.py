@@ -0,0 +1,175 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import socket
+import struct
+import threading
+from time import sleep
+
+import pytest
+
+from benchmarks.fake_servers import FakeDNS
+from pyCloudFlareUpdater.network import RecordSet
+from pyCloudFlareUpdater.network import dns_client
+from pyCloudFlareUpdater.network import dns_verifier
+from pyCloudFlareUpdater.network.dns_client import DNSError
+from pyCloudFlareUpdater.network.dns_client import build_query
+from pyCloudFlareUpdater.network.dns_client import parse_response
+from pyCloudFlareUpdater.network.dns_client import query
+from pyCloudFlareUpdater.network.dns_client import query_many
+from pyCloudFlareUpdater.network.dns_verifier import DNSVerifier
+from pyCloudFlareUpdater.network.dns_verifier import parse_server
+
+QUESTION = b"\x04home\x07example\x03com\x00"
+
+
+def response(answers, flags=0x8180):
+    message = struct.pack("!HHHHHH", 0x1234, flags, 1, len(answers), 0, 0) + QUESTION + struct.pack("!HH", 1, 1)
+    for record_type, data in answers:
+        # the owner name points back to the question
+        message += struct.pack("!HHHIH", 0xC00C, record_type, 1, 300, len(data)) + data
+    return message
+
+
+def test_query_is_encoded():
+    identifier, packet = build_query("home.example.com.", "AAAA", identifier=0x1234)
+    assert identifier == 0x1234
+    assert packet == struct.pack("!HHHHHH", 0x1234, 0x0100, 1, 0, 0, 0) + QUESTION + struct.pack("!HH", 28, 1)
+
+
+def test_addresses_are_parsed():
+    message = response([(1, bytes([93, 184, 216, 34])),
+                        (28, b"\x26\x06\x28\x00\x02\x20\x00\x01" + b"\x00" * 7 + b"\x01")])
+    assert parse_response(message) == [("A", "93.184.216.34", 300), ("AAAA", "2606:2800:220:1::1", 300)]
+
+
+def test_text_and_compressed_names_are_parsed():
+    # "ns1" followed by a pointer to "example.com" inside the question
+    name_server = b"\x03ns1\xc0\x11"
+    message = response([(16, b"\x05hello\x06 world"), (2, name_server)])
+    assert parse_response(message) == [("TXT", "hello world", 300), ("NS", "ns1.example.com", 300)]
+
+
+def test_unknown_types_are_skipped():
+    assert parse_response(response([(5, b"\xc0\x0c"), (1, bytes([93, 184, 216, 34]))])) == \
+        [("A", "93.184.216.34", 300)]
+
+
+def test_error_codes_are_raised():
+    with pytest.raises(DNSError):
+        parse_response(response([], flags=0x8183))
+
+
+def test_pointer_loops_are_malformed():
+    message = response([(2, b"\xc0\x00")])
+    # the answer data points to itself
+    offset = len(message) - 2
+    message = message[:offset] + struct.pack("!H", 0xC000 | offset)
+    with pytest.raises(DNSError):
+        parse_response(message)
+
+
+def test_truncated_answers_are_malformed():
+    message = response([(1, bytes([93, 184, 216, 34])), (28, b"\x26\x06" + b"\x00" * 14)])
+    for length in (8, len(message) - 20, len(message) - 4):
+        with pytest.raises(DNSError):
+            parse_response(message[:length])
+
+
+def test_servers_are_parsed():
+    assert parse_server("192.0.2.1") == ("192.0.2.1", 53)
+    assert parse_server("127.0.0.1:5353") == ("127.0.0.1", 5353)
+    assert parse_server("[2001:db8::1]:5353") == ("2001:db8::1", 5353)
+    assert parse_server("2001:db8::1") == ("2001:db8::1", 53)
+
+
+@pytest.fixture
+def dns(api):
+    zone = api.add_zone("example.com")
+    api.add_record(zone, "home.example.com", "93.184.216.34")
+    api.add_record(zone, "home.example.com", "2606:2800:220:1::1", "AAAA")
+    server = FakeDNS(api, delay=0.3).start()
+    yield server
+    server.stop()
+
+
+def test_query_asks_a_server(dns):
+    host, port = parse_server(dns.get_address())
+    assert query(host, "home.example.com", "A", timeout=2.0, port=port) == ["93.184.216.34"]
+    assert query(host, "home.example.com", "AAAA", timeout=2.0, port=port) == ["2606:2800:220:1::1"]
+    with pytest.raises(DNSError):
+        query(host, "missing.example.com", "A", timeout=2.0, port=port)
+
+
+def test_many_questions_share_a_socket(api, dns):
+    zone = api.get_zones()[0]["id"]
+    for index in range(200):
+        api.add_record(zone, "host{0}.example.com".format(index), "93.184.216.{0}".format(index % 250))
+    host, port = parse_server(dns.get_address())
+    questions = [("host{0}.example.com".format(index), "A") for index in range(200)] + [("missing.example.com", "A")]
+    answers = query_many(host, questions, timeout=2.0, port=port)
+    assert answers[("host7.example.com", "A")] == ["93.184.216.7"]
+    assert answers[("missing.example.com", "A")] == []
+    assert len(answers) == 201
+
+
+def test_verifier_confirms_visible_records(api, dns):
+    verifier = DNSVerifier(servers=[dns.get_address()], enabled=True)
+    question = ("example.com", "home.example.com", "A")
+    assert verifier.confirm([question], "93.184.216.34") == {question}
+    api.update_record(api.get_zones()[0]["id"], api.get_records(api.get_zones()[0]["id"])[0]["id"],
+                      {"content": "93.184.216.35"})
+    # still propagating
+    assert verifier.confirm([question], "93.184.216.35") == set()
+    sleep(0.4)
+    assert verifier.confirm([question], "93.184.216.35") == {question}
+    assert verifier.get_stats()["confirmed"] == 2
+
+
+@pytest.fixture
+def broken_dns():
+    """Answers every query with a truncated packet."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+
+    def serve():
+        while True:
+            try:
+                message, address = sock.recvfrom(512)
+                sock.sendto(message[:2] + response([(1, bytes([93, 184, 216, 34]))])[2:-3], address)
+            except OSError:
+                return
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+def test_malformed_answer_fails_the_query(broken_dns):
+    with pytest.raises(DNSError):
+        query("127.0.0.1", "home.example.com", "A", timeout=1.0, port=broken_dns)
+    assert query_many("127.0.0.1", [("home.example.com", "A")], timeout=1.0, port=broken_dns) == \
+        {("home.example.com", "A"): []}
+
+
+def test_malformed_name_server_answer_falls_back_to_the_api(api, broken_dns, monkeypatch):
+    # the name servers of the zone are looked up at the broken server
+    monkeypatch.setattr(dns_verifier, "query", lambda server, name, query_type, timeout:
+                        dns_client.query("127.0.0.1", name, query_type, timeout, port=broken_dns))
+    records = RecordSet(key="key", mail="mail@example.com", verifier=DNSVerifier(timeout=1.0, enabled=True))
+    for domain, name in api.populate(2, "1.1.1.1"):
+        records.add(domain, name)
+    assert records.update("93.184.216.34") == {"host0.zone0.example": 200, "host1.zone0.example": 200}
+    records.close()
@@ -0,0 +1,75 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+from urllib.error import HTTPError
+from urllib.request import Request
+from urllib.request import urlopen
+
+import pytest
+
+from benchmarks.fake_servers import FakeCloudFlare
+from benchmarks.fake_servers import FaultProfile
+
+
+def fetch(url, method="GET", data=None):
+    request = Request(url, method=method, data=json.dumps(data).encode("utf-8") if data is not None else None,
+                      headers={"Content-Type": "application/json"})
+    with urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_populate_spreads_records_across_zones(api):
+    names = api.populate(250, "93.184.216.34")
+    assert len(names) == 250
+    assert [zone["name"] for zone in api.get_zones()] == ["zone0.example", "zone1.example", "zone2.example"]
+    assert len(api.get_records("zone00002")) == 50
+
+
+def test_records_are_listed_by_pages(api):
+    api.populate(45, "93.184.216.34")
+    first = fetch(api.get_url() + "/zones/zone00000/dns_records?per_page=20")
+    last = fetch(api.get_url() + "/zones/zone00000/dns_records?per_page=20&page=3")
+    assert first["result_info"]["total_pages"] == 3
+    assert len(first["result"]) == 20
+    assert len(last["result"]) == 5
+    assert api.get_requests() == {"GET": 2}
+
+
+def test_batch_patches_every_record(api):
+    api.populate(2, "93.184.216.34")
+    patches = [{"id": record["id"], "content": "93.184.216.35"} for record in api.get_records("zone00000")]
+    result = fetch(api.get_url() + "/zones/zone00000/dns_records/batch", "POST", {"patches": patches})
+    assert [record["content"] for record in result["result"]["patches"]] == ["93.184.216.35"] * 2
+    assert {record["content"] for record in api.get_records("zone00000")} == {"93.184.216.35"}
+
+
+def test_unknown_record_is_not_found(api):
+    api.add_zone("example.com")
+    with pytest.raises(HTTPError) as error:
+        fetch(api.get_url() + "/zones/zone00000/dns_records/missing")
+    assert error.value.code == 404
+    assert json.loads(error.value.read())["errors"][0]["code"] == 81044
+
+
+def test_faults_are_simulated():
+    faulty = FakeCloudFlare(FaultProfile(throttle_rate=1.0, retry_after=3)).start()
+    try:
+        with pytest.raises(HTTPError) as error:
+            fetch(faulty.get_url() + "/zones")
+        assert error.value.code == 429
+        assert error.value.headers["Retry-After"] == "3"
+    finally:
+        faulty.stop()
@@ -0,0 +1,155 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from time import monotonic
+
+import pytest
+
+from pyCloudFlareUpdater.hooks import HookDispatcher
+from pyCloudFlareUpdater.hooks import ScriptHook
+from pyCloudFlareUpdater.hooks import WebhookHook
+from pyCloudFlareUpdater.hooks import dispatcher
+from pyCloudFlareUpdater.hooks.dispatcher import Hook
+from pyCloudFlareUpdater.network import get_session
+
+
+class _Receiver(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with self.server.lock:
+            self.server.events.append(json.loads(body))
+            code = self.server.codes.pop(0) if self.server.codes else 200
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def receiver():
+    """Webhook endpoint answering with the queued status codes, then with 200."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Receiver)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.events = []
+    server.codes = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = "http://127.0.0.1:{0}/hook".format(server.server_address[1])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    delays = []
+    monkeypatch.setattr(dispatcher, "sleep", delays.append)
+    return delays
+
+
+def test_webhook_is_posted_through_its_own_session(receiver):
+    hooks = HookDispatcher([WebhookHook(receiver.url, "ip_changed")])
+    before = get_session().get_stats()
+    hooks.emit("ip_changed", ip="93.184.216.34")
+    hooks.emit("records_updated", records=["home.example.com"])
+    hooks.close(timeout=5)
+    assert [(event["event"], event["ip"]) for event in receiver.events] == [("ip_changed", "93.184.216.34")]
+    assert hooks.get_stats() == {"succeeded": 1, "failed": 0, "dropped": 0, "pending": 0}
+    assert hooks.get_session().get_stats()["requests"] == 1
+    assert get_session().get_stats() == before
+
+
+def test_server_errors_are_retried_with_backoff(receiver, delays):
+    receiver.codes = [500, 503, 429]
+    hooks = HookDispatcher([WebhookHook(receiver.url)], retries=3)
+    hooks.emit("ip_changed", ip="93.184.216.34")
+    hooks.close(timeout=5)
+    assert len(receiver.events) == 4
+    assert delays == [1, 2, 4]
+    assert hooks.get_stats()["succeeded"] == 1
+
+
+def test_client_errors_are_not_retried(receiver, delays):
+    receiver.codes = [404]
+    hooks = HookDispatcher([WebhookHook(receiver.url)], retries=3)
+    hooks.emit("ip_changed", ip="93.184.216.34")
+    hooks.close(timeout=5)
+    assert len(receiver.events) == 1
+    assert delays == []
+    assert hooks.get_stats()["failed"] == 1
+
+
+def test_slow_script_is_killed(delays):
+    hook = ScriptHook([sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.5)
+    hooks = HookDispatcher([hook], retries=1)
+    start = monotonic()
+    hooks.emit("ip_changed", ip="93.184.216.34")
+    hooks.close(timeout=10)
+    assert monotonic() - start < 5
+    assert delays == [1]
+    assert hooks.get_stats()["failed"] == 1
+
+
+def test_script_gets_the_event(tmp_path):
+    output = tmp_path / "event.json"
+    script = "import os, sys; open(sys.argv[1], 'w').write(os.environ['CLOUDFLARE_DDNS_IP'] + sys.stdin.read())"
+    hooks = HookDispatcher([ScriptHook([sys.executable, "-c", script, str(output)])])
+    hooks.emit("ip_changed", ip="93.184.216.34")
+    hooks.close(timeout=10)
+    ip, payload = output.read_text().split("{", 1)
+    assert ip == "93.184.216.34"
+    assert json.loads("{" + payload)["event"] == "ip_changed"
+
+
+class _BlockingHook(Hook):
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.runs = 0
+
+    def get_name(self) -> str:
+        return "blocking"
+
+    def run(self, payload: dict, timeout, session):
+        self.runs += 1
+        self.started.set()
+        self.release.wait(5)
+
+
+def test_events_are_dropped_when_the_queue_is_full():
+    hook = _BlockingHook()
+    hooks = HookDispatcher([hook], workers=1, max_pending=2)
+    hooks.emit("ip_changed")
+    assert hook.started.wait(5)
+    # the worker is busy - two events wait, the rest are dropped without blocking
+    start = monotonic()
+    for _ in range(5):
+        hooks.emit("ip_changed")
+    assert monotonic() - start < 1
+    assert hooks.get_stats()["dropped"] == 3
+    hook.release.set()
+    hooks.close(timeout=5)
+    assert hook.runs == 3
+    assert hooks.get_stats() == {"succeeded": 3, "failed": 0, "dropped": 3, "pending": 0}
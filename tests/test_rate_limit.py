@@ -0,0 +1,123 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+from time import monotonic
+from time import sleep
+from urllib.error import HTTPError
+
+import pytest
+
+from benchmarks.fake_servers import FakeCloudFlare
+from benchmarks.fake_servers import FaultProfile
+from pyCloudFlareUpdater.network import TokenBucket
+from pyCloudFlareUpdater.network import get_circuit_breakers
+from pyCloudFlareUpdater.network import cloudflare_send
+from pyCloudFlareUpdater.network import configure_resilience
+from pyCloudFlareUpdater.network import network_utils
+from pyCloudFlareUpdater.network.circuit_breaker import CLOSED
+from pyCloudFlareUpdater.network.circuit_breaker import OPEN
+from pyCloudFlareUpdater.network.network_utils import CLOUDFLARE_ENDPOINT
+from pyCloudFlareUpdater.network.rate_limit import parse_retry_after
+
+
+def test_retry_after_is_parsed():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None, default=2.0) == 2.0
+    assert parse_retry_after("not a date", default=2.0) == 2.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_tokens_are_spent_and_refilled():
+    bucket = TokenBucket(limit=2, window=0.2)
+    start = monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    # the third one waits for a token (0.1 seconds)
+    assert 0.05 < monotonic() - start < 0.5
+    assert bucket.get_stats()["waits"] == 1
+
+
+def test_nothing_is_refilled_while_paused():
+    bucket = TokenBucket(limit=100, window=1.0)
+    bucket.pause(0.2)
+    start = monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    # a burst after the pause would be throttled again - the tokens come at the normal rate
+    assert monotonic() - start >= 0.2
+    assert bucket.get_stats()["tokens"] < 1
+    assert bucket.get_stats()["throttled"] == 1
+
+
+@pytest.fixture
+def throttled(monkeypatch):
+    api = FakeCloudFlare(FaultProfile(throttle_rate=1.0, retry_after=60)).start()
+    bucket = TokenBucket()
+    monkeypatch.setattr(network_utils, "get_rate_limiter", lambda: bucket)
+    yield api, bucket
+    api.stop()
+
+
+def test_throttled_request_is_not_retried_past_the_deadline(throttled):
+    api, bucket = throttled
+    configure_resilience(max_retries=3, deadline=10.0, threshold=0)
+    start = monotonic()
+    with pytest.raises(HTTPError) as error:
+        cloudflare_send({}, api.get_url() + "/zones")
+    assert error.value.code == 429
+    assert monotonic() - start < 5
+    assert api.get_requests() == {"GET": 1}
+    # the following requests still wait for the time CloudFlare asked for
+    assert bucket.get_stats()["throttled"] == 1
+
+
+@pytest.fixture
+def breaker():
+    configure_resilience(max_retries=0, deadline=10.0, threshold=2, cooldown=0.05)
+    breaker = get_circuit_breakers().get(CLOUDFLARE_ENDPOINT)
+    yield breaker
+    breaker.success()
+
+
+def test_throttled_request_does_not_reset_the_breaker(throttled, breaker):
+    api, _ = throttled
+    breaker.failure()
+    with pytest.raises(HTTPError):
+        cloudflare_send({}, api.get_url() + "/zones")
+    breaker.failure()
+    assert breaker.get_state() == OPEN
+
+
+def test_throttled_probe_does_not_close_the_breaker(throttled, breaker):
+    api, _ = throttled
+    breaker.failure()
+    breaker.failure()
+    sleep(0.06)
+    with pytest.raises(HTTPError):
+        cloudflare_send({}, api.get_url() + "/zones")
+    assert breaker.get_state() == OPEN
+
+
+def test_only_a_successful_answer_closes_the_breaker(api, breaker):
+    breaker.failure()
+    breaker.failure()
+    sleep(0.06)
+    with pytest.raises(HTTPError) as error:
+        cloudflare_send({}, api.get_url() + "/zones/unknown/dns_records/unknown")
+    assert error.value.code == 404
+    assert breaker.get_state() == OPEN
+    sleep(0.06)
+    cloudflare_send({}, api.get_url() + "/zones")
+    assert breaker.get_state() == CLOSED
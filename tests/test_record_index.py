@@ -0,0 +1,90 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from time import sleep
+
+import pytest
+
+from pyCloudFlareUpdater.network import Credentials
+from pyCloudFlareUpdater.network import RecordIndex
+from pyCloudFlareUpdater.network import record_index
+
+LATENCY = 0.2
+
+
+@pytest.fixture
+def listings(monkeypatch):
+    """Answers the listings of 4 zones, with 2 records each, after LATENCY seconds."""
+    requests = []
+    lock = threading.Lock()
+
+    def request(headers, url_extra_attrs, method="GET", data=None, max_retries=None):
+        with lock:
+            requests.append(url_extra_attrs.split("?")[0])
+        sleep(LATENCY)
+        if url_extra_attrs.startswith("zones?"):
+            result = [{"id": "zone{0}".format(index), "name": "zone{0}.example".format(index)} for index in range(4)]
+        else:
+            zone = url_extra_attrs.split("/")[1]
+            result = [{"id": "{0}-{1}".format(zone, index), "name": "host{0}.{1}.example".format(index, zone),
+                       "type": "A", "content": "93.184.216.34"} for index in range(2)]
+        return 200, {"success": True, "result": result, "result_info": {"page": 1, "total_pages": 1}}
+
+    monkeypatch.setattr(record_index, "cloudflare_request", request)
+    return requests
+
+
+@pytest.fixture
+def index():
+    return RecordIndex(Credentials(key="key", mail="mail@example.com"))
+
+
+def test_zones_are_listed_once(listings, index):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        zones = list(executor.map(index.get_zone_id, ["zone{0}.example".format(index) for index in range(4)]))
+    assert zones == ["zone0", "zone1", "zone2", "zone3"]
+    assert listings == ["zones"]
+
+
+def test_different_zones_are_loaded_at_the_same_time(listings, index):
+    start = monotonic()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        entries = list(executor.map(lambda zone: index.lookup(zone, "host0.{0}.example".format(zone)),
+                                    ["zone{0}".format(index) for index in range(4)]))
+    assert [entry["id"] for entry in entries] == ["zone0-0", "zone1-0", "zone2-0", "zone3-0"]
+    assert monotonic() - start < LATENCY * 3
+    assert len(index) == 8
+
+
+def test_a_zone_is_loaded_once_for_concurrent_lookups(listings, index):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        entries = list(executor.map(lambda name: index.lookup("zone0", name),
+                                    ["host0.zone0.example", "host1.zone0.example", "missing.zone0.example"]))
+    assert [entry["id"] if entry else None for entry in entries] == ["zone0-0", "zone0-1", None]
+    assert listings == ["zones/zone0/dns_records"]
+
+
+def test_index_is_readable_while_a_zone_is_loading(listings, index):
+    index.load_zone("zone0")
+    loading = threading.Thread(target=index.load_zone, args=("zone1",))
+    loading.start()
+    sleep(LATENCY / 4)
+    start = monotonic()
+    assert index.get_cached("zone0", "host0.zone0.example")["id"] == "zone0-0"
+    assert monotonic() - start < LATENCY / 2
+    loading.join()
@@ -0,0 +1,187 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+
+import pytest
+
+from pyCloudFlareUpdater.network import AsyncRecordSet
+from pyCloudFlareUpdater.network import RecordSet
+from pyCloudFlareUpdater.network import UpdatePlanner
+from pyCloudFlareUpdater.network import record_set
+from pyCloudFlareUpdater.network import update_planner
+from pyCloudFlareUpdater.network.network_utils import cloudflare_batch
+
+IP = "93.184.216.34"
+
+
+@pytest.fixture
+def records(api):
+    records = RecordSet(key="key", mail="mail@example.com")
+    for domain, name in api.populate(3, "1.1.1.1"):
+        records.add(domain, name)
+    records.add("zone0.example", "missing.zone0.example")
+    yield records
+    records.close()
+
+
+def get_contents(api):
+    return {record["name"]: record["content"] for record in api.get_records("zone00000")}
+
+
+def test_missing_record_does_not_stop_the_others(api, records):
+    results = records.update(IP)
+    assert isinstance(results.pop("missing.zone0.example"), ValueError)
+    assert results == {"host0.zone0.example": 200, "host1.zone0.example": 200, "host2.zone0.example": 200}
+    assert set(get_contents(api).values()) == {IP}
+
+
+def test_missing_record_fails_again_on_next_update(api, records):
+    records.update(IP)
+    results = records.update(IP)
+    assert list(results) == ["missing.zone0.example"]
+
+
+def test_missing_record_does_not_stop_the_others_with_asyncio(api, records):
+    async_records = AsyncRecordSet(records)
+    results = asyncio.run(async_records.update(IP))
+    assert isinstance(results.pop("missing.zone0.example"), ValueError)
+    assert sorted(results) == ["host0.zone0.example", "host1.zone0.example", "host2.zone0.example"]
+    assert set(get_contents(api).values()) == {IP}
+
+
+def test_asyncio_update_defers_flip_flops_like_the_threaded_one(api, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(update_planner, "monotonic", lambda: now[0])
+    requests = {}
+    for mode in ("threaded", "asyncio"):
+        api.reset()
+        records = RecordSet(key="key", mail="mail@example.com", planner=UpdatePlanner(debounce=60))
+        for domain, name in api.populate(3, "1.1.1.1"):
+            records.add(domain, name)
+        update = records.update if mode == "threaded" else lambda ip: asyncio.run(AsyncRecordSet(records).update(ip))
+        assert update(IP) == {}
+        assert records.has_deferred()
+        now[0] += 30
+        # the IP went back before settling - nothing is written
+        assert update("1.1.1.1") == {}
+        assert not records.has_deferred()
+        assert update(IP) == {}
+        now[0] += 60
+        assert sorted(update(IP)) == ["host0.zone0.example", "host1.zone0.example", "host2.zone0.example"]
+        assert set(get_contents(api).values()) == {IP}
+        requests[mode] = api.get_requests()
+        records.close()
+    assert requests["threaded"] == requests["asyncio"]
+
+
+def test_removed_record_settles_again_when_added(api, monkeypatch):
+    monkeypatch.setattr(update_planner, "monotonic", lambda: 100.0)
+    planner = UpdatePlanner(debounce=60)
+    records = RecordSet(key="key", mail="mail@example.com", planner=planner)
+    (domain, name), = api.populate(1, "1.1.1.1")
+    record = records.add(domain, name)
+    assert records.update(IP) == {}
+    records.remove(name)
+    # the IP seen before the removal is forgotten, so the record is not written at once
+    monkeypatch.setattr(update_planner, "monotonic", lambda: 200.0)
+    records.add(domain, name, latest_ip=record.latest_ip)
+    assert records.update(IP) == {}
+    records.close()
+
+
+def _batch_records(api, batch_size=100, count=5):
+    records = RecordSet(key="key", mail="mail@example.com", planner=UpdatePlanner(), batch_size=batch_size)
+    for domain, name in api.populate(count, "1.1.1.1"):
+        records.add(domain, name)
+    return records
+
+
+def test_records_of_a_zone_are_written_in_a_single_batch(api):
+    records = _batch_records(api)
+    assert records.update(IP) == {"host{0}.zone0.example".format(index): 200 for index in range(5)}
+    assert set(get_contents(api).values()) == {IP}
+    assert api.get_requests().get("POST") == 1
+    assert "PATCH" not in api.get_requests()
+    records.close()
+
+
+def test_a_failed_batch_is_written_one_by_one(api, monkeypatch):
+    def failing_batch(headers, zone, patches):
+        raise ConnectionResetError("Connection reset by peer")
+
+    records = _batch_records(api)
+    monkeypatch.setattr(record_set, "cloudflare_batch", failing_batch)
+    assert records.update(IP) == {"host{0}.zone0.example".format(index): 200 for index in range(5)}
+    assert set(get_contents(api).values()) == {IP}
+    assert api.get_requests()["PATCH"] == 5
+    # the batch endpoint is still used on the next update
+    batches = []
+    monkeypatch.setattr(record_set, "cloudflare_batch", lambda *args: batches.append(args) or cloudflare_batch(*args))
+    assert len(records.update("93.184.216.35")) == 5
+    assert len(batches) == 1
+    records.close()
+
+
+def test_an_unsupported_batch_endpoint_is_not_used_again(api, monkeypatch):
+    batches = []
+
+    def unrouted_batch(headers, zone, patches):
+        batches.append(zone)
+        # answered 404 like an API without the batch endpoint
+        return cloudflare_batch(headers, "unsupported", patches)
+
+    records = _batch_records(api)
+    monkeypatch.setattr(record_set, "cloudflare_batch", unrouted_batch)
+    assert records.update(IP) == {"host{0}.zone0.example".format(index): 200 for index in range(5)}
+    assert records.update("93.184.216.35") == {"host{0}.zone0.example".format(index): 200 for index in range(5)}
+    assert set(get_contents(api).values()) == {"93.184.216.35"}
+    assert batches == ["zone00000"]
+    records.close()
+
+
+def test_a_batch_size_of_one_writes_every_record_alone(api):
+    records = _batch_records(api, batch_size=1)
+    assert records.update(IP) == {"host{0}.zone0.example".format(index): 200 for index in range(5)}
+    assert set(get_contents(api).values()) == {IP}
+    assert "POST" not in api.get_requests()
+    assert api.get_requests()["PATCH"] == 5
+    records.close()
+
+
+def test_a_record_changed_at_cloudflare_is_corrected_after_its_zone_is_swept(api, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(record_set, "monotonic", lambda: now[0])
+    records = RecordSet(key="key", mail="mail@example.com", planner=UpdatePlanner(), sweep_interval=300)
+    for domain, name in api.populate(6, "1.1.1.1", records_per_zone=2):
+        records.add(domain, name)
+    assert len(records.update(IP)) == 6
+    assert records.sweep() == 0
+    # someone edits a record of the first and the last zone at the dashboard
+    api.update_record("zone00000", "zone00000-000000", {"content": "203.0.113.1"})
+    api.update_record("zone00002", "zone00002-000000", {"content": "203.0.113.2"})
+    assert records.update(IP) == {}
+
+    # a third of the sweep interval - a single zone is listed on each check, the oldest first
+    sweeps = []
+    for _ in range(3):
+        now[0] += 100
+        reads = api.get_requests()["GET"]
+        sweeps.append(records.sweep())
+        assert api.get_requests()["GET"] == reads + 1
+        sweeps.append(records.update(IP))
+    assert sweeps == [1, {"host0.zone0.example": 200}, 0, {}, 1, {"host4.zone2.example": 200}]
+    assert {record["content"] for zone in api.get_zones() for record in api.get_records(zone["id"])} == {IP}
+    records.close()
@@ -0,0 +1,105 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pyCloudFlareUpdater.network import ShardedRecordSet
+from pyCloudFlareUpdater.network.sharded_record_set import shard_of
+
+ADDRESSES = {4: ["93.184.216.{0}".format(last) for last in range(34, 74)],
+             6: ["2606:2800:220:1::{0}".format(last) for last in range(1, 41)]}
+
+
+@pytest.fixture
+def records(api):
+    domains = ["zone{0}.example".format(index) for index in range(4)]
+    # both shards get zones
+    assert {shard_of(domain, 2) for domain in domains} == {0, 1}
+    records = ShardedRecordSet(key="key", mail="mail@example.com", workers=2, log=logging.getLogger("tests"),
+                               timeout=30)
+    for domain in domains:
+        zone = api.add_zone(domain)
+        for name, record_type, content in (("v4." + domain, "A", "1.1.1.1"), ("v6." + domain, "AAAA", "::1")):
+            api.add_record(zone, name, content, record_type)
+            records.add(domain, name, record_type=record_type)
+    yield records
+    records.close()
+
+
+def test_concurrent_address_families_get_their_own_results(api, records):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for ipv4, ipv6 in zip(ADDRESSES[4], ADDRESSES[6]):
+            v4 = executor.submit(records.update, ipv4)
+            v6 = executor.submit(records.update, ipv6)
+            assert set(v4.result()) == {"v4.zone{0}.example".format(index) for index in range(4)}
+            assert set(v6.result()) == {"v6.zone{0}.example".format(index) for index in range(4)}
+            assert not any(isinstance(code, Exception) for code in list(v4.result().values()) +
+                           list(v6.result().values()))
+            contents = {record["name"]: record["content"]
+                        for zone in api.get_zones() for record in api.get_records(zone["id"])}
+            assert contents == dict({"v4.zone{0}.example".format(index): ipv4 for index in range(4)},
+                                    **{"v6.zone{0}.example".format(index): ipv6 for index in range(4)})
+
+
+def test_only_the_records_of_the_address_family_are_updated(api, records):
+    assert set(records.update(ADDRESSES[6][0])) == {"v6.zone{0}.example".format(index) for index in range(4)}
+    assert {record["content"] for zone in api.get_zones() for record in api.get_records(zone["id"])
+            if record["type"] == "A"} == {"1.1.1.1"}
+
+
+def _count(metric, labels):
+    return sum(values[2] if isinstance(values, tuple) else values
+               for key, values in metric.get_values().items() if key == labels)
+
+
+def test_the_metrics_of_the_workers_are_merged(api, records):
+    from pyCloudFlareUpdater.metrics import get_registry
+    from pyCloudFlareUpdater.metrics.instruments import API_REQUEST_DURATION
+    from pyCloudFlareUpdater.metrics.instruments import RECORD_UPDATES
+
+    def connections():
+        return get_registry().snapshot()["cloudflare_ddns_http_connections_total"].get(("created",), 0)
+
+    requests, updates, created = _count(API_REQUEST_DURATION, ("PATCH",)), _count(RECORD_UPDATES, ("A",)), connections()
+    records.update(ADDRESSES[4][0])
+    # the requests are sent by the workers, but seen at the registry of the supervisor - and counted once
+    assert _count(API_REQUEST_DURATION, ("PATCH",)) > requests
+    assert _count(RECORD_UPDATES, ("A",)) == updates + 4
+    # the runtime stats of the workers are added to those of the supervisor
+    assert connections() >= created + 2
+
+
+def test_a_hung_worker_fails_its_records_and_is_restarted(api, records):
+    from benchmarks.fake_servers import FaultProfile
+
+    records.update(ADDRESSES[4][0])
+    short = ShardedRecordSet(key="key", mail="mail@example.com", workers=2, log=logging.getLogger("tests"), timeout=1)
+    try:
+        for zone in api.get_zones():
+            for record in api.get_records(zone["id"]):
+                short.add(zone["name"], record["name"], record_type=record["type"])
+        api.set_faults(FaultProfile(latency=3.0))
+        try:
+            results = short.update(ADDRESSES[4][1])
+        finally:
+            api.set_faults(None)
+        assert len(results) == 4 and all(isinstance(code, RuntimeError) for code in results.values())
+        results = short.update(ADDRESSES[4][1])
+        assert len(results) == 4 and not any(isinstance(code, Exception) for code in results.values())
+    finally:
+        short.close()
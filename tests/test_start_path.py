@@ -0,0 +1,33 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import subprocess
+import sys
+
+# modules a "--check_only" run that finds the same IP never uses
+DAEMON_ONLY = ("pyCloudFlareUpdater.hooks.dispatcher",
+               "pyCloudFlareUpdater.logging_utils.async_logging",
+               "pyCloudFlareUpdater.network.record_set",
+               "pyCloudFlareUpdater.network.dns_verifier",
+               "pyCloudFlareUpdater.preferences.config_file",
+               "asyncio",
+               "multiprocessing",
+               "subprocess")
+
+
+def test_daemon_modules_are_not_imported_on_start():
+    loaded = subprocess.run([sys.executable, "-c", "import sys, pyCloudFlareUpdater.__main__; print(*sys.modules)"],
+                            capture_output=True, text=True, check=True).stdout.split()
+    assert [module for module in DAEMON_ONLY if module in loaded] == []
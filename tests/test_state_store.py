@@ -0,0 +1,152 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import pickle
+from base64 import b64encode
+
+import pytest
+
+from pyCloudFlareUpdater.preferences import UserPreferences
+from pyCloudFlareUpdater.preferences.state_store import is_state_store
+
+
+def _preferences(filename) -> UserPreferences:
+    preferences = UserPreferences()
+    preferences.set_preferences_file(str(filename))
+    return preferences
+
+
+def _write_pickle(filename):
+    # the format written by the releases before the state store
+    preferences = {"domain": "example.com",
+                   "name": "home.example.com",
+                   "time": 5,
+                   "key": b64encode(b"api-key"),
+                   "mail": b64encode(b"mail@example.com"),
+                   "proxy": False,
+                   "latest_ip": "93.184.216.34",
+                   "latest_ipv6": "2606:2800:220:1::1",
+                   "ipv6": True,
+                   "pid": "/var/run/cloudflare.pid",
+                   "log": "/var/log/cloudflare.log",
+                   "records": [{"domain": "example.org", "name": "www.example.org", "type": "A", "proxied": True,
+                                "latest_ip": "93.184.216.35"},
+                               {"domain": "example.org", "name": "old.example.org", "proxied": False,
+                                "latest_ip": "93.184.216.36"}]}
+    with open(filename, "wb") as fpreferences:
+        pickle.dump(preferences, fpreferences, pickle.HIGHEST_PROTOCOL)
+
+
+def test_every_preference_is_stored_and_loaded(tmp_path):
+    filename = tmp_path / "cloudflare.user.preferences"
+    preferences = _preferences(filename)
+    preferences.set_domain("example.com")
+    preferences.set_name("home.example.com")
+    preferences.set_time(5)
+    preferences.set_key("api-key")
+    preferences.set_mail("mail@example.com")
+    preferences.set_token("global-token")
+    preferences.set_zone_tokens({"example.org": "zone-token"})
+    preferences.record_behind_proxy(False)
+    preferences.set_latest_ip("93.184.216.34")
+    preferences.set_latest_ipv6("2606:2800:220:1::1")
+    preferences.enable_ipv6(True)
+    preferences.set_pid_file("/var/run/cloudflare.pid")
+    preferences.set_log_file("/var/log/cloudflare.log")
+    preferences.add_record("example.org", "www.example.org", proxied=True)
+    preferences.add_record("example.org", "www.example.org", record_type="AAAA")
+    preferences.save_preferences()
+    # once stored, the IPs are written on their own
+    preferences.set_record_latest_ip("www.example.org", "93.184.216.35")
+    preferences.set_latest_ip("93.184.216.36")
+    preferences.close()
+    assert is_state_store(str(filename))
+
+    loaded = _preferences(filename)
+    loaded.load_preferences()
+    try:
+        assert (loaded.get_domain(), loaded.get_name(), loaded.get_time()) == ("example.com", "home.example.com", 5)
+        assert (loaded.get_key(), loaded.get_mail()) == ("api-key", "mail@example.com")
+        assert loaded.get_token() == "global-token"
+        assert loaded.get_zone_tokens() == {"example.org": "zone-token"}
+        assert loaded.is_record_behind_proxy() is False
+        assert (loaded.get_latest_ip(), loaded.get_latest_ipv6()) == ("93.184.216.36", "2606:2800:220:1::1")
+        assert loaded.is_ipv6_enabled() is True
+        assert (loaded.get_pid_file(), loaded.get_log_file()) == ("/var/run/cloudflare.pid", "/var/log/cloudflare.log")
+        records = {(record["name"], record["type"]): record for record in loaded.get_records()}
+        assert records[("www.example.org", "A")] == {"name": "www.example.org", "type": "A", "domain": "example.org",
+                                                     "proxied": True, "latest_ip": "93.184.216.35"}
+        assert records[("www.example.org", "AAAA")]["latest_ip"] == "::"
+        assert records[("home.example.com", "A")]["latest_ip"] == "93.184.216.36"
+        assert records[("home.example.com", "AAAA")]["latest_ip"] == "2606:2800:220:1::1"
+    finally:
+        loaded.close()
+
+
+def test_a_removed_record_is_not_loaded_again(tmp_path):
+    filename = tmp_path / "cloudflare.user.preferences"
+    preferences = _preferences(filename)
+    preferences.set_key("api-key")
+    preferences.set_mail("mail@example.com")
+    preferences.add_record("example.org", "www.example.org")
+    preferences.add_record("example.org", "api.example.org")
+    preferences.save_preferences()
+    preferences.remove_record("api.example.org")
+    preferences.close()
+
+    loaded = _preferences(filename)
+    loaded.load_preferences()
+    loaded.close()
+    assert [record["name"] for record in loaded.get_records()] == ["www.example.org"]
+
+
+def test_a_pickle_file_is_migrated(tmp_path):
+    filename = tmp_path / "cloudflare.user.preferences"
+    _write_pickle(filename)
+    preferences = _preferences(filename)
+    preferences.load_preferences()
+    preferences.close()
+
+    assert is_state_store(str(filename))
+    assert not (tmp_path / "cloudflare.user.preferences.migration").exists()
+    assert (preferences.get_key(), preferences.get_mail()) == ("api-key", "mail@example.com")
+    assert (preferences.get_latest_ip(), preferences.get_latest_ipv6()) == ("93.184.216.34", "2606:2800:220:1::1")
+    assert preferences.is_ipv6_enabled() is True and preferences.is_record_behind_proxy() is False
+    assert preferences.get_token() is None and preferences.get_zone_tokens() == {}
+    records = {(record["name"], record["type"]): record for record in preferences.get_records()}
+    assert records[("www.example.org", "A")]["latest_ip"] == "93.184.216.35"
+    assert records[("www.example.org", "A")]["proxied"] is True
+    # records written before the record types default to A
+    assert records[("old.example.org", "A")]["latest_ip"] == "93.184.216.36"
+    assert records[("home.example.com", "A")]["latest_ip"] == "93.184.216.34"
+
+
+def test_a_migrated_file_is_not_migrated_again(tmp_path, monkeypatch):
+    filename = tmp_path / "cloudflare.user.preferences"
+    _write_pickle(filename)
+    preferences = _preferences(filename)
+    preferences.load_preferences()
+    preferences.set_record_latest_ip("home.example.com", "93.184.216.40")
+    preferences.close()
+
+    def migrate(self):
+        pytest.fail("The state store was migrated again")
+
+    monkeypatch.setattr(UserPreferences, "_migrate_pickle", migrate)
+    loaded = _preferences(filename)
+    loaded.load_preferences()
+    loaded.close()
+    assert loaded.get_latest_ip() == "93.184.216.40"
+    assert len(loaded.get_records()) == 4
@@ -0,0 +1,107 @@
+#                             pyCloudFlareUpdater
+#                  Copyright (C) 2019 - Javinator9889
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#                   (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#        MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#               GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+import pytest
+
+from pyCloudFlareUpdater.network import update_planner
+from pyCloudFlareUpdater.network.record_set import Record
+from pyCloudFlareUpdater.network.update_planner import DEFERRED
+from pyCloudFlareUpdater.network.update_planner import UpdatePlanner
+
+
+def _record(latest_ip="1.1.1.1", **kwargs):
+    return Record("example.com", "home.example.com", latest_ip=latest_ip, **kwargs)
+
+
+def test_diff_returns_only_changed_fields():
+    record = _record(ttl=600)
+    assert UpdatePlanner.diff(record, "1.1.1.1", {"content": "1.1.1.1", "ttl": 600, "proxied": False}) == {}
+    assert UpdatePlanner.diff(record, "2.2.2.2", {"content": "1.1.1.1", "ttl": 600, "proxied": False}) == \
+        {"content": "2.2.2.2"}
+    assert UpdatePlanner.diff(record, "1.1.1.1", {"content": "1.1.1.1", "ttl": 120, "proxied": False}) == \
+        {"ttl": 600}
+
+
+def test_diff_ignores_ttl_of_proxied_records():
+    record = _record(proxied=True, ttl=600)
+    assert UpdatePlanner.diff(record, "1.1.1.1", {"content": "1.1.1.1", "ttl": 1, "proxied": True}) == {}
+
+
+def test_diff_without_current_state_uses_latest_ip():
+    record = _record()
+    assert UpdatePlanner.diff(record, "1.1.1.1") == {}
+    assert UpdatePlanner.diff(record, "2.2.2.2")["content"] == "2.2.2.2"
+    record.pending = True
+    assert UpdatePlanner.diff(record, "1.1.1.1")["content"] == "1.1.1.1"
+
+
+def test_noop_write_is_suppressed():
+    planner = UpdatePlanner()
+    assert planner.plan(_record(), "1.1.1.1") is None
+    assert planner.get_stats() == {"planned": 0, "suppressed": 1, "deferred": 0}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(update_planner, "monotonic", lambda: now[0])
+    return now
+
+
+def test_new_ip_is_written_once_settled(clock):
+    planner = UpdatePlanner(debounce=30)
+    record = _record()
+    assert planner.plan(record, "2.2.2.2") == DEFERRED
+    clock[0] += 10
+    assert planner.plan(record, "2.2.2.2") == DEFERRED
+    # other records are not affected
+    assert planner.plan(_record(record_type="AAAA", latest_ip="::1"), "::2") == DEFERRED
+    clock[0] += 20
+    assert planner.plan(record, "2.2.2.2") == {"content": "2.2.2.2", "ttl": 600, "proxied": False}
+    assert planner.get_stats() == {"planned": 1, "suppressed": 0, "deferred": 3}
+
+
+def test_flip_flop_is_never_written(clock):
+    planner = UpdatePlanner(debounce=30)
+    record = _record()
+    assert planner.plan(record, "2.2.2.2") == DEFERRED
+    clock[0] += 20
+    # back to the IP at CloudFlare
+    assert planner.plan(record, "1.1.1.1") is None
+    clock[0] += 20
+    # a new change settles from scratch
+    assert planner.plan(record, "2.2.2.2") == DEFERRED
+    clock[0] += 20
+    assert planner.plan(record, "3.3.3.3") == DEFERRED
+    clock[0] += 20
+    assert planner.plan(record, "3.3.3.3") == DEFERRED
+    clock[0] += 10
+    assert planner.plan(record, "3.3.3.3")["content"] == "3.3.3.3"
+
+
+def test_settings_changes_are_not_deferred(clock):
+    planner = UpdatePlanner(debounce=30)
+    record = _record(ttl=120)
+    record.pending = True
+    assert planner.plan(record, "1.1.1.1", {"content": "1.1.1.1", "ttl": 600, "proxied": False}) == {"ttl": 120}
+
+
+def test_forget_restarts_the_settling(clock):
+    planner = UpdatePlanner(debounce=30)
+    record = _record()
+    assert planner.plan(record, "2.2.2.2") == DEFERRED
+    clock[0] += 30
+    planner.forget(record)
+    assert planner.plan(record, "2.2.2.2") == DEFERRED